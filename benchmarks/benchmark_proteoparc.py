@@ -0,0 +1,454 @@
+# Global imports
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import contextlib
+import numpy as np
+import pandas as pd
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+# Local imports, the pipeline steps are imported from the scripts folder
+sys.path.insert(0, f"{os.path.dirname(os.path.dirname(os.path.realpath(__file__)))}/scripts")
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script measures how the ProteoParc steps scale with the size of the database. It
+generates synthetic UniParc-like JSON records (and the multi-fasta database and SQLite
+metadata derived from them) from 10^3 to 10^6 records, and times the following steps:
+
+1. json_to_fasta; The conversion of the JSON records into fasta records (uniparc_download.py).
+2. remove_redundant_records; The duplicate and substring removal (remove_redundant_records.py).
+3. split_fasta_per_gene; The split of the database per gene name (align_database_per_gene.py).
+4. metadata_proteoparc; The whole metadata step (metadata_proteoparc.py).
+
+The synthetic records imitate real databases: log-normal sequence lengths, the amino acid
+frequencies of UniProt, runs of X residues, exact duplicates and fragments of other records
+of the same gene, records without gene name, and genes, species and repositories following
+skewed (Zipf-like) frequencies, with some records associated with several species.
+
+Each step runs in a new process, so its peak memory (RSS) can be measured. The throughput
+(records per second) and peak memory are compared with a stored baseline, and the steps
+performing worse than the tolerance are flagged as regressions.
+"""
+
+BENCHMARK_NAMES = ["json_to_fasta", "remove_redundant_records", "split_fasta_per_gene", "metadata_proteoparc"]
+
+# Amino acid frequencies in UniProtKB/Swiss-Prot
+AMINO_ACID_FREQUENCIES = {"A": 8.25, "R": 5.53, "N": 4.06, "D": 5.45, "C": 1.37, "Q": 3.93, "E": 6.75, "G": 7.07, "H": 2.27, "I": 5.96,
+                          "L": 9.66, "K": 5.84, "M": 2.42, "F": 3.86, "P": 4.70, "S": 6.56, "T": 5.34, "W": 1.08, "Y": 2.92, "V": 6.87}
+
+REPOSITORY_FREQUENCIES = {"UniProtKB/TrEMBL": 50, "EMBL": 25, "RefSeq": 12, "UniProtKB/Swiss-Prot": 6, "PRF": 3, "EPO": 2, "JPO": 1, "KIPO": 1}
+
+SYNTHETIC_TAX_ID = 1000000 # The TaxID of the synthetic clade, its species are numbered after it
+MAX_REPEATS = 5 # Maximum number of times each step is timed
+MIN_TOTAL_TIME_S = 1.0 # The steps are repeated until this time is reached (or MAX_REPEATS)
+
+def main():
+
+    size_list, work_folder_path, baseline_path, do_update_baseline, tolerance, max_redundancy_records, seed = parser()
+
+    if not os.path.exists(work_folder_path):
+        os.makedirs(work_folder_path)
+
+    # Run the benchmarks per each database size
+    result_dic_list = []
+    for record_count in size_list:
+        dataset_folder_path = f"{work_folder_path}/synthetic_{record_count}"
+
+        print(f"# Generating {record_count} synthetic records")
+        generate_synthetic_dataset(record_count, dataset_folder_path, seed)
+
+        for benchmark_name in BENCHMARK_NAMES:
+            if benchmark_name == "remove_redundant_records" and record_count > max_redundancy_records:
+                print(f"   {benchmark_name} skipped (more than {max_redundancy_records} records)")
+                continue
+
+            result_dic = run_benchmark_process(benchmark_name, dataset_folder_path, record_count)
+            result_dic_list.append(result_dic)
+            print(f"   {benchmark_name}: {result_dic['wall_time_s']:.3f} s, {result_dic['records_per_s']:.0f} records/s, {result_dic['peak_rss_mb']:.1f} MB")
+
+        shutil.rmtree(dataset_folder_path)
+
+    if not os.listdir(work_folder_path):
+        os.rmdir(work_folder_path)
+
+    result_df = pd.DataFrame(result_dic_list)
+
+    # Compare the results with the baseline, or store them as the new baseline
+    if do_update_baseline:
+        write_baseline_json(result_df, baseline_path)
+        print(f"# Baseline written in '{baseline_path}'")
+        return
+
+    if not os.path.exists(baseline_path):
+        print(f"WARNING: No baseline found in '{baseline_path}'. Please run with --update-baseline to store one.")
+        print(result_df.to_string(index=False))
+        return
+
+    comparison_df = compare_with_baseline(result_df, baseline_path, tolerance)
+    print(comparison_df.to_string(index=False))
+
+    regression_count = comparison_df["Regression"].astype(bool).sum()
+    if regression_count:
+        print(f"WARNING: {regression_count} regressions against the baseline (tolerance {tolerance:.0%})")
+        exit(1)
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - size_list (list); A list with the number of records of each synthetic database.
+    - work_folder_path (string); The path to a folder to write the synthetic databases.
+    - baseline_path (string); The path to the baseline JSON file.
+    - do_update_baseline (boolean); A boolean indicator to indicate if the results are stored
+      as the new baseline, instead of being compared with it.
+    - tolerance (float); The fraction of throughput loss (or memory increase) allowed before
+      flagging a regression.
+    - max_redundancy_records (integer); The maximum number of records to benchmark the
+      redundancy removal, whose time grows quadratically.
+    - seed (integer); The seed of the random generator.
+    """
+    parser = argparse.ArgumentParser(description="A script to benchmark the ProteoParc steps with synthetic databases")
+    parser.add_argument("--sizes", dest="sizes", type=int, help="The number of records of each synthetic database, from 1000 to 1000000 (default: 1000 10000)", required=False, default=[1000, 10000], nargs="+")
+    parser.add_argument("--work-path", dest="work_path", type=str, help="The folder to write the synthetic databases (default: ./benchmark_work)", required=False, default=["./benchmark_work"], nargs=1)
+    parser.add_argument("--baseline", dest="baseline", type=str, help="The path to the baseline JSON file (default: benchmarks/benchmark_baseline.json)", required=False, default=[f"{os.path.dirname(os.path.realpath(__file__))}/benchmark_baseline.json"], nargs=1)
+    parser.add_argument("--update-baseline", dest="update_baseline", action=argparse.BooleanOptionalAction, help="Store the results as the new baseline (default: False; --no-update-baseline)", default=False, required=False)
+    parser.add_argument("--tolerance", dest="tolerance", type=float, help="The throughput loss or memory increase allowed before flagging a regression (default: 0.3)", required=False, default=[0.3], nargs=1)
+    parser.add_argument("--max-redundancy-records", dest="max_redundancy_records", type=int, help="The maximum number of records to benchmark the redundancy removal (default: 20000)", required=False, default=[20000], nargs=1)
+    parser.add_argument("--seed", dest="seed", type=int, help="The seed of the random generator (default: 1)", required=False, default=[1], nargs=1)
+
+    args = parser.parse_args()
+
+    size_list = args.sizes
+    if any(record_count < 1000 or record_count > 1000000 for record_count in size_list):
+        print("ERROR: The number of records must be between 1000 and 1000000")
+        exit(0)
+
+    work_folder_path = os.path.realpath(args.work_path[0])
+    baseline_path = os.path.realpath(args.baseline[0])
+    do_update_baseline = args.update_baseline
+    tolerance = args.tolerance[0]
+    max_redundancy_records = args.max_redundancy_records[0]
+    seed = args.seed[0]
+
+    return size_list, work_folder_path, baseline_path, do_update_baseline, tolerance, max_redundancy_records, seed
+
+def zipf_weights(category_count, exponent=1.1):
+    """
+    This function generates the frequencies of a number of categories following a Zipf-like
+    distribution, so a few categories are very frequent and most of them are rare.
+
+    #INPUT
+    - category_count (integer); The number of categories.
+    - exponent (float); The exponent of the distribution.
+    #OUTPUT
+    - weights (np.ndarray); The normalized frequency of each category.
+    """
+    weights = 1 / np.arange(1, category_count + 1) ** exponent
+
+    return weights / weights.sum()
+
+def generate_synthetic_sequences(record_count, gene_index_array, rng, x_rate=0.03, duplicate_rate=0.05, fragment_rate=0.05):
+    """
+    This function generates synthetic protein sequences, with log-normal lengths, UniProt
+    amino acid frequencies and runs of X residues. Some sequences are replaced by an exact
+    copy, or a fragment, of a previous sequence of the same gene.
+
+    #INPUT
+    - record_count (integer); The number of sequences.
+    - gene_index_array (np.ndarray); The gene index of each sequence.
+    - rng (np.random.Generator); The random generator.
+    - x_rate (float); The fraction of sequences with a run of X residues.
+    - duplicate_rate (float); The fraction of sequences that duplicate a previous one.
+    - fragment_rate (float); The fraction of sequences that are a fragment of a previous one.
+    #OUTPUT
+    - sequence_list (list); A list with the amino acid sequence of each record.
+    """
+    # Draw all the residues at once, and split them by the length of each sequence
+    length_array = np.clip(rng.lognormal(np.log(350), 0.7, record_count), 20, 5000).astype(np.int64)
+    amino_acid_array = np.frombuffer("".join(AMINO_ACID_FREQUENCIES).encode(), dtype=np.uint8)
+    frequency_array = np.array(list(AMINO_ACID_FREQUENCIES.values()))
+    residue_array = rng.choice(amino_acid_array, size=length_array.sum(), p=frequency_array / frequency_array.sum())
+
+    # Add the runs of X residues
+    end_array = np.cumsum(length_array)
+    start_array = end_array - length_array
+    for record_index in np.flatnonzero(rng.random(record_count) < x_rate):
+        run_length = min(int(rng.integers(1, 31)), int(length_array[record_index]))
+        run_start = start_array[record_index] + int(rng.integers(0, length_array[record_index] - run_length + 1))
+        residue_array[run_start:run_start + run_length] = ord("X")
+
+    residue_bytes = residue_array.tobytes()
+    sequence_list = [residue_bytes[start:end].decode() for start, end in zip(start_array, end_array)]
+
+    # Replace some sequences by duplicates or fragments of a previous sequence of the same gene
+    gene_last_index_dic = {}
+    redundancy_draw_array = rng.random(record_count)
+    for record_index in range(record_count):
+        gene_index = gene_index_array[record_index]
+        previous_index = gene_last_index_dic.get(gene_index)
+        gene_last_index_dic[gene_index] = record_index
+
+        if previous_index is None:
+            continue
+
+        previous_sequence = sequence_list[previous_index]
+        if redundancy_draw_array[record_index] < duplicate_rate:
+            sequence_list[record_index] = previous_sequence
+        elif redundancy_draw_array[record_index] < duplicate_rate + fragment_rate:
+            fragment_length = max(10, int(len(previous_sequence) * rng.uniform(0.3, 0.9)))
+            fragment_start = int(rng.integers(0, len(previous_sequence) - fragment_length + 1))
+            sequence_list[record_index] = previous_sequence[fragment_start:fragment_start + fragment_length]
+
+    return sequence_list
+
+def generate_synthetic_dataset(record_count, dataset_folder_path, seed=1, no_gene_rate=0.1):
+    """
+    This function generates a synthetic dataset with UniParc-like JSON records, and the
+    multi-fasta database and SQLite metadata file that uniparc_download.py would write from
+    them.
+
+    #INPUT
+    - record_count (integer); The number of records.
+    - dataset_folder_path (string); The path to a folder to write the dataset.
+    - seed (integer); The seed of the random generator.
+    - no_gene_rate (float); The fraction of records without gene name.
+    #WRITE OUTPUT
+    - records.jsonl; A file with a UniParc-like JSON record per line.
+    - taxid_descendents.json; A JSON file with the TaxID of every synthetic species.
+    - synthetic_database.fasta; A multi-fasta database, as written by uniparc_download.py.
+    - .records_metadata.sqlite; The SQLite file with the extra metadata of each record.
+    """
+    from Bio import SeqIO
+    from uniparc_download import create_metadata_database, json_to_fasta
+
+    if os.path.exists(dataset_folder_path):
+        shutil.rmtree(dataset_folder_path)
+    os.makedirs(dataset_folder_path)
+
+    rng = np.random.default_rng(seed)
+
+    # Draw the gene, species and repositories of each record from skewed distributions
+    gene_count = max(10, record_count // 100)
+    species_count = max(5, record_count // 200)
+    gene_index_array = rng.choice(gene_count, size=record_count, p=zipf_weights(gene_count))
+    repository_name_list = list(REPOSITORY_FREQUENCIES)
+    repository_weights = np.array(list(REPOSITORY_FREQUENCIES.values())) / sum(REPOSITORY_FREQUENCIES.values())
+    species_weights = zipf_weights(species_count)
+
+    # Most records are associated with one species, a few with several ones
+    cross_reference_count_array = np.minimum(rng.geometric(0.6, size=record_count), 5)
+    species_index_array = rng.choice(species_count, size=cross_reference_count_array.sum(), p=species_weights)
+    repository_index_array = rng.choice(len(repository_name_list), size=cross_reference_count_array.sum(), p=repository_weights)
+    has_gene_array = rng.random(record_count) >= no_gene_rate
+
+    sequence_list = generate_synthetic_sequences(record_count, gene_index_array, rng)
+
+    # Write the JSON records
+    cross_reference_index = 0
+    with open(f"{dataset_folder_path}/records.jsonl", "wt") as json_file:
+        for record_index in range(record_count):
+            gene_name = f"SYN{gene_index_array[record_index]:05d}"
+
+            cross_reference_list = []
+            for _ in range(cross_reference_count_array[record_index]):
+                species_index = int(species_index_array[cross_reference_index])
+                cross_reference = {"database": repository_name_list[repository_index_array[cross_reference_index]],
+                                   "lastUpdated": "2024-01-01", "versionI": 1,
+                                   "proteinName": f"Synthetic protein {gene_name}",
+                                   "organism": {"scientificName": f"Synthetica species{species_index}", "taxonId": SYNTHETIC_TAX_ID + species_index + 1}}
+                if has_gene_array[record_index]:
+                    cross_reference["geneName"] = gene_name
+                cross_reference_list.append(cross_reference)
+                cross_reference_index += 1
+
+            json_record = {"uniParcId": f"UPI{record_index:010X}", "uniParcCrossReferences": cross_reference_list, "sequence": {"value": sequence_list[record_index]}}
+            json_file.write(json.dumps(json_record) + "\n")
+
+    tax_id_descendent_list = [SYNTHETIC_TAX_ID + species_index + 1 for species_index in range(species_count)] + [SYNTHETIC_TAX_ID]
+    with open(f"{dataset_folder_path}/taxid_descendents.json", "wt") as taxid_file:
+        json.dump(tax_id_descendent_list, taxid_file)
+
+    # Derive the multi-fasta database and the SQLite metadata with the download step functions
+    json_record_list = read_json_records(f"{dataset_folder_path}/records.jsonl")
+    metadata_connection = create_metadata_database(f"{dataset_folder_path}/.records_metadata.sqlite")
+    records_fasta_list = json_to_fasta(json_record_list, tax_id_descendent_list, metadata_connection)
+    metadata_connection.close()
+
+    with open(f"{dataset_folder_path}/synthetic_database.fasta", "w") as output_fasta_file:
+        SeqIO.write(records_fasta_list, output_fasta_file, "fasta")
+
+def read_json_records(json_path):
+    """
+    This function reads a file with a JSON record per line.
+
+    #INPUT
+    - json_path (string); The path to the JSON lines file.
+    #OUTPUT
+    - json_record_list (list); A list with all the JSON records.
+    """
+    with open(json_path, "rt") as json_file:
+        return [json.loads(line) for line in json_file]
+
+def run_benchmark_process(benchmark_name, dataset_folder_path, record_count):
+    """
+    This function runs a benchmark in a new Python process, so its peak memory is not
+    affected by the previous benchmarks.
+
+    #INPUT
+    - benchmark_name (string); The name of the step to benchmark.
+    - dataset_folder_path (string); The path to the folder with the synthetic dataset.
+    - record_count (integer); The number of records of the dataset.
+    #OUTPUT
+    - result_dic (dictionary); A dictionary with the benchmark, the number of records, the
+      wall time, the throughput (records per second) and the peak memory (MB).
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        wall_time_s, peak_rss_mb = executor.submit(run_benchmark, benchmark_name, dataset_folder_path).result()
+
+    return {"Benchmark": benchmark_name, "Records": record_count, "wall_time_s": wall_time_s,
+            "records_per_s": record_count / wall_time_s, "peak_rss_mb": peak_rss_mb}
+
+def run_benchmark(benchmark_name, dataset_folder_path):
+    """
+    This function times a step of the pipeline with a synthetic dataset. The inputs are read
+    before starting the timer, and the printed output of the step is silenced. Fast steps
+    are repeated, and the best time is kept.
+
+    #INPUT
+    - benchmark_name (string); The name of the step to benchmark.
+    - dataset_folder_path (string); The path to the folder with the synthetic dataset.
+    #OUTPUT
+    - wall_time_s (float); The best elapsed time of the step.
+    - peak_rss_mb (float); The peak memory (resident set size) of the process.
+    """
+    database_path = f"{dataset_folder_path}/synthetic_database.fasta"
+
+    if benchmark_name == "json_to_fasta":
+        from uniparc_download import create_metadata_database, json_to_fasta
+        json_record_list = read_json_records(f"{dataset_folder_path}/records.jsonl")
+        with open(f"{dataset_folder_path}/taxid_descendents.json", "rt") as taxid_file:
+            tax_id_descendent_list = json.load(taxid_file)
+        metadata_connection = create_metadata_database(f"{dataset_folder_path}/benchmark_metadata.sqlite")
+        benchmark_function = lambda: json_to_fasta(json_record_list, tax_id_descendent_list, metadata_connection)
+
+    elif benchmark_name == "remove_redundant_records":
+        from sequence_store import build_sequence_store
+        from remove_redundant_records import filter_redundant_records
+        sequence_store = build_sequence_store(database_path)
+        benchmark_function = lambda: filter_redundant_records(sequence_store)
+
+    elif benchmark_name == "split_fasta_per_gene":
+        from align_database_per_gene import split_fasta_per_gene
+        benchmark_function = lambda: split_fasta_per_gene(database_path)
+
+    elif benchmark_name == "metadata_proteoparc":
+        from metadata_proteoparc import produce_metadata
+        benchmark_function = lambda: produce_metadata(database_path, f"{dataset_folder_path}/metadata", SYNTHETIC_TAX_ID)
+
+    # Repeat the fast steps to reduce the noise, keeping the best time
+    time_list = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        while len(time_list) < MAX_REPEATS and sum(time_list) < MIN_TOTAL_TIME_S:
+            start_time = time.perf_counter()
+            benchmark_function()
+            time_list.append(time.perf_counter() - start_time)
+    wall_time_s = min(time_list)
+
+    return wall_time_s, read_peak_rss_mb()
+
+def read_peak_rss_mb():
+    """
+    This function reads the peak memory (resident set size) of the process. In Linux it is
+    read from /proc, as ru_maxrss is inherited from the parent process through fork and exec,
+    so it would also include the memory employed to generate the synthetic dataset.
+
+    #OUTPUT
+    - peak_rss_mb (float); The peak memory of the process. If it can not be measured
+      (Windows), the variable is assigned as NaN.
+    """
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", "rt") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024 # Kilobytes
+
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != "darwin" else 1024 ** 2)
+    except ImportError:
+        return float("nan")
+
+def write_baseline_json(result_df, baseline_path):
+    """
+    This function stores the benchmark results as the baseline for the next runs.
+
+    #INPUT
+    - result_df (pd.DataFrame); A dataframe with the result of each benchmark and size.
+    - baseline_path (string); The path to the baseline JSON file.
+    #WRITE OUTPUT
+    - {baseline_path}; A JSON file with the throughput and peak memory of each benchmark
+      and size, and a description of the machine where they were measured.
+    """
+    baseline_dic = {"machine": {"platform": platform.platform(), "python": platform.python_version(), "processor": platform.processor() or platform.machine()},
+                    "results": {}}
+
+    for result in result_df.itertuples(index=False):
+        baseline_dic["results"].setdefault(result.Benchmark, {})[str(result.Records)] = {
+            "records_per_s": round(result.records_per_s, 1), "peak_rss_mb": round(result.peak_rss_mb, 1)}
+
+    with open(baseline_path, "wt") as baseline_file:
+        json.dump(baseline_dic, baseline_file, indent=2)
+
+def compare_with_baseline(result_df, baseline_path, tolerance):
+    """
+    This function compares the benchmark results with the baseline. A result is flagged
+    as a regression if its throughput is lower, or its peak memory is higher, than the
+    baseline by more than the tolerance.
+
+    #INPUT
+    - result_df (pd.DataFrame); A dataframe with the result of each benchmark and size.
+    - baseline_path (string); The path to the baseline JSON file.
+    - tolerance (float); The fraction of throughput loss (or memory increase) allowed.
+    #OUTPUT
+    - comparison_df (pd.DataFrame); A dataframe with the results, their ratio to the baseline
+      and the regressions found ("throughput" and/or "memory"). The results without baseline
+      have empty ratios.
+    """
+    with open(baseline_path, "rt") as baseline_file:
+        baseline_result_dic = json.load(baseline_file)["results"]
+
+    comparison_dic_list = []
+    for result in result_df.itertuples(index=False):
+        baseline = baseline_result_dic.get(result.Benchmark, {}).get(str(result.Records))
+        comparison_dic = {"Benchmark": result.Benchmark, "Records": result.Records, "Records_per_s": round(result.records_per_s),
+                          "Peak_RSS_MB": round(result.peak_rss_mb, 1), "Throughput_ratio": None, "Memory_ratio": None, "Regression": ""}
+
+        if baseline:
+            comparison_dic["Throughput_ratio"] = round(result.records_per_s / baseline["records_per_s"], 2)
+            comparison_dic["Memory_ratio"] = round(result.peak_rss_mb / baseline["peak_rss_mb"], 2)
+
+            regression_list = []
+            if comparison_dic["Throughput_ratio"] < 1 - tolerance:
+                regression_list.append("throughput")
+            if comparison_dic["Memory_ratio"] > 1 + tolerance:
+                regression_list.append("memory")
+            comparison_dic["Regression"] = ";".join(regression_list)
+
+        comparison_dic_list.append(comparison_dic)
+
+    return pd.DataFrame(comparison_dic_list)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# Global imports
+import os
+import re
+import json
+import sqlite3
+import argparse
+import filecmp
+import contextlib
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script checks that the pipelined mode of ProteoParc (`--pipeline`) writes the same
+outputs as the sequential mode. It compares two results folders of the same project (same
+TaxID, gene list and options), one run with `--pipeline` and one without it, and reports
+the files that are missing in one of the folders or whose content differs.
+
+The files that depend on the run rather than on the records are compared without their
+run-dependent parts: the date and folder paths of metadata/summary.txt, the file signature
+of the sequence store and the page layout of the SQLite metadata (its rows are compared).
+The plots, the stage manifest and the profiling trace are not compared.
+"""
+
+SKIPPED_FILE_NAMES = [".proteoparc_stages.json", "profile_trace.json"]
+SKIPPED_EXTENSIONS = [".jpg", ".png", ".pdf", ".svg"]
+
+def main():
+
+    sequential_folder_path, pipelined_folder_path = parser()
+
+    sequential_file_set = list_result_files(sequential_folder_path)
+    pipelined_file_set = list_result_files(pipelined_folder_path)
+
+    # Compare the files present in both folders, and report the files present in only one of them
+    difference_list = [f"Only in the sequential results: {relative_path}" for relative_path in sorted(sequential_file_set - pipelined_file_set)]
+    difference_list += [f"Only in the pipelined results: {relative_path}" for relative_path in sorted(pipelined_file_set - sequential_file_set)]
+
+    for relative_path in sorted(sequential_file_set & pipelined_file_set):
+        if not are_result_files_equal(f"{sequential_folder_path}/{relative_path}", sequential_folder_path,
+                                      f"{pipelined_folder_path}/{relative_path}", pipelined_folder_path):
+            difference_list.append(f"Different content: {relative_path}")
+
+    if difference_list:
+        print("\n".join(difference_list))
+        print(f"WARNING: {len(difference_list)} differences between the sequential and the pipelined results")
+        exit(1)
+
+    print(f"# The sequential and the pipelined results are the same ({len(sequential_file_set)} files compared)")
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - sequential_folder_path (string); The path to the results folder written without --pipeline.
+    - pipelined_folder_path (string); The path to the results folder written with --pipeline.
+    """
+    parser = argparse.ArgumentParser(description="A script to check that the pipelined and the sequential modes of ProteoParc write the same results")
+    parser.add_argument("--sequential-path", dest="sequential_path", type=str, help="The results folder of the project run without --pipeline", required=True, nargs=1)
+    parser.add_argument("--pipelined-path", dest="pipelined_path", type=str, help="The results folder of the project run with --pipeline", required=True, nargs=1)
+
+    args = parser.parse_args()
+
+    sequential_folder_path = os.path.realpath(args.sequential_path[0])
+    pipelined_folder_path = os.path.realpath(args.pipelined_path[0])
+    for folder_path in [sequential_folder_path, pipelined_folder_path]:
+        if not os.path.isdir(folder_path):
+            print(f"ERROR: The results folder '{folder_path}' does not exist")
+            exit(0)
+
+    return sequential_folder_path, pipelined_folder_path
+
+def list_result_files(results_folder_path):
+    """
+    This function lists the files of a results folder that are compared.
+
+    #INPUT
+    - results_folder_path (string); The path to a ProteoParc results folder.
+    #OUTPUT
+    - relative_path_set (set); A set with the path of each compared file, relative to the
+      results folder.
+    """
+    relative_path_set = set()
+    for folder_path, _, file_name_list in os.walk(results_folder_path):
+        for file_name in file_name_list:
+            if file_name in SKIPPED_FILE_NAMES or os.path.splitext(file_name)[1] in SKIPPED_EXTENSIONS:
+                continue
+            relative_path_set.add(os.path.relpath(f"{folder_path}/{file_name}", results_folder_path))
+
+    return relative_path_set
+
+def are_result_files_equal(first_path, first_folder_path, second_path, second_folder_path):
+    """
+    This function compares a file of both results folders, ignoring the parts of the file
+    that depend on the run.
+
+    #INPUT
+    - first_path (string); The path to the file in the first results folder.
+    - first_folder_path (string); The path to the first results folder.
+    - second_path (string); The path to the file in the second results folder.
+    - second_folder_path (string); The path to the second results folder.
+    #OUTPUT
+    - are_equal (boolean); A boolean indicator to indicate if both files have the same content.
+    """
+    file_name = os.path.basename(first_path)
+
+    if file_name == "summary.txt":
+        return read_summary_txt(first_path, first_folder_path) == read_summary_txt(second_path, second_folder_path)
+
+    if file_name == "store_fields.json":
+        return read_store_fields(first_path) == read_store_fields(second_path)
+
+    if file_name.endswith(".sqlite"):
+        return read_sqlite_rows(first_path) == read_sqlite_rows(second_path)
+
+    return filecmp.cmp(first_path, second_path, shallow=False)
+
+def read_summary_txt(summary_path, results_folder_path):
+    """
+    This function reads a summary.txt file without its date, and with the path to the
+    results folder replaced by a placeholder.
+
+    #INPUT
+    - summary_path (string); The path to the summary.txt file.
+    - results_folder_path (string); The path to the results folder of the summary.
+    #OUTPUT
+    - summary_line_list (list); A list with the lines of the summary.
+    """
+    with open(summary_path, "rt") as summary_file:
+        summary_line_list = [line.replace(results_folder_path, "{RESULTS_FOLDER}") for line in summary_file
+                             if not re.fullmatch(r"\d{2}/\d{2}/\d{4} - \d{2}:\d{2}:\d{2}\n?", line)]
+
+    return summary_line_list
+
+def read_store_fields(store_fields_path):
+    """
+    This function reads the fields of a sequence store, without the signature of the
+    file the store was built from (its size and modification time).
+
+    #INPUT
+    - store_fields_path (string); The path to the store_fields.json file.
+    #OUTPUT
+    - store_field_dic (dictionary); A dictionary with the fields of the store.
+    """
+    with open(store_fields_path, "rt") as store_fields_file:
+        store_field_dic = json.load(store_fields_file)
+    store_field_dic.pop("signature", None)
+
+    return store_field_dic
+
+def read_sqlite_rows(sqlite_path):
+    """
+    This function reads all the rows of a SQLite file, per table.
+
+    #INPUT
+    - sqlite_path (string); The path to the SQLite file.
+    #OUTPUT
+    - table_row_dic (dictionary); A dictionary with the name of each table as keys, and a
+      sorted list of its rows as values.
+    """
+    with contextlib.closing(sqlite3.connect(sqlite_path)) as sqlite_connection:
+        table_name_list = [row[0] for row in sqlite_connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        table_row_dic = {table_name: sorted(sqlite_connection.execute(f"SELECT * FROM \"{table_name}\""), key=repr) for table_name in table_name_list}
+
+    return table_row_dic
+
+if __name__ == "__main__":
+    main()
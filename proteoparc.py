@@ -1,8 +1,36 @@
 # Global imports
 import os
+import sys
+import json
+import shutil
+import hashlib
 import argparse
 import requests
+import threading
 import subprocess
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# Local imports, the stages of the pipeline are imported from the scripts folder
+sys.path.insert(0, f"{os.path.dirname(os.path.realpath(__file__))}/scripts")
+from uniparc_download import download_uniparc_database
+from remove_redundant_records import remove_redundant_records, filter_redundant_records
+from align_database_per_gene import align_records_per_gene, align_gene_records
+from alignment_quality_control import evaluate_alignments
+from fasta_index import write_fasta_index
+from digest_database import digest_database, build_digestion_parameters
+from zooms_markers import compute_zooms_markers
+import metadata_proteoparc
+import extract_records
+import diff_databases
+import build_service
+from pipeline_profiler import profile_step, start_profiling, stop_profiling
+from listing_cache import configure_listing_cache, default_listing_cache_path
+from download_metrics import start_download_metrics, stop_download_metrics
+from global_store import configure_global_store, store_database_files
+from sequence_store import build_sequence_store, build_sequence_store_from_records, open_sequence_store, save_sequence_store, subset_sequence_store, \
+                           group_records_per_gene, store_header_list
 
 # Script information - Written in Python 3.9.12 - June 2023
 __author__ = "Guillermo Carrillo Martin"
@@ -20,51 +48,257 @@ annotation. The performance of this pipeline can be split into three different s
     2. Processing. Performs optional modifications to the multi-fasta 
     database: 
      - Remove redundant records with exact or substring sequences.
+     - Index the database (faidx), optionally compressed in BGZF format.
+     - Digest the database in-silico, writing a peptide-mass index.
+     - Compute the ZooMS marker peptide masses per species.
      - Align each protein record by the gene name.
+     - Evaluate the quality of each aligned record.
 
     3. Metadata. Generates some CSV tables, files and plots with metadata information 
     about the database, like the number of species retrieved or the genes not found 
     during the search.
+
+Each step is imported from the scripts folder and run within the same process, so the 
+protein records are passed between steps in memory instead of reading the multi-fasta 
+database again. The scripts can still be run separately from the command line.
+
+The steps are organized as a stage graph (download -> redundancy -> alignment -> quality 
+control, redundancy -> metadata -> plots, and redundancy -> digestion and ZooMS markers). The fingerprint of the parameters and inputs
+of each stage is stored in the results folder (.proteoparc_stages.json), so running the 
+software again only repeats the stages whose parameters or inputs have changed. The 
+alignment, metadata and peptide (digestion and ZooMS markers) branches are independent, 
+and they run concurrently.
+
+Sub-databases can be extracted from a built database by gene, species, TaxID or repository
+with "proteoparc.py extract" (see scripts/extract_records.py), two builds can be compared 
+with "proteoparc.py diff" (see scripts/diff_databases.py), and "proteoparc.py serve" runs 
+the builds sent to a local job API (see scripts/build_service.py).
 """
 
-def main():
+STAGE_MANIFEST_NAME = ".proteoparc_stages.json" # The file storing the fingerprint of each stage
+STAGE_MANIFEST_LOCK = threading.Lock() # The lock to update the stage manifest from concurrent branches
+
+def main(argument_list=None):
+
+    if argument_list is None:
+        argument_list = sys.argv[1:]
+
+    # Extract a sub-database from a database already built
+    if argument_list[:1] == ["extract"]:
+        extract_records.main(argument_list[1:])
+        return
+
+    # Compare two databases already built
+    if argument_list[:1] == ["diff"]:
+        diff_databases.main(argument_list[1:])
+        return
+
+    # Run the build service, running the builds sent to its job API
+    if argument_list[:1] == ["serve"]:
+        build_service.main(argument_list[1:], main, parser)
+        return
 
     # Parse the input variables from the terminal
-    RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_remove_redundancy, do_align_database, do_ignore_json = parser()
-    script_directory_path = f"{os.path.dirname(__file__)}/scripts"
+    RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_remove_redundancy, do_align_database, do_ignore_json, ALIGNER, ALIGN_TIMEOUT, do_alignment_qc, do_export_json, THREADS, PLOT_BACKEND, do_force, do_pipeline, do_profile, do_profile_python, do_bgzip, DIGESTION_PARAMETERS, ZOOMS_MARKERS, LISTING_CACHE, LISTING_MAX_AGE, METRICS_FILE, METRICS_INTERVAL, GLOBAL_STORE = parser(argument_list)
+    script_directory_path = f"{os.path.dirname(os.path.realpath(__file__))}/scripts"
+
+    # Reuse the UniProt listings of previous runs if they have not changed
+    configure_listing_cache(LISTING_CACHE, LISTING_MAX_AGE)
+
+    # Share the databases and alignments with the other projects of the global store, if requested
+    configure_global_store(GLOBAL_STORE)
+
+    # Start recording the resources employed by each stage
+    if do_profile:
+        if os.path.exists(f"{RESULTS_FOLDER}/profile_python"):
+            shutil.rmtree(f"{RESULTS_FOLDER}/profile_python")
+        start_profiling(f"{RESULTS_FOLDER}/profile_python" if do_profile_python else None)
+
+    # Read the fingerprints of the stages run previously in the results folder
+    if do_force:
+        stage_manifest = {}
+    elif not do_force:
+        stage_manifest = read_stage_manifest(RESULTS_FOLDER)
+
+    if GENE_LIST:
+        gene_list_digest = file_digest(GENE_LIST)
+    elif not GENE_LIST:
+        gene_list_digest = None
+
+    sequence_store = None # The records are only read from the database if a stage needs them
+    pipelined_stage_list = [] # The stages run per gene during the download
+
+    if do_pipeline and not GENE_LIST:
+        print("WARNING: --pipeline requires a gene list (--genes), the steps are run one after the other")
 
-    # Interrupt the execution if the user is not connected to internet
-    if not internet_on():
-        print("ERROR: No internet connection detected")
-        exit(0)
-    
     # DOWNLOAD STEP
-    if os.path.exists(RESULTS_FOLDER):
-        os.system(f"rm -r {RESULTS_FOLDER}")
-    os.mkdir(RESULTS_FOLDER)
+    download_fingerprint = stage_fingerprint("download", [TAX_ID, gene_list_digest, do_export_json])
+    download_output_list = [raw_database_path(RESULTS_FOLDER, DATABASE_NAME), f"{RESULTS_FOLDER}/.records_metadata.sqlite"]
 
-    download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, script_directory_path)
-    
-    # Delete the results folder if no proteins were downloaded
-    if not os.path.exists(f"{RESULTS_FOLDER}/{DATABASE_NAME}"):
-        os.system(f"rm -r {RESULTS_FOLDER}")
-        print("ERROR: NO PROTEINS FOUND")
-        exit(0)
+    if is_stage_fresh(stage_manifest, "download", download_fingerprint, download_output_list):
+        print("# Skipping the download, the database is up to date")
+
+    else:
+        # Interrupt the execution if the user is not connected to internet
+        if not internet_on():
+            print("ERROR: No internet connection detected")
+            exit(0)
+
+        if os.path.exists(RESULTS_FOLDER):
+            shutil.rmtree(RESULTS_FOLDER)
+        os.mkdir(RESULTS_FOLDER)
+        stage_manifest = {}
+
+        # Export the download metrics periodically, if requested
+        start_download_metrics(METRICS_FILE, METRICS_INTERVAL)
+        try:
+            if do_pipeline and GENE_LIST:
+                with profile_step("download", "stage", do_cprofile=True):
+                    sequence_store = pipelined_download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_export_json, 
+                                                                 do_remove_redundancy, do_align_database, ALIGNER, ALIGN_TIMEOUT, THREADS)
+                pipelined_stage_list = [stage_name for stage_name, do_stage in [("redundancy", do_remove_redundancy), ("alignment", do_align_database)] if do_stage]
+            else:
+                with profile_step("download", "stage", do_cprofile=True):
+                    sequence_store = download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_export_json)
+        finally:
+            stop_download_metrics()
+        
+        # Delete the results folder if no proteins were downloaded
+        if sequence_store is None:
+            shutil.rmtree(RESULTS_FOLDER)
+            print("ERROR: NO PROTEINS FOUND")
+            exit(0)
+
+        record_stage(RESULTS_FOLDER, stage_manifest, "download", download_fingerprint)
 
     # PROCESSING STEP
-    if do_remove_redundancy:
-        remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, script_directory_path)
-    if do_align_database:
-        align_database_per_gene(RESULTS_FOLDER, DATABASE_NAME, script_directory_path)
+    redundancy_fingerprint = stage_fingerprint("redundancy", [], [download_fingerprint])
+    redundancy_output_list = [f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/fasta_remove_redundancy"]
+
+    if "redundancy" in pipelined_stage_list:
+        record_stage(RESULTS_FOLDER, stage_manifest, "redundancy", redundancy_fingerprint)
+
+    elif do_remove_redundancy and is_stage_fresh(stage_manifest, "redundancy", redundancy_fingerprint, redundancy_output_list):
+        print("# Skipping the redundancy removal, the database is up to date")
+
+    elif do_remove_redundancy:
+        restore_unfiltered_database(RESULTS_FOLDER, DATABASE_NAME)
+        if sequence_store is None:
+            with profile_step("read_database"):
+                sequence_store = build_sequence_store(f"{RESULTS_FOLDER}/{DATABASE_NAME}")
+
+        with profile_step("redundancy", "stage", do_cprofile=True):
+            sequence_store = remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, sequence_store)
+        record_stage(RESULTS_FOLDER, stage_manifest, "redundancy", redundancy_fingerprint)
+
+    elif not do_remove_redundancy:
+        restore_unfiltered_database(RESULTS_FOLDER, DATABASE_NAME)
+        forget_stage(RESULTS_FOLDER, stage_manifest, "redundancy")
+
+    # Store the records of the database files once for all the projects, indexed by the results folder
+    store_database_files([f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta",
+                          f"{RESULTS_FOLDER}/fasta_remove_redundancy/redundant_records.fasta"])
+
+    # Keep the records of the final database for the next runs, read as memory maps
+    if sequence_store is not None:
+        save_sequence_store(sequence_store, f"{RESULTS_FOLDER}/.sequence_store", f"{RESULTS_FOLDER}/{DATABASE_NAME}")
 
-    # METADATA STEP
-    produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_ignore_json, script_directory_path)
-    plot_metadata(RESULTS_FOLDER, GENE_LIST, script_directory_path)
+    # Fingerprint the stages after the final database, which depend on its content
+    database_signature = path_signature(f"{RESULTS_FOLDER}/{DATABASE_NAME}")
 
-def parser():
+    # INDEX STEP
+    index_fingerprint = stage_fingerprint("index", [do_bgzip], [database_signature])
+    index_output_list = [f"{RESULTS_FOLDER}/{DATABASE_NAME}.fai"]
+    bgzf_output_list = [f"{RESULTS_FOLDER}/{DATABASE_NAME}.gz", f"{RESULTS_FOLDER}/{DATABASE_NAME}.gz.fai", f"{RESULTS_FOLDER}/{DATABASE_NAME}.gz.gzi"]
+
+    if is_stage_fresh(stage_manifest, "index", index_fingerprint, index_output_list + (bgzf_output_list if do_bgzip else [])):
+        print("# Skipping the database index, the index is up to date")
+
+    else:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "index", index_output_list + bgzf_output_list)
+        with profile_step("index", "stage", do_cprofile=True):
+            index_database(RESULTS_FOLDER, DATABASE_NAME, do_bgzip)
+        record_stage(RESULTS_FOLDER, stage_manifest, "index", index_fingerprint)
+
+    stage_fingerprint_dic = {
+        "alignment": stage_fingerprint("alignment", [ALIGNER, ALIGN_TIMEOUT], [database_signature]),
+        "metadata": stage_fingerprint("metadata", [TAX_ID, gene_list_digest, do_ignore_json], [database_signature, download_fingerprint])}
+    stage_fingerprint_dic["alignment_qc"] = stage_fingerprint("alignment_qc", [], [stage_fingerprint_dic["alignment"]])
+    stage_fingerprint_dic["plots"] = stage_fingerprint("plots", [PLOT_BACKEND, gene_list_digest], [stage_fingerprint_dic["metadata"]])
+    stage_fingerprint_dic["digestion"] = stage_fingerprint("digestion", [DIGESTION_PARAMETERS], [database_signature])
+    stage_fingerprint_dic["zooms"] = stage_fingerprint("zooms", [file_digest(ZOOMS_MARKERS) if ZOOMS_MARKERS else None], [database_signature])
+
+    if "alignment" in pipelined_stage_list:
+        record_stage(RESULTS_FOLDER, stage_manifest, "alignment", stage_fingerprint_dic["alignment"])
+
+    # Select the outdated stages, an outdated stage also outdates the following ones
+    outdated_stage_dic = {}
+    if do_align_database and not is_stage_fresh(stage_manifest, "alignment", stage_fingerprint_dic["alignment"], [f"{RESULTS_FOLDER}/alignment_per_gene"]):
+        outdated_stage_dic["alignment"] = stage_fingerprint_dic["alignment"]
+    if do_align_database and do_alignment_qc and ("alignment" in outdated_stage_dic or \
+       not is_stage_fresh(stage_manifest, "alignment_qc", stage_fingerprint_dic["alignment_qc"], [f"{RESULTS_FOLDER}/alignment_qc"])):
+        outdated_stage_dic["alignment_qc"] = stage_fingerprint_dic["alignment_qc"]
+    if not is_stage_fresh(stage_manifest, "metadata", stage_fingerprint_dic["metadata"], [f"{RESULTS_FOLDER}/metadata"]):
+        outdated_stage_dic["metadata"] = stage_fingerprint_dic["metadata"]
+    if "metadata" in outdated_stage_dic or \
+       not is_stage_fresh(stage_manifest, "plots", stage_fingerprint_dic["plots"], [f"{RESULTS_FOLDER}/metadata/plots"]):
+        outdated_stage_dic["plots"] = stage_fingerprint_dic["plots"]
+    if DIGESTION_PARAMETERS and not is_stage_fresh(stage_manifest, "digestion", stage_fingerprint_dic["digestion"], [f"{RESULTS_FOLDER}/peptide_index"]):
+        outdated_stage_dic["digestion"] = stage_fingerprint_dic["digestion"]
+    if ZOOMS_MARKERS and not is_stage_fresh(stage_manifest, "zooms", stage_fingerprint_dic["zooms"], [f"{RESULTS_FOLDER}/zooms_markers"]):
+        outdated_stage_dic["zooms"] = stage_fingerprint_dic["zooms"]
+
+    # Remove the outputs of the stages not requested in this run
+    if not do_align_database:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "alignment", [f"{RESULTS_FOLDER}/alignment_per_gene"])
+    if not do_align_database or not do_alignment_qc:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "alignment_qc", [f"{RESULTS_FOLDER}/alignment_qc"])
+    if not DIGESTION_PARAMETERS:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "digestion", [f"{RESULTS_FOLDER}/peptide_index"])
+    if not ZOOMS_MARKERS:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "zooms", [f"{RESULTS_FOLDER}/zooms_markers"])
+
+    for stage_name in stage_fingerprint_dic:
+        if stage_name not in outdated_stage_dic and stage_name in stage_manifest and stage_name not in pipelined_stage_list:
+            print(f"# Skipping the {stage_name.replace('_', ' ')} step, the outputs are up to date")
+
+    # Read the final database if an outdated stage needs the records
+    if sequence_store is None and ("alignment" in outdated_stage_dic or "metadata" in outdated_stage_dic or "zooms" in outdated_stage_dic):
+        with profile_step("read_database"):
+            sequence_store = open_sequence_store(f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/.sequence_store")
+
+    # ALIGNMENT, METADATA AND PEPTIDE STEPS, running the branches concurrently. The branches run
+    # one after the other with cProfile, as only one Python profiler can be active at the same time
+    with ThreadPoolExecutor(max_workers=1 if do_profile_python else 3) as executor:
+        future_list = [
+            executor.submit(run_alignment_branch, RESULTS_FOLDER, sequence_store, ALIGNER, ALIGN_TIMEOUT, stage_manifest, outdated_stage_dic),
+            executor.submit(run_metadata_branch, RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, sequence_store, do_ignore_json, THREADS, 
+                            PLOT_BACKEND, script_directory_path, stage_manifest, outdated_stage_dic),
+            executor.submit(run_peptide_branch, RESULTS_FOLDER, DATABASE_NAME, sequence_store, DIGESTION_PARAMETERS, ZOOMS_MARKERS, THREADS, stage_manifest, outdated_stage_dic)]
+
+        for future in future_list:
+            future.result()
+
+    # Write the resources employed by each stage next to the metadata summary
+    if do_profile:
+        stop_profiling(f"{RESULTS_FOLDER}/metadata/profile_trace.json")
+        print(f"# Profiling trace written in '{RESULTS_FOLDER}/metadata/profile_trace.json'")
+
+    # Release the global store, so its garbage collector can run
+    configure_global_store(None)
+
+def parser(argument_list=None, cwd=None, exit_on_error=True):
     """
     This function parses the required arguments from the terminal to the python script.
     
+    #INPUT
+    - argument_list (List); A list with the arguments to parse. If None, the arguments are
+      read from the terminal (sys.argv).
+    - cwd (String); The folder where the relative paths are resolved. If None, the current
+      working directory.
+    - exit_on_error (Boolean); A boolean indicator to indicate if the parsing errors are
+      printed before exiting (as in the terminal) or raised as a ValueError, without the
+      help option (as in the build service).
     #OUTPUT
     - RESULTS_FOLDER (String); The folder's absolute path to write the output.
     - DATABASE_NAME (String); The name of the database file and folder.
@@ -77,23 +311,87 @@ def parser():
       'align database' process happens.
     - do_ignore_json (Boolean); A boolean indicator to indicate if the
       'ignore JSON files' process happens.
+    - ALIGNER (String); The software employed to align the database per gene.
+    - ALIGN_TIMEOUT (Float); The maximum number of seconds to align a gene. If no 
+      timeout is specified, the variable is assigned as None.
+    - do_alignment_qc (Boolean); A boolean indicator to indicate if the 
+      'alignment quality control' process happens.
+    - do_export_json (Boolean); A boolean indicator to indicate if the extra 
+      metadata is also exported as JSON files.
+    - THREADS (Integer); The number of processes employed by the parallel steps.
+    - PLOT_BACKEND (String); The software employed to plot the metadata (R or python).
+    - do_force (Boolean); A boolean indicator to indicate if all the stages are run again,
+      even if their outputs are up to date.
+    - do_pipeline (Boolean); A boolean indicator to indicate if the redundancy removal and
+      the alignment of each gene start as soon as its records are downloaded.
+    - do_profile (Boolean); A boolean indicator to indicate if the resources employed by
+      each stage are recorded.
+    - do_profile_python (Boolean); A boolean indicator to indicate if the Python functions
+      of each stage are also profiled with cProfile.
+    - do_bgzip (Boolean); A boolean indicator to indicate if the database is also compressed
+      in BGZF format, with its index.
+    - DIGESTION_PARAMETERS (Dictionary); A dictionary with the enzyme, missed cleavages, 
+      peptide length and mass windows of the in-silico digestion. If the database is not 
+      digested, the variable is assigned as None.
+    - ZOOMS_MARKERS (String); The path to the ZooMS marker definition file. If no file is 
+      specified, the variable is assigned as None.
+    - LISTING_CACHE (String); The path to the cache of the UniProt listings. If the cache is
+      disabled, the variable is assigned as None.
+    - LISTING_MAX_AGE (Float); The number of seconds a cached listing is reused without 
+      revalidating it.
+    - METRICS_FILE (String); The path to the status file with the download metrics. If no
+      file is specified, the variable is assigned as None.
+    - METRICS_INTERVAL (Float); The number of seconds between two exports of the download metrics.
+    - GLOBAL_STORE (String); The path to the content-addressed store shared between projects. If
+      no store is specified, the variable is assigned as None.
     """
 
     # Setting up the parser
-    parser = argparse.ArgumentParser(description="A pipeline to generate protein multi-fasta databases using a TaxID")
+    parser = argparse.ArgumentParser(description="A pipeline to generate protein multi-fasta databases using a TaxID",
+                                     epilog="Run 'proteoparc.py extract -h' to extract a sub-database by gene, species, TaxID or repository, 'proteoparc.py diff -h' to compare two builds, and 'proteoparc.py serve -h' to run the build service",
+                                     add_help=exit_on_error)
+    # Raise the parsing errors instead of printing them and exiting, if requested
+    if not exit_on_error:
+        parser.error = raise_parser_error
     parser.add_argument("--project", "-p", dest="project", type=str, help="The name of the project", required=True, nargs=1)
     parser.add_argument("--output-path", dest="output_path", type=str, help="The path to write the result folder (default: working directory)", required=False, default=["."], nargs=1)
     parser.add_argument("--tax-id", "-t", dest="taxid", type=int, help="The TaxID number employed to construct the multi-fasta database", required=True, nargs=1)
     parser.add_argument("--genes", "-g", dest="gene_list", type=str, help="The path to the list of genes (not mandatory)", required=False, nargs=1)
     parser.add_argument("--remove-redundancy", dest="remove_redundancy", action=argparse.BooleanOptionalAction, help="Specify if the redundant records are removed (default: True; --remove-redundancy)", default=True, required=False)
     parser.add_argument("--align-database", dest="align_database", action=argparse.BooleanOptionalAction, help="Specify if the database is also aligned per protein (default: True; --align-database)", default=True, required=False)
-    parser.add_argument("--ignore-json", dest="ignore_json", action=argparse.BooleanOptionalAction, help="Ignore JSON files containing extra metadata per each record (default: False; --no-ignore-json)", default=False, required=False)
+    parser.add_argument("--aligner", dest="aligner", type=str, help="The software employed to align the database per gene (default: mafft)", required=False, default=["mafft"], choices=["mafft", "clustalo"], nargs=1)
+    parser.add_argument("--align-timeout", dest="align_timeout", type=float, help="The maximum number of seconds to align a gene (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--alignment-qc", dest="alignment_qc", action=argparse.BooleanOptionalAction, help="Specify if the quality of each aligned record is evaluated (default: True; --alignment-qc)", default=True, required=False)
+    parser.add_argument("--ignore-json", dest="ignore_json", action=argparse.BooleanOptionalAction, help="Ignore the files containing extra metadata per each record (default: False; --no-ignore-json)", default=False, required=False)
+    parser.add_argument("--plot-backend", dest="plot_backend", type=str, help="The software employed to plot the metadata (default: R)", required=False, default=["R"], choices=["R", "python"], nargs=1)
+    parser.add_argument("--threads", dest="threads", type=int, help="The number of processes employed by the parallel steps (default: 1)", required=False, default=[1], nargs=1)
+    parser.add_argument("--export-json", dest="export_json", action=argparse.BooleanOptionalAction, help="Export the extra metadata per each record as JSON files (default: False; --no-export-json)", default=False, required=False)
+    parser.add_argument("--pipeline", dest="pipeline", action=argparse.BooleanOptionalAction, help="Remove the redundancy and align each gene as soon as its records are downloaded, only with a gene list (default: False; --no-pipeline)", default=False, required=False)
+    parser.add_argument("--profile", dest="profile", action=argparse.BooleanOptionalAction, help="Record the time, CPU, memory and requests of each step in metadata/profile_trace.json (default: False; --no-profile)", default=False, required=False)
+    parser.add_argument("--profile-python", dest="profile_python", action=argparse.BooleanOptionalAction, help="Also write a cProfile dump per each stage in the profile_python folder, implies --profile (default: False; --no-profile-python)", default=False, required=False)
+    parser.add_argument("--bgzip", dest="bgzip", action=argparse.BooleanOptionalAction, help="Also write the database compressed in BGZF format, with its faidx and gzi indexes (default: False; --no-bgzip)", default=False, required=False)
+    parser.add_argument("--digest", dest="digest", action=argparse.BooleanOptionalAction, help="Digest the database in-silico and write a peptide-mass index (default: False; --no-digest)", default=False, required=False)
+    parser.add_argument("--enzyme", dest="enzyme", type=str, help="The enzyme employed in the digestion (default: trypsin)", required=False, default=["trypsin"], choices=["trypsin", "trypsin/p", "lys-c", "lys-n", "arg-c", "asp-n", "glu-c", "chymotrypsin"], nargs=1)
+    parser.add_argument("--missed-cleavages", dest="missed_cleavages", type=int, help="The maximum number of missed cleavages per peptide (default: 2)", required=False, default=[2], nargs=1)
+    parser.add_argument("--peptide-length", dest="peptide_length", type=int, help="The minimum and maximum peptide length (default: 7 30)", required=False, default=[7, 30], nargs=2)
+    parser.add_argument("--peptide-mass", dest="peptide_mass", type=float, help="The minimum and maximum peptide neutral mass in Da (default: 500 5000)", required=False, default=[500.0, 5000.0], nargs=2)
+    parser.add_argument("--carbamidomethyl", dest="carbamidomethyl", action=argparse.BooleanOptionalAction, help="Add the carbamidomethylation of the cysteines as a fixed modification in the digestion (default: False; --no-carbamidomethyl)", default=False, required=False)
+    parser.add_argument("--zooms-markers", dest="zooms_markers", type=str, help="The path to a CSV file with the ZooMS markers (Marker, Gene, Peptide and Oxidations columns) to compute their masses per species (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--listing-cache", dest="listing_cache", action=argparse.BooleanOptionalAction, help=f"Cache the lists of UniParc IDs and TaxIDs in {default_listing_cache_path()} and revalidate them in the next runs (default: True; --listing-cache)", default=True, required=False)
+    parser.add_argument("--listing-max-age", dest="listing_max_age", type=float, help="The number of seconds a cached list is reused without revalidating it (default: 0)", required=False, default=[0.0], nargs=1)
+    parser.add_argument("--metrics-file", dest="metrics_file", type=str, help="The path to export the download metrics (requests, latency, records per second, ETA...) periodically, as a Prometheus textfile if it ends with .prom or as JSON otherwise (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--metrics-interval", dest="metrics_interval", type=float, help="The number of seconds between two exports of the download metrics (default: 15)", required=False, default=[15.0], nargs=1)
+    parser.add_argument("--global-store", dest="global_store", type=str, help="The path to a content-addressed store shared between projects, to keep the records of the databases and the alignments per gene only once on disk (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--force", dest="force", action=argparse.BooleanOptionalAction, help="Run all the steps again, even if their outputs are up to date (default: False; --no-force)", default=False, required=False)
 
     # Recovering the arguments 
-    args = parser.parse_args()
+    args = parser.parse_args(argument_list)
+
+    if cwd is None:
+        cwd = os.getcwd()
 
     project_name = args.project[0]
-    output_path = os.path.realpath(args.output_path[0])
+    output_path = os.path.realpath(os.path.join(cwd, args.output_path[0]))
 
     RESULTS_FOLDER = f"{os.path.realpath(output_path)}/{project_name}"
     DATABASE_NAME = project_name + "_database.fasta"
@@ -108,7 +406,59 @@ def parser():
     do_align_database = args.align_database
     do_ignore_json = args.ignore_json
 
-    return RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_remove_redundancy, do_align_database, do_ignore_json
+    ALIGNER = args.aligner[0]
+    if args.align_timeout:
+        ALIGN_TIMEOUT = args.align_timeout[0]
+    elif not args.align_timeout:
+        ALIGN_TIMEOUT = None
+
+    do_alignment_qc = args.alignment_qc
+    do_export_json = args.export_json
+    THREADS = args.threads[0]
+    PLOT_BACKEND = args.plot_backend[0]
+    do_force = args.force
+    do_pipeline = args.pipeline
+    do_profile_python = args.profile_python
+    do_profile = args.profile or do_profile_python
+    do_bgzip = args.bgzip
+    if args.digest:
+        DIGESTION_PARAMETERS = build_digestion_parameters(args.enzyme[0], args.missed_cleavages[0], args.peptide_length, args.peptide_mass, args.carbamidomethyl)
+    elif not args.digest:
+        DIGESTION_PARAMETERS = None
+
+    if args.zooms_markers:
+        ZOOMS_MARKERS = os.path.realpath(os.path.join(cwd, args.zooms_markers[0]))
+    elif not args.zooms_markers:
+        ZOOMS_MARKERS = None
+
+    if args.listing_cache:
+        LISTING_CACHE = default_listing_cache_path()
+    elif not args.listing_cache:
+        LISTING_CACHE = None
+    LISTING_MAX_AGE = args.listing_max_age[0]
+
+    if args.metrics_file:
+        METRICS_FILE = os.path.realpath(os.path.join(cwd, args.metrics_file[0]))
+    elif not args.metrics_file:
+        METRICS_FILE = None
+    METRICS_INTERVAL = args.metrics_interval[0]
+
+    if args.global_store:
+        GLOBAL_STORE = os.path.realpath(os.path.join(cwd, args.global_store[0]))
+    elif not args.global_store:
+        GLOBAL_STORE = None
+
+    return RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_remove_redundancy, do_align_database, do_ignore_json, ALIGNER, ALIGN_TIMEOUT, do_alignment_qc, do_export_json, THREADS, PLOT_BACKEND, do_force, do_pipeline, do_profile, do_profile_python, do_bgzip, DIGESTION_PARAMETERS, ZOOMS_MARKERS, LISTING_CACHE, LISTING_MAX_AGE, METRICS_FILE, METRICS_INTERVAL, GLOBAL_STORE
+
+def raise_parser_error(message):
+    """
+    This function raises an error of the argument parser, instead of printing it and exiting.
+
+    #INPUT
+    - message (string); The error message of the parser.
+    """
+
+    raise ValueError(message)
 
 def internet_on():
     """
@@ -125,17 +475,281 @@ def internet_on():
     except requests.ConnectionError as err: 
         return False
 
-def download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, script_directory_path):
+def read_stage_manifest(RESULTS_FOLDER):
+    """
+    This function reads the fingerprints of the stages run previously in the results folder.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    #OUTPUT
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run. If the 
+      file does not exist or can not be read, the dictionary is empty.
+    """
+    try:
+        with open(f"{RESULTS_FOLDER}/{STAGE_MANIFEST_NAME}", "rt") as manifest_file:
+            stage_manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        stage_manifest = {}
+
+    return stage_manifest
+
+def record_stage(RESULTS_FOLDER, stage_manifest, stage_name, fingerprint):
+    """
+    This function stores the fingerprint of a completed stage in the stage manifest, and 
+    writes it in the results folder.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - stage_name (String); The name of the completed stage.
+    - fingerprint (String); The fingerprint of the parameters and inputs of the stage.
+    #WRITE OUTPUT
+    - .proteoparc_stages.json; A JSON file with the fingerprint of each stage run.
+    """
+    with STAGE_MANIFEST_LOCK:
+        stage_manifest[stage_name] = {"fingerprint": fingerprint}
+
+        with open(f"{RESULTS_FOLDER}/{STAGE_MANIFEST_NAME}", "wt") as manifest_file:
+            json.dump(stage_manifest, manifest_file, indent=2)
+
+def forget_stage(RESULTS_FOLDER, stage_manifest, stage_name):
+    """
+    This function removes a stage from the stage manifest, so it is run again the next time
+    it is requested.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - stage_name (String); The name of the stage.
+    """
+    with STAGE_MANIFEST_LOCK:
+        if stage_manifest.pop(stage_name, None) is None:
+            return
+
+        with open(f"{RESULTS_FOLDER}/{STAGE_MANIFEST_NAME}", "wt") as manifest_file:
+            json.dump(stage_manifest, manifest_file, indent=2)
+
+def remove_stage_outputs(RESULTS_FOLDER, stage_manifest, stage_name, output_path_list):
+    """
+    This function deletes the outputs of a stage and removes it from the stage manifest, so
+    no outdated files are left in the results folder.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - stage_name (String); The name of the stage.
+    - output_path_list (List); A list with the paths of the files and folders written by the stage.
+    """
+    forget_stage(RESULTS_FOLDER, stage_manifest, stage_name)
+
+    for output_path in output_path_list:
+        if os.path.isdir(output_path):
+            shutil.rmtree(output_path)
+        elif os.path.exists(output_path):
+            os.remove(output_path)
+
+def stage_fingerprint(stage_name, parameter_list, input_list=None):
+    """
+    This function computes the fingerprint of a stage, combining its parameters with the
+    fingerprints (or signatures) of its inputs.
+
+    #INPUT
+    - stage_name (String); The name of the stage.
+    - parameter_list (List); A list with the parameters of the stage that modify its outputs.
+    - input_list (List); A list with the fingerprints of the previous stages, or the signatures
+      of the input files. If the stage has no inputs, the variable is assigned as None.
+    #OUTPUT
+    - fingerprint (String); A SHA-256 hexadecimal digest.
+    """
+    fingerprint_json = json.dumps([stage_name, parameter_list, input_list or []], sort_keys=True)
+
+    return hashlib.sha256(fingerprint_json.encode()).hexdigest()
+
+def is_stage_fresh(stage_manifest, stage_name, fingerprint, output_path_list):
+    """
+    This function checks if a stage is up to date: the stored fingerprint is the same as 
+    the current one, and all its outputs exist.
+
+    #INPUT
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - stage_name (String); The name of the stage.
+    - fingerprint (String); The current fingerprint of the stage.
+    - output_path_list (List); A list with the paths of the files and folders written by the stage.
+    #OUTPUT
+    - Boolean (True or False).
+    """
+    if stage_manifest.get(stage_name, {}).get("fingerprint") != fingerprint:
+        return False
+
+    return all(os.path.exists(output_path) for output_path in output_path_list)
+
+def path_signature(path):
+    """
+    This function computes a cheap signature of a file, based on its size and last 
+    modification time, so a file edited after a stage is detected as a new input.
+
+    #INPUT
+    - path (String); The path to the file.
+    #OUTPUT
+    - signature (List); A list with the size and the modification time (ns) of the file. 
+      If the file does not exist, the variable is assigned as None.
+    """
+    if not os.path.exists(path):
+        return None
+
+    file_stat = os.stat(path)
+
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+def file_digest(path):
+    """
+    This function computes the SHA-256 digest of a file content, so a file moved or copied
+    without changes keeps the same fingerprint.
+
+    #INPUT
+    - path (String); The path to the file.
+    #OUTPUT
+    - digest (String); A SHA-256 hexadecimal digest.
+    """
+    with open(path, "rb") as input_file:
+        return hashlib.sha256(input_file.read()).hexdigest()
+
+def raw_database_path(RESULTS_FOLDER, DATABASE_NAME):
+    """
+    This function returns the path to the database as downloaded, which is moved to the
+    'fasta_remove_redundancy' folder after removing the redundant records.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    #OUTPUT
+    - database_path (String); The path to the unfiltered multi-fasta database.
+    """
+    if os.path.exists(f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta"):
+        return f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta"
+
+    return f"{RESULTS_FOLDER}/{DATABASE_NAME}"
+
+def restore_unfiltered_database(RESULTS_FOLDER, DATABASE_NAME):
+    """
+    This function undoes the redundancy removal step, moving the unfiltered database back to 
+    the results folder and deleting the 'fasta_remove_redundancy' folder.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    """
+    if os.path.exists(f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta"):
+        os.replace(f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta", f"{RESULTS_FOLDER}/{DATABASE_NAME}")
+
+    if os.path.exists(f"{RESULTS_FOLDER}/fasta_remove_redundancy"):
+        shutil.rmtree(f"{RESULTS_FOLDER}/fasta_remove_redundancy")
+
+def run_alignment_branch(RESULTS_FOLDER, sequence_store, ALIGNER, ALIGN_TIMEOUT, stage_manifest, outdated_stage_dic):
+    """
+    This function runs the outdated stages of the alignment branch: the alignment per gene
+    and its quality control.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    - ALIGNER (String); The software employed to align the database per gene.
+    - ALIGN_TIMEOUT (Float); The maximum number of seconds to align a gene. If no 
+      timeout is specified, the variable is assigned as None.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - outdated_stage_dic (Dictionary); A dictionary with the current fingerprint of each 
+      stage that has to be run.
+    """
+    if "alignment" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "alignment", [f"{RESULTS_FOLDER}/alignment_per_gene"])
+        with profile_step("alignment", "stage", do_cprofile=True):
+            align_database_per_gene(RESULTS_FOLDER, sequence_store, ALIGNER, ALIGN_TIMEOUT)
+        record_stage(RESULTS_FOLDER, stage_manifest, "alignment", outdated_stage_dic["alignment"])
+
+    if "alignment_qc" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "alignment_qc", [f"{RESULTS_FOLDER}/alignment_qc"])
+        with profile_step("alignment_qc", "stage", do_cprofile=True):
+            alignment_quality_control(RESULTS_FOLDER)
+        record_stage(RESULTS_FOLDER, stage_manifest, "alignment_qc", outdated_stage_dic["alignment_qc"])
+
+def run_metadata_branch(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, sequence_store, do_ignore_json, THREADS, PLOT_BACKEND, script_directory_path, stage_manifest, outdated_stage_dic):
+    """
+    This function runs the outdated stages of the metadata branch: the metadata files and 
+    the metadata plots.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    - TAX_ID (Integer); The TaxID number employed to construct the multi-fasta database.
+    - GENE_LIST (String); The path to the gene list employed to construct the multi-fasta.
+      database. If no gene list is specified, the variable is assigned as None.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    - do_ignore_json (Boolean); A boolean indicator to indicate if the
+      'ignore JSON files' process happens.
+    - THREADS (Integer); The number of processes employed to parse the database headers.
+    - PLOT_BACKEND (String); The software employed to plot the metadata (R or python).
+    - script_directory_path (String); The absolute path to the scripts folder.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - outdated_stage_dic (Dictionary); A dictionary with the current fingerprint of each 
+      stage that has to be run.
+    """
+    if "metadata" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "metadata", [f"{RESULTS_FOLDER}/metadata"])
+        with profile_step("metadata", "stage", do_cprofile=True):
+            record_info_df = produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, sequence_store, do_ignore_json, THREADS)
+
+        # The plots can not be generated without the metadata files
+        if record_info_df is None:
+            return
+        record_stage(RESULTS_FOLDER, stage_manifest, "metadata", outdated_stage_dic["metadata"])
+
+    if "plots" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "plots", [f"{RESULTS_FOLDER}/metadata/plots"])
+        with profile_step("plots", "stage", do_cprofile=True):
+            plot_metadata(RESULTS_FOLDER, GENE_LIST, PLOT_BACKEND, script_directory_path)
+        record_stage(RESULTS_FOLDER, stage_manifest, "plots", outdated_stage_dic["plots"])
+
+def run_peptide_branch(RESULTS_FOLDER, DATABASE_NAME, sequence_store, DIGESTION_PARAMETERS, ZOOMS_MARKERS, THREADS, stage_manifest, outdated_stage_dic):
+    """
+    This function runs the outdated stages of the peptide branch: the in-silico digestion
+    and the ZooMS marker masses.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    - DIGESTION_PARAMETERS (Dictionary); A dictionary with the parameters of the in-silico
+      digestion. If the database is not digested, the variable is assigned as None.
+    - ZOOMS_MARKERS (String); The path to the ZooMS marker definition file. If no file is
+      specified, the variable is assigned as None.
+    - THREADS (Integer); The number of processes employed to digest the database.
+    - stage_manifest (Dictionary); A dictionary with the fingerprint of each stage run.
+    - outdated_stage_dic (Dictionary); A dictionary with the current fingerprint of each 
+      stage that has to be run.
+    """
+    if "digestion" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "digestion", [f"{RESULTS_FOLDER}/peptide_index"])
+        with profile_step("digestion", "stage", do_cprofile=True):
+            digest_proteins(RESULTS_FOLDER, DATABASE_NAME, DIGESTION_PARAMETERS, THREADS)
+        record_stage(RESULTS_FOLDER, stage_manifest, "digestion", outdated_stage_dic["digestion"])
+
+    if "zooms" in outdated_stage_dic:
+        remove_stage_outputs(RESULTS_FOLDER, stage_manifest, "zooms", [f"{RESULTS_FOLDER}/zooms_markers"])
+        with profile_step("zooms", "stage", do_cprofile=True):
+            zooms_marker_masses(RESULTS_FOLDER, sequence_store, ZOOMS_MARKERS)
+        record_stage(RESULTS_FOLDER, stage_manifest, "zooms", outdated_stage_dic["zooms"])
+
+def download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_export_json):
     """
     This function creates a multi-fasta protein database using the UniParc archive, a 
     non-redundant repository that contains all the proteins sequenced or predicted in 
     UniProt, NCBI, and other repositories. The search is focused on a specific taxonomic 
     group by a NCBI TaxID and can be restricted to a certain group of genes, indicated by
     a text file. Other specificities, such as the description of the protein header, can 
-    be seen in the README.md file. Additionally, 3 JSON files are ouput to store the extra 
+    be seen in the README.md file. Additionally, a SQLite file is ouput to store the extra 
     metadata of the repositories, species, and TaxID of each record in the database. The 
-    objective of these files is to store the cases of records associated with more than one
-    repository, species, or TaxID.
+    objective of this file is to store the cases of records associated with more than one
+    repository, species, or TaxID. The same metadata can also be exported as 3 JSON files.
     
     #INPUT
     - RESULTS_FOLDER (String); The folder's absolute path to write the output.
@@ -143,32 +757,157 @@ def download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, script_d
     - TAX_ID (Integer); The TaxID number employed to construct the multi-fasta database.
     - GENE_LIST (String); The path to the gene list employed to construct the multi-fasta.
       database. If no gene list is specified, the variable is assigned as None.
-    - script_directory_path (String); The absolute path to the scripts folder.
+    - do_export_json (Boolean); A boolean indicator to indicate if the extra 
+      metadata is also exported as JSON files.
+    #OUTPUT
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database
+      (see scripts/sequence_store.py). If no proteins are found, the variable is assigned as None.
     #WRITE OUTPUT
     - {DATABASE_NAME}.fasta; A multi-fasta protein database constructed following the
       search criteria for certain species and genes.
+    - .records_metadata.sqlite; A SQLite file containing the repositories, species, and 
+      TaxID metadata of each record, keyed by the UPI identifier.
     - .repos_metadata.json; A JSON file containing the metadata of the repositories used
+      (only if do_export_json = True).
     - .species_metadata.json; A JSON file containing the metadata of the species used
+      (only if do_export_json = True).
     - .taxid_metadata.json; A JSON file containing the metadata of the TaxID used
+      (only if do_export_json = True).
     """
 
-    # Download the proteins
+    # Parse the gene list file as a python list
     if GENE_LIST:
-        command_line_uniparc = f"python3 -u {script_directory_path}/uniparc_download.py \
-                --output-path {RESULTS_FOLDER} \
-                --output-name {DATABASE_NAME}\
-                --tax-id {TAX_ID} \
-                --genes {GENE_LIST}"
-        subprocess.run(command_line_uniparc, shell=True)
-    
+        with open(GENE_LIST, "rt") as gene_list_file:
+            gene_list = [gene.strip() for gene in gene_list_file if gene.strip()]
     elif not GENE_LIST:
-        command_line_uniparc = f"python3 -u {script_directory_path}/uniparc_download.py \
-                --output-path {RESULTS_FOLDER} \
-                --output-name {DATABASE_NAME}\
-                --tax-id {TAX_ID}"
-        subprocess.run(command_line_uniparc, shell=True)
+        gene_list = None
+
+    # Download the proteins
+    fasta_record_list = download_uniparc_database(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, gene_list, GENE_LIST, do_export_json)
+
+    if not fasta_record_list:
+        return None
+
+    # Keep the records as a sequence store instead of SeqIO objects
+    sequence_store = build_sequence_store_from_records(fasta_record_list)
+
+    return sequence_store
 
-def remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, script_directory_path):
+def pipelined_download_proteins(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_export_json, do_remove_redundancy, do_align_database, ALIGNER, ALIGN_TIMEOUT, THREADS):
+    """
+    This function downloads the multi-fasta protein database gene by gene, and removes the
+    redundant records and aligns each gene as soon as all its records are downloaded, while
+    the other genes are still downloading. After the download, the redundancy is removed 
+    from the whole database as in the sequential mode, and the few genes that lose records 
+    due to redundancy with other genes are aligned again (or their alignment is removed, if
+    they lose all their records), so the outputs are the same.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    - TAX_ID (Integer); The TaxID number employed to construct the multi-fasta database.
+    - GENE_LIST (String); The path to the gene list employed to construct the multi-fasta.
+    - do_export_json (Boolean); A boolean indicator to indicate if the extra 
+      metadata is also exported as JSON files.
+    - do_remove_redundancy (Boolean); A boolean indicator to indicate if the 
+      'remove redundancy' process happens.
+    - do_align_database (Boolean); A boolean indicator to indicate if the 
+      'align database' process happens.
+    - ALIGNER (String); The software employed to align the database per gene.
+    - ALIGN_TIMEOUT (Float); The maximum number of seconds to align a gene. If no 
+      timeout is specified, the variable is assigned as None.
+    - THREADS (Integer); The number of genes processed at the same time.
+    #OUTPUT
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the final
+      database. If no proteins are found, the variable is assigned as None.
+    #WRITE OUTPUT
+    - The outputs of download_proteins(), remove_redundancy() (if do_remove_redundancy = True)
+      and align_database_per_gene() (if do_align_database = True).
+    """
+
+    with open(GENE_LIST, "rt") as gene_list_file:
+        gene_list = [gene.strip() for gene in gene_list_file if gene.strip()]
+
+    if do_align_database and not os.path.exists(f"{RESULTS_FOLDER}/alignment_per_gene"):
+        os.mkdir(f"{RESULTS_FOLDER}/alignment_per_gene")
+
+    # Process each gene in a pool of threads, while the rest of genes are downloaded
+    gene_future_dic = {}
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+
+        def submit_gene(gene_name, gene_record_list):
+            gene_future_dic[gene_name] = executor.submit(process_gene_records, RESULTS_FOLDER, gene_name, gene_record_list, 
+                                                         do_remove_redundancy, do_align_database, ALIGNER, ALIGN_TIMEOUT)
+
+        fasta_record_list = download_uniparc_database(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, gene_list, GENE_LIST, do_export_json, submit_gene)
+        gene_aligned_dic = {gene_name: gene_future.result() for gene_name, gene_future in gene_future_dic.items()}
+
+    if not fasta_record_list:
+        return None
+
+    sequence_store = build_sequence_store_from_records(fasta_record_list)
+    del fasta_record_list # Free the SeqIO objects, the records are kept in the store
+
+    # Remove the redundancy between all the records, as some records can be redundant with records of other genes
+    if do_remove_redundancy:
+        sequence_store = remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, sequence_store)
+
+    # Align again the genes whose final records are not the aligned ones
+    if do_align_database:
+        realigned_count = 0
+        gene_index_dic = group_records_per_gene(sequence_store)
+        for gene_name, record_index_array in gene_index_dic.items():
+            if gene_aligned_dic.get(gene_name) != store_header_list(sequence_store, record_index_array):
+                align_gene_records(gene_name, sequence_store, record_index_array, f"{RESULTS_FOLDER}/alignment_per_gene", ALIGNER, ALIGN_TIMEOUT)
+                realigned_count += 1
+
+        # Remove the alignments of the genes whose records were all redundant with records of other genes
+        for gene_name in gene_aligned_dic.keys() - gene_index_dic.keys():
+            alignment_path = f"{RESULTS_FOLDER}/alignment_per_gene/{gene_name}_aligned.fasta"
+            if os.path.exists(alignment_path):
+                os.remove(alignment_path)
+
+        print(f"# Database aligned per gene name ({realigned_count} genes aligned again after removing the redundancy)")
+
+    return sequence_store
+
+def process_gene_records(RESULTS_FOLDER, gene_name, gene_record_list, do_remove_redundancy, do_align_database, ALIGNER, ALIGN_TIMEOUT):
+    """
+    This function removes the redundant records and aligns the records of a single gene,
+    as soon as they are downloaded.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - gene_name (String); The gene name of the records.
+    - gene_record_list (List); A list with the records of the gene, in SeqIO format.
+    - do_remove_redundancy (Boolean); A boolean indicator to indicate if the 
+      'remove redundancy' process happens.
+    - do_align_database (Boolean); A boolean indicator to indicate if the 
+      'align database' process happens.
+    - ALIGNER (String); The software employed to align the database per gene.
+    - ALIGN_TIMEOUT (Float); The maximum number of seconds to align a gene. If no 
+      timeout is specified, the variable is assigned as None.
+    #OUTPUT
+    - aligned_header_list (List); A list with the header of each aligned record, in order. If
+      the gene is not aligned, the variable is assigned as None.
+    #WRITE OUTPUT
+    - alignment_per_gene/{gene_name}_aligned.fasta; An aligned multi-fasta file with the 
+      records of the gene (only if do_align_database = True).
+    """
+    gene_store = build_sequence_store_from_records(gene_record_list)
+    record_index_array = np.arange(len(gene_record_list))
+
+    if do_remove_redundancy:
+        record_index_array = filter_redundant_records(gene_store, record_index_array)[0]
+
+    if not do_align_database:
+        return None
+
+    align_gene_records(gene_name, gene_store, record_index_array, f"{RESULTS_FOLDER}/alignment_per_gene", ALIGNER, ALIGN_TIMEOUT)
+
+    return store_header_list(gene_store, record_index_array)
+
+def remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, sequence_store):
     """
     This function removes duplicate and substring records from the  
     database multi-fasta file, based on the amino acid sequence.
@@ -176,7 +915,9 @@ def remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, script_directory_path):
     #INPUT
     - RESULTS_FOLDER (String); The folder's absolute path to write the output.
     - DATABASE_NAME (String); The name of the database file and folder.
-    - script_directory_path (String); The absolute path to the scripts folder.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    #OUTPUT
+    - no_redundant_store (Dictionary); A dictionary with the arrays of the non-redundant records.
     #WRITE OUTPUT
     - fasta_remove_redundancy/unfiltered_database.fasta; The unfiltered version 
       of the multi-fasta protein database. 
@@ -186,17 +927,82 @@ def remove_redundancy(RESULTS_FOLDER, DATABASE_NAME, script_directory_path):
     """
     
     # Remove redundant records
-    command_line_remove_redundancy = f"python3 -u {script_directory_path}/remove_redundant_records.py \
-            --input-path {RESULTS_FOLDER}/{DATABASE_NAME} \
-            --output-path {RESULTS_FOLDER} \
-            --output-folder-name fasta_remove_redundancy"
-    subprocess.run(command_line_remove_redundancy, shell=True)
+    no_redundant_index_array = remove_redundant_records(sequence_store, f"{RESULTS_FOLDER}/fasta_remove_redundancy")
     
     # Move the unifiltered database and the redundant records to the 'fasta_remove_redundancy' folder
-    os.system(f"mv {RESULTS_FOLDER}/{DATABASE_NAME} {RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta")
-    os.system(f"mv {RESULTS_FOLDER}/fasta_remove_redundancy/filtered_database.fasta {RESULTS_FOLDER}/{DATABASE_NAME}")
+    os.replace(f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/fasta_remove_redundancy/unfiltered_database.fasta")
+    os.replace(f"{RESULTS_FOLDER}/fasta_remove_redundancy/filtered_database.fasta", f"{RESULTS_FOLDER}/{DATABASE_NAME}")
+
+    # Keep only the non-redundant records in memory
+    no_redundant_store = subset_sequence_store(sequence_store, no_redundant_index_array)
+
+    return no_redundant_store
+
+def index_database(RESULTS_FOLDER, DATABASE_NAME, do_bgzip):
+    """
+    This function indexes the final multi-fasta database in the samtools faidx format, so
+    single records can be retrieved by their UPI without reading the whole file (see 
+    scripts/fasta_index.py). Optionally, the database is also compressed in BGZF format.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    - do_bgzip (Boolean); A boolean indicator to indicate if the database is also compressed
+      in BGZF format.
+    #WRITE OUTPUT
+    - {DATABASE_NAME}.fai; The faidx index of the multi-fasta database.
+    - {DATABASE_NAME}.gz; The BGZF compressed multi-fasta database (only if do_bgzip).
+    - {DATABASE_NAME}.gz.fai and {DATABASE_NAME}.gz.gzi; The faidx index and the BGZF 
+      block index of the compressed database (only if do_bgzip).
+    """
+
+    # Index the database, and compress it if requested
+    write_fasta_index(f"{RESULTS_FOLDER}/{DATABASE_NAME}", do_bgzip)
 
-def align_database_per_gene(RESULTS_FOLDER, DATABASE_NAME, script_directory_path):
+def digest_proteins(RESULTS_FOLDER, DATABASE_NAME, DIGESTION_PARAMETERS, THREADS):
+    """
+    This function digests in-silico the final multi-fasta database, and writes a peptide-mass
+    index with the proteins containing each peptide, so LC-MS/MS search engines can read the
+    peptides instead of digesting the database in each run (see scripts/digest_database.py).
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - DATABASE_NAME (String); The name of the database file and folder.
+    - DIGESTION_PARAMETERS (Dictionary); A dictionary with the enzyme, missed cleavages, 
+      peptide length and mass windows of the in-silico digestion.
+    - THREADS (Integer); The number of processes employed to digest the database.
+    #WRITE OUTPUT
+    - peptide_index/masses.npy; The sorted monoisotopic mass of each unique peptide.
+    - peptide_index/peptide_sequences.npy and peptide_offsets.npy; The peptide sequences.
+    - peptide_index/postings.npy and posting_offsets.npy; The proteins of each peptide.
+    - peptide_index/proteins.txt; The name of each protein record.
+    - peptide_index/digestion_parameters.json; The parameters of the digestion.
+    """
+
+    # Digest the database and write the peptide index
+    digest_database(f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/peptide_index", DIGESTION_PARAMETERS, THREADS)
+
+def zooms_marker_masses(RESULTS_FOLDER, sequence_store, ZOOMS_MARKERS):
+    """
+    This function computes the theoretical masses of the ZooMS marker peptides of each 
+    species in the database, with their oxidation and deamidation variants. The homologous
+    peptide of each marker is searched in the records of its gene (see scripts/zooms_markers.py).
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    - ZOOMS_MARKERS (String); The path to the ZooMS marker definition file.
+    #WRITE OUTPUT
+    - zooms_markers/marker_peptides.csv; A CSV file with the mass and m/z of each species, 
+      marker, peptide and variant.
+    - zooms_markers/species_marker_mz.csv; A CSV file with the [M+H]+ m/z of the main variant
+      of each marker (columns) per species (rows).
+    """
+
+    # Compute the marker masses per species
+    compute_zooms_markers(sequence_store, ZOOMS_MARKERS, f"{RESULTS_FOLDER}/zooms_markers")
+
+def align_database_per_gene(RESULTS_FOLDER, sequence_store, ALIGNER, ALIGN_TIMEOUT):
     """
     This function generates an aligned multi-fasta file per each different 
     gene present in a multi-fasta. To do so, the header format should indicate 
@@ -205,27 +1011,43 @@ def align_database_per_gene(RESULTS_FOLDER, DATABASE_NAME, script_directory_path
 
     #INPUT
     - RESULTS_FOLDER (String); The folder's absolute path to write the output.
-    - DATABASE_NAME (String); The name of the database file and folder.
-    - script_directory_path (String); The absolute path to the scripts folder.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+    - ALIGNER (String); The software employed to align the database per gene.
+    - ALIGN_TIMEOUT (Float); The maximum number of seconds to align a gene. If no 
+      timeout is specified, the variable is assigned as None.
     #WRITE OUTPUT
     - aligned_database/{gene_name}_aligned.fasta; An aligned multi-fasta file in 
       mafft format per each gene present in the protein database.
     """
 
     # Align the database per each gene name
-    align_database_command_line = f"python3 -u {script_directory_path}/align_database_per_gene.py \
-               --input-path {RESULTS_FOLDER}/{DATABASE_NAME} \
-               --output-path {RESULTS_FOLDER} \
-               --output-folder-name alignment_per_gene"
-    subprocess.run(align_database_command_line, shell=True)
+    align_records_per_gene(sequence_store, f"{RESULTS_FOLDER}/alignment_per_gene", ALIGNER, ALIGN_TIMEOUT)
+
+def alignment_quality_control(RESULTS_FOLDER):
+    """
+    This function evaluates the quality of each record in the alignments per gene. 
+    The gap fraction, X fraction, identity to the consensus and an outlier score are 
+    computed per each record, to detect bad-quality records automatically.
+
+    #INPUT
+    - RESULTS_FOLDER (String); The folder's absolute path to write the output.
+    #WRITE OUTPUT
+    - alignment_qc/records_qc.csv; A CSV file with the quality features of each 
+      aligned record, ranked by the outlier score.
+    - alignment_qc/excluded_records.txt; A text file with the records flagged as
+      potential bad-quality records.
+    """
+
+    # Evaluate the alignments per gene
+    evaluate_alignments(f"{RESULTS_FOLDER}/alignment_per_gene", f"{RESULTS_FOLDER}/alignment_qc", do_exclusion_list=True)
 
-def produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_ignore_json, script_directory_path):
+def produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, sequence_store, do_ignore_json, THREADS):
     """
     This function generates metadata files with information about a multi-fasta protein 
     database outputed from the uniparc_download.py script. The software only generates 
     the "genes_NOT_retrieved.csv" file if a gene list has been specified. It also might combine
     the information present within the database with the information present in the JSON files
-    generated during the download step (if do_ignore_json = False). These JSON files contain the 
+    generated during the download step (if do_ignore_json = False). These files contain the 
     repositories, species, and TaxID metadata of each record in the database, as there might be
     more than one value per record in these features.
 
@@ -235,9 +1057,14 @@ def produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_ignore
     - TAX_ID (Integer); The TaxID number employed to construct the multi-fasta database.
     - GENE_LIST (String); The path to the gene list employed to construct the multi-fasta.
       database. If no gene list is specified, the variable is assigned as None.
+    - sequence_store (Dictionary); A dictionary with the arrays of the records in the database (see scripts/sequence_store.py).
+      Their headers and sequences are parsed directly, instead of reading the database again.
     - do_ignore_json (Boolean); A boolean indicator to indicate if the
       'ignore JSON files' process happens.
-    - script_directory_path (String); The absolute path to the scripts folder.
+    - THREADS (Integer); The number of processes employed to parse the database headers.
+    #OUTPUT
+    - record_info_df (pd.DataFrame); A dataframe containing all the information present 
+      in each record header. If the metadata files are not found, the variable is assigned as None.
     #WRITE OUTPUT
     - metadata/summary.txt; A text file with a summary of all the metadata information 
       retrieved from the multi-fasta database. It also shows the paths to all the other files.
@@ -246,7 +1073,8 @@ def produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_ignore
       specified.
     - metadata/records_info.csv; A CSV file that contains all the information present in each 
       record header. See the README.md file for a detailed description of the header 
-      information.
+      information. It also contains the length, monoisotopic mass, X fraction and isoelectric
+      point of each sequence.
     - metadata/genes_retrieved.csv; A CSV file that contains the number of genes retrieved.
     - metadata/species_retrieved.csv; A CSV file that contains the number of species retrieved, 
       indicating the scientific name and the TaxID.
@@ -256,40 +1084,22 @@ def produce_metadata(RESULTS_FOLDER, DATABASE_NAME, TAX_ID, GENE_LIST, do_ignore
       species.
     """
 
-    if do_ignore_json:
-        ignore_json = "--ignore-json"
-    elif not do_ignore_json:
-        ignore_json = "--no-ignore-json"
+    # Generate metadata files, parsing the headers and sequences of the records already in memory
+    record_info_df = metadata_proteoparc.produce_metadata(f"{RESULTS_FOLDER}/{DATABASE_NAME}", f"{RESULTS_FOLDER}/metadata", TAX_ID, GENE_LIST,
+                                                          do_ignore_json, THREADS, sequence_store=sequence_store)
 
-    # Generate metadata files, whether there is or not a gene list
-    if GENE_LIST:
-        metadata_command_line = f"python3 -u {script_directory_path}/metadata_proteoparc.py \
-                --input-path {RESULTS_FOLDER}/{DATABASE_NAME} \
-                --output-path {RESULTS_FOLDER} \
-                --output-folder-name metadata \
-                --genes {GENE_LIST} \
-                --tax-id {TAX_ID} \
-                {ignore_json}"
-        subprocess.run(metadata_command_line, shell=True)
-
-    elif not GENE_LIST:
-        metadata_command_line = f"python3 -u {script_directory_path}/metadata_proteoparc.py \
-                --input-path {RESULTS_FOLDER}/{DATABASE_NAME} \
-                --output-path {RESULTS_FOLDER} \
-                --output-folder-name metadata \
-                --tax-id {TAX_ID} \
-                {ignore_json}"
-        subprocess.run(metadata_command_line, shell=True)
+    return record_info_df
 
-def plot_metadata(RESULTS_FOLDER, GENE_LIST, script_directory_path):
+def plot_metadata(RESULTS_FOLDER, GENE_LIST, PLOT_BACKEND, script_directory_path):
     """
     This function plots the frequency and presence of the species and genes
-    retrieved in the multi-fasta database.
+    retrieved in the multi-fasta database, with R or matplotlib.
 
     #INPUT
     - RESULTS_FOLDER (String); The folder's absolute path to write the output.
     - GENE_LIST (String); The path to the gene list employed to construct the multi-fasta.
       database. If no gene list is specified, the variable is assigned as None.
+    - PLOT_BACKEND (String); The software employed to plot the metadata (R or python).
     - script_directory_path (String); The absolute path to the scripts folder.
     #WRITE OUTPUT
     - metadata/plots/species_per_gene_barplot.jpg; A barplot representing the
@@ -298,10 +1108,17 @@ def plot_metadata(RESULTS_FOLDER, GENE_LIST, script_directory_path):
       presence or absence of each gene name per species.
     """
 
+    # Generate both plots with matplotlib
+    if PLOT_BACKEND == "python":
+        species_gene_df = pd.read_csv(f"{RESULTS_FOLDER}/metadata/species_genes.csv", keep_default_na=False)
+        metadata_proteoparc.write_metadata_plots(species_gene_df, f"{RESULTS_FOLDER}/metadata", GENE_LIST)
+        return
+
     # Generate barplot
     barplot_command_line = f"Rscript {script_directory_path}/proteoparc_barplot.R \
               {RESULTS_FOLDER}/metadata/species_genes.csv"
-    subprocess.run(barplot_command_line, shell=True)
+    with profile_step("Rscript_barplot"):
+        subprocess.run(barplot_command_line, shell=True)
     
     # Generate grid
     if GENE_LIST:
@@ -311,12 +1128,16 @@ def plot_metadata(RESULTS_FOLDER, GENE_LIST, script_directory_path):
  
     grid_command_line = f"Rscript {script_directory_path}/proteoparc_grid.R \
               {RESULTS_FOLDER}/metadata/species_genes.csv {gene_list_arg}"
-    subprocess.run(grid_command_line, shell=True)
+    with profile_step("Rscript_grid"):
+        subprocess.run(grid_command_line, shell=True)
     
     # Store the plots in a folder
     if not os.path.exists(f"{RESULTS_FOLDER}/metadata/plots"):
         os.mkdir(f"{RESULTS_FOLDER}/metadata/plots")
 
-    os.system(f"mv {RESULTS_FOLDER}/metadata/*.jpg {RESULTS_FOLDER}/metadata/plots")
+    for plot_file_name in os.listdir(f"{RESULTS_FOLDER}/metadata"):
+        if plot_file_name.endswith(".jpg"):
+            os.replace(f"{RESULTS_FOLDER}/metadata/{plot_file_name}", f"{RESULTS_FOLDER}/metadata/plots/{plot_file_name}")
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,8 +1,11 @@
 # Global imports
 import os
+import signal
 import argparse
 import subprocess
-from Bio import SeqIO
+from pipeline_profiler import profile_step
+from sequence_store import group_records_per_gene, format_store_fasta
+from global_store import reuse_gene_artifact, store_gene_artifact
 
 # Script information - Written in Python 3.9.12 - May 2024
 __author__ = "Guillermo Carrillo Martin"
@@ -13,24 +16,104 @@ __email__ = "guillermo.carrillo@upf.edu"
 This script generates an aligned multi-fasta file per each different gene name present
 in a multi-fasta. To do so, the header format should indicate the gene name before 
 the string "GN=". mafft v7.525 has been to choosen to build each alignment, under the
---auto parameter.
+--auto parameter, although other aligners can be selected with --aligner.
+
+The records of each gene are piped to the aligner through the standard input and the
+alignment is read from the standard output, so no temporary files are written. Only
+the byte offsets of the records are kept in memory while splitting the multi-fasta.
+If a global store is configured (see global_store.py), a gene with the same records and
+aligner as a gene aligned in another project reuses its stored alignment.
 """
 
+# Command line of each supported aligner. All of them read the multi-fasta
+# from the standard input and write the alignment to the standard output.
+ALIGNER_COMMANDS = {
+    "mafft": ["mafft", "--auto", "--quiet", "-"],
+    "clustalo": ["clustalo", "--infile=-", "--seqtype=Protein", "--outfmt=fasta"]
+}
+
 def main():
 
+    fasta_real_path, output_folder_realpath, aligner, timeout = parser()
+
+    align_fasta_per_gene(fasta_real_path, output_folder_realpath, aligner, timeout)
+
+def align_fasta_per_gene(fasta_real_path, output_folder_realpath, aligner="mafft", timeout=None):
+    """
+    This function aligns a multi-fasta file per each different gene name. The records of 
+    each gene are read straight from the file, so the whole database is never stored in memory.
+
+    #INPUT
+    - fasta_real_path (string); The path to the input multi-fasta file.
+    - output_folder_realpath (string); The path to the folder where the alignments will be stored.
+    - aligner (string); The name of the software employed to build the alignments.
+    - timeout (float); The maximum number of seconds to align a gene. If None, there
+      is no time limit.
+    #WRITE OUTPUT
+    - {gene}_aligned.fasta; An aligned multi-fasta file per each gene name.
+    """
+
     print("# Aligning database per gene name")
-    fasta_real_path, output_folder_realpath = parser()
 
     if not os.path.exists(output_folder_realpath):
         os.mkdir(output_folder_realpath)
 
-    # Split the multi-fasta into different files based on gene names
-    per_gene_fasta_path_list = split_fasta_per_gene(fasta_real_path, output_folder_realpath)
+    # Index the multi-fasta records based on gene names
+    gene_offsets_dic = split_fasta_per_gene(fasta_real_path)
+
+    # Align each different gene, reading its records straight from the multi-fasta
+    for gene_name, record_offset_list in gene_offsets_dic.items():
+        gene_fasta = read_gene_records(fasta_real_path, record_offset_list)
+        alignment_path = f"{output_folder_realpath}/{gene_name}_aligned.fasta"
+        multi_fasta_aligner(gene_fasta, alignment_path, aligner, timeout)
 
-    # Align each different gene-multi-fasta
-    for gene_fasta_path in per_gene_fasta_path_list:
-        multi_fasta_aligner(gene_fasta_path)
-        os.remove(gene_fasta_path)
+def align_records_per_gene(sequence_store, output_folder_realpath, aligner="mafft", timeout=None):
+    """
+    This function aligns the records of a sequence store, already loaded in memory, per each
+    different gene name. It is employed when the records are passed from the previous steps of
+    the pipeline, so the multi-fasta file is not read again.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records (see sequence_store.py).
+    - output_folder_realpath (string); The path to the folder where the alignments will be stored.
+    - aligner (string); The name of the software employed to build the alignments.
+    - timeout (float); The maximum number of seconds to align a gene. If None, there
+      is no time limit.
+    #WRITE OUTPUT
+    - {gene}_aligned.fasta; An aligned multi-fasta file per each gene name.
+    """
+
+    print("# Aligning database per gene name")
+
+    if not os.path.exists(output_folder_realpath):
+        os.mkdir(output_folder_realpath)
+
+    # Group the record indices per gene name. Records without a gene name are skipped
+    gene_index_dic = group_records_per_gene(sequence_store)
+
+    # Align each different gene, writing its records as a multi-fasta in memory
+    for gene_name, record_index_array in gene_index_dic.items():
+        align_gene_records(gene_name, sequence_store, record_index_array, output_folder_realpath, aligner, timeout)
+
+def align_gene_records(gene_name, sequence_store, record_index_array, output_folder_realpath, aligner="mafft", timeout=None):
+    """
+    This function aligns the records of a single gene, already loaded in memory. It allows
+    aligning each gene as soon as its records are available (e.g. while other genes are 
+    still being downloaded).
+
+    #INPUT
+    - gene_name (string); The gene name of the records.
+    - sequence_store (dictionary); A dictionary with the arrays of the records.
+    - record_index_array (np.ndarray); The indices of the records of the gene.
+    - output_folder_realpath (string); The path to an existing folder where the alignment will be stored.
+    - aligner (string); The name of the software employed to build the alignment.
+    - timeout (float); The maximum number of seconds to align the gene. If None, there
+      is no time limit.
+    #WRITE OUTPUT
+    - {gene}_aligned.fasta; An aligned multi-fasta file with the records of the gene.
+    """
+    alignment_path = f"{output_folder_realpath}/{gene_name}_aligned.fasta"
+    multi_fasta_aligner(format_store_fasta(sequence_store, record_index_array), alignment_path, aligner, timeout)
 
 def parser():
     """
@@ -39,11 +122,16 @@ def parser():
     #OUTPUT
     - fasta_real_path (string); The path to the input multi-fasta file.
     - output_folder_path (string); The path to an existing folder where the alignments will be stored.
+    - aligner (string); The name of the software employed to build the alignments.
+    - timeout (float); The maximum number of seconds to align a gene. If no timeout is 
+      specified, the variable is assigned as None.
     """
     parser = argparse.ArgumentParser(description="A script to align a multi-fasta file per each annotated gene")
     parser.add_argument("--input-path", dest="input_path", type=str, help="The path to the input multi-fasta", required=True, nargs=1)
     parser.add_argument("--output-path", dest="output_path", type=str, help="The path to write the folder storing the alignments (default: working directory)", required=False, default=["."], nargs=1)
     parser.add_argument("--output-folder-name", dest="output_folder_name", type=str, help="The name of the folder storing the alignments (default: alignment_per_gene)", required=False, default=["alignment_per_gene"], nargs=1)
+    parser.add_argument("--aligner", dest="aligner", type=str, help="The software employed to align each gene (default: mafft)", required=False, default=["mafft"], choices=list(ALIGNER_COMMANDS), nargs=1)
+    parser.add_argument("--timeout", dest="timeout", type=float, help="The maximum number of seconds to align a gene (not mandatory)", required=False, default=[None], nargs=1)
 
     args = parser.parse_args()
 
@@ -53,59 +141,145 @@ def parser():
 
     output_folder_realpath = f"{output_path}/{output_folder_name}"
 
-    return fasta_real_path, output_folder_realpath
+    aligner = args.aligner[0]
+    timeout = args.timeout[0]
+
+    return fasta_real_path, output_folder_realpath, aligner, timeout
 
-def split_fasta_per_gene(fasta_real_path, output_folder_realpath):
+def split_fasta_per_gene(fasta_real_path):
     """
-    This function splits a multi-fasta into different gene multi-fasta (temporary) files.
+    This function splits a multi-fasta per gene name in a streaming way. Instead of storing
+    the records, it stores the position (byte offset and length) of each record in the file.
     To do so, the header format should indicate the gene name before the string "GN=".
     
     #INPUT
     - fasta_real_path (string); The path to the input multi-fasta file.
-    - output_folder_path (string); The path to an existing folder where the alignments will be stored.
     #OUTPUT
-    - per_gene_fasta_path_list (list); A list containing the path of each gene multi-fasta.
-    #WRITE OUTPUT
-    - {gene}.temp; A multi-fasta file with all the records belonging to a certain gene.
+    - gene_offsets_dic (dictionary); A dictionary with the gene names as keys and a list 
+      of (offset, length) tuples as values, one per each record belonging to the gene.
+    """
+
+    gene_offsets_dic = {}
+    gene_name = None
+    record_start = 0
+    offset = 0
+
+    # Read each line from the input multi-fasta file, keeping track of the byte position
+    with open(fasta_real_path, "rb") as fasta_file:
+        for line in fasta_file:
+
+            if line.startswith(b">"):
+                # Store the position of the previous record
+                if gene_name:
+                    gene_offsets_dic.setdefault(gene_name, []).append((record_start, offset - record_start))
+
+                # Extract gene name. Records without a gene name are skipped
+                gene_name = retrieve_gene_name(line.decode())
+                record_start = offset
+
+            offset += len(line)
+
+    # Store the position of the last record
+    if gene_name:
+        gene_offsets_dic.setdefault(gene_name, []).append((record_start, offset - record_start))
+
+    return gene_offsets_dic
+
+def retrieve_gene_name(header):
+    """
+    This function extracts the gene name from a fasta header, indicated after the string "GN=".
+    
+    #INPUT
+    - header (string); A fasta header, formatted from the uniparc_download.py script.
+    #OUTPUT
+    - gene_name (string); The gene name of the record. If the header does not have a gene
+      name, the variable is assigned as None.
     """
 
-    gene_records_dic = {}
-    per_gene_fasta_path_list = []
+    if not "GN=" in header:
+        return None
 
-    # Read each record from the input multi-fasta file
-    for record in SeqIO.parse(fasta_real_path, "fasta"):
-        
-        # Skip the record if it does not have a gene name
-        if not "GN=" in record.description:
-            continue
+    gene_name = header.split("GN=")[1].split()[0]
 
-        # Extract gene name
-        gene_name = record.description.split("GN=")[1].split()[0]
-        
-        # Sort the record in a dictionary. The gene name of the header acts as the key
-        if gene_name not in gene_records_dic:
-            gene_records_dic[gene_name] = []
-        gene_records_dic[gene_name].append(record)
+    return gene_name
 
-    # Write in a multi-fasta the sorted records per each gene name and store the file path into a list
-    for gene_name, record_list in gene_records_dic.items():
-        per_gene_fasta_path_list.append(f"{output_folder_realpath}/{gene_name}.temp")
-        SeqIO.write(record_list, f"{output_folder_realpath}/{gene_name}.temp", "fasta")
+def read_gene_records(fasta_real_path, record_offset_list):
+    """
+    This function reads from a multi-fasta the records belonging to a certain gene,
+    based on their position in the file.
+    
+    #INPUT
+    - fasta_real_path (string); The path to the input multi-fasta file.
+    - record_offset_list (list); A list of (offset, length) tuples, one per each record.
+    #OUTPUT
+    - gene_fasta (bytes); A multi-fasta with all the records belonging to the gene.
+    """
+
+    record_list = []
+
+    with open(fasta_real_path, "rb") as fasta_file:
+        for record_start, record_length in record_offset_list:
+            fasta_file.seek(record_start)
+            record = fasta_file.read(record_length)
 
-    return per_gene_fasta_path_list
+            # Ensure each record ends with a new line (last record of the file)
+            if not record.endswith(b"\n"):
+                record += b"\n"
+            record_list.append(record)
 
-def multi_fasta_aligner(multi_fasta_path):
+    gene_fasta = b"".join(record_list)
+
+    return gene_fasta
+
+def multi_fasta_aligner(gene_fasta, alignment_path, aligner="mafft", timeout=None):
     """
-    This function aligns a multi-fasta file by the mafft software. It has been tested using
-    mafft v7.525.
+    This function aligns a multi-fasta by the selected aligner software. The records are
+    sent through the standard input and the alignment is read from the standard output.
+    mafft v7.525 has been tested as the default aligner. If the aligner fails or exceeds
+    the timeout, the gene is skipped and a warning is printed. The alignment is reused from
+    the global store if the same records were aligned before with the same aligner.
     
     #INPUT
-    - multi_fasta_path (string); The path to the multi-fasta file.
+    - gene_fasta (bytes); A multi-fasta with all the records belonging to a gene.
+    - alignment_path (string); The path to write the aligned multi-fasta file.
+    - aligner (string); The name of the software employed to build the alignment.
+    - timeout (float); The maximum number of seconds to align the gene. If None, there
+      is no time limit.
     #WRITE OUTPUT
-    - {gene}_aligned.fasta; An aligned multi-fasta file in mafft alignment format.
+    - {gene}_aligned.fasta; An aligned multi-fasta file in multi-fasta alignment format.
     """
 
-    alignment_path = multi_fasta_path.replace(".temp", "_aligned.fasta")
-    subprocess.run(f"mafft --auto --quiet {multi_fasta_path} > {alignment_path}", shell=True)
+    gene_name = os.path.basename(alignment_path).replace("_aligned.fasta", "")
+    aligner_parameters = " ".join(ALIGNER_COMMANDS[aligner])
+
+    if reuse_gene_artifact("alignment", aligner_parameters, gene_fasta, alignment_path):
+        return
+
+    # The aligner runs in its own process group, as mafft is a script that starts other processes
+    try:
+        with profile_step(aligner, gene=gene_name):
+            aligner_process = subprocess.Popen(ALIGNER_COMMANDS[aligner], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+            try:
+                alignment_stdout, _ = aligner_process.communicate(input=gene_fasta, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(aligner_process.pid, signal.SIGKILL)
+                aligner_process.communicate()
+                print(f"WARNING: {gene_name} alignment exceeded {timeout} seconds and was skipped")
+                return
+    except FileNotFoundError:
+        print(f"WARNING: {aligner} not found, {gene_name} alignment was skipped")
+        return
+
+    if aligner_process.returncode != 0:
+        print(f"WARNING: {gene_name} alignment failed and was skipped")
+        return
+
+    # Replace the alignment instead of writing over it, as it can be shared with other projects
+    with open(f"{alignment_path}.tmp", "wb") as alignment_file:
+        alignment_file.write(alignment_stdout)
+    os.replace(f"{alignment_path}.tmp", alignment_path)
+
+    store_gene_artifact("alignment", aligner_parameters, gene_fasta, alignment_path)
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# Global imports
+import os
+import re
+import glob
+import argparse
+import numpy as np
+import pandas as pd
+from Bio import SeqIO
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script evaluates the quality of each record in the alignments generated by
+align_database_per_gene.py, so bad-quality records can be detected without reviewing
+each alignment by hand. Each alignment is loaded as a NumPy character matrix (one row 
+per record, one column per alignment position) and the following features are computed
+per record:
+
+1. Gap fraction; The proportion of alignment positions with a gap ("-").
+
+2. X fraction; The proportion of residues that are unknown amino acids ("X").
+
+3. Identity to consensus; The proportion of residues that are equal to the most 
+   frequent residue of their alignment column.
+
+4. Outlier score; A robust z-score (based on the median and the median absolute 
+   deviation) of the identity to consensus of the record, compared with the other 
+   records of the same gene. The higher the score, the more different the record is
+   from the rest of the alignment. Gaps are not penalized, as fragment records are 
+   expected in the alignments.
+
+The results are written as a CSV table, ranked by the outlier score. Optionally, a text 
+file with the records that exceed the outlier score or X fraction thresholds is written.
+"""
+
+def main():
+
+    alignment_folder_path, output_folder_path, do_exclusion_list, outlier_threshold, max_x_fraction = parser()
+
+    evaluate_alignments(alignment_folder_path, output_folder_path, do_exclusion_list, outlier_threshold, max_x_fraction)
+
+def evaluate_alignments(alignment_folder_path, output_folder_path, do_exclusion_list=False, outlier_threshold=3.5, max_x_fraction=0.5):
+    """
+    This function runs the whole quality control step: it computes the quality features of
+    each record in the alignments of a folder, flags the potential bad-quality records, and
+    writes the results.
+
+    #INPUT
+    - alignment_folder_path (string); The path to the folder storing the alignments.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    - do_exclusion_list (boolean); A boolean indicator to indicate if the list of flagged
+      records is written.
+    - outlier_threshold (float); The outlier score above which a record is flagged.
+    - max_x_fraction (float); The X fraction above which a record is flagged.
+    #OUTPUT
+    - records_qc_df (pd.DataFrame); A dataframe with the quality features of each record,
+      ranked by the outlier score. If no alignments are found, the variable is assigned as None.
+    #WRITE OUTPUT
+    - records_qc.csv; A CSV file with the quality features of each record.
+    - excluded_records.txt; A text file with the flagged records (if do_exclusion_list = True).
+    """
+
+    print("# Evaluating the quality of the alignments")
+
+    if not os.path.exists(output_folder_path):
+        os.mkdir(output_folder_path)
+
+    # Compute the quality features of each alignment
+    gene_qc_df_list = []
+    for alignment_path in sorted(glob.glob(f"{alignment_folder_path}/*_aligned.fasta")):
+        gene_name = os.path.basename(alignment_path).replace("_aligned.fasta", "")
+        record_id_list, alignment_matrix = read_alignment_matrix(alignment_path)
+
+        if not record_id_list:
+            continue
+
+        gene_qc_df_list.append(compute_alignment_qc(gene_name, record_id_list, alignment_matrix))
+
+    if not gene_qc_df_list:
+        print("   No alignments found")
+        return None
+
+    # Flag and rank the records
+    records_qc_df = pd.concat(gene_qc_df_list, ignore_index=True)
+    records_qc_df = write_records_qc_csv(records_qc_df, output_folder_path, outlier_threshold, max_x_fraction)
+
+    if do_exclusion_list:
+        write_excluded_records_txt(records_qc_df, output_folder_path)
+
+    print(f"   {records_qc_df['Flagged'].sum()} records flagged as potential bad-quality records")
+
+    return records_qc_df
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+    
+    #OUTPUT
+    - alignment_folder_path (string); The path to the folder storing the alignments.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    - do_exclusion_list (boolean); A boolean indicator to indicate if the list of flagged
+      records is written.
+    - outlier_threshold (float); The outlier score above which a record is flagged.
+    - max_x_fraction (float); The X fraction above which a record is flagged.
+    """
+    parser = argparse.ArgumentParser(description="A script to evaluate the quality of each record in the alignments per gene")
+    parser.add_argument("--input-path", dest="input_path", type=str, help="The path to the folder storing the alignments", required=True, nargs=1)
+    parser.add_argument("--output-path", dest="output_path", type=str, help="The path to write the folder storing the results (default: working directory)", required=False, default=["."], nargs=1)
+    parser.add_argument("--output-folder-name", dest="output_folder_name", type=str, help="The name of the folder storing the results (default: alignment_qc)", required=False, default=["alignment_qc"], nargs=1)
+    parser.add_argument("--exclusion-list", dest="exclusion_list", action=argparse.BooleanOptionalAction, help="Write a list with the flagged records (default: False; --no-exclusion-list)", default=False, required=False)
+    parser.add_argument("--outlier-threshold", dest="outlier_threshold", type=float, help="The outlier score above which a record is flagged (default: 3.5)", required=False, default=[3.5], nargs=1)
+    parser.add_argument("--max-x-fraction", dest="max_x_fraction", type=float, help="The X fraction above which a record is flagged (default: 0.5)", required=False, default=[0.5], nargs=1)
+
+    args = parser.parse_args()
+
+    alignment_folder_path = os.path.realpath(args.input_path[0])
+    output_path = os.path.realpath(args.output_path[0])
+    output_folder_name = args.output_folder_name[0]
+
+    output_folder_path = f"{output_path}/{output_folder_name}"
+
+    do_exclusion_list = args.exclusion_list
+    outlier_threshold = args.outlier_threshold[0]
+    max_x_fraction = args.max_x_fraction[0]
+
+    return alignment_folder_path, output_folder_path, do_exclusion_list, outlier_threshold, max_x_fraction
+
+def read_alignment_matrix(alignment_path):
+    """
+    This function reads an aligned multi-fasta file as a NumPy character matrix.
+    
+    #INPUT
+    - alignment_path (string); The path to the aligned multi-fasta file.
+    #OUTPUT
+    - record_id_list (list); A list with the header identifier of each record.
+    - alignment_matrix (np.ndarray); A 2D matrix of uint8 character codes, with one
+      row per record and one column per alignment position.
+    """
+    record_id_list = []
+    sequence_list = []
+
+    for record in SeqIO.parse(alignment_path, "fasta"):
+        record_id_list.append(record.id)
+        sequence_list.append(str(record.seq).upper().encode())
+
+    if not record_id_list:
+        return record_id_list, np.zeros((0, 0), dtype=np.uint8)
+
+    # Skip the files that are not aligned (e.g. an aligner error left the records unaligned)
+    alignment_length = len(sequence_list[0])
+    if any(len(sequence) != alignment_length for sequence in sequence_list):
+        print(f"WARNING: The records in '{os.path.basename(alignment_path)}' are not aligned, skipping the file")
+        return [], np.zeros((0, 0), dtype=np.uint8)
+
+    alignment_matrix = np.frombuffer(b"".join(sequence_list), dtype=np.uint8).reshape(len(sequence_list), alignment_length)
+
+    return record_id_list, alignment_matrix
+
+def robust_z_score(values, min_deviation=0.01):
+    """
+    This function computes the robust z-score of each value of an array, using the
+    median and the median absolute deviation (MAD). The MAD is bounded by a minimum 
+    deviation, so tiny differences within near-identical alignments are not scored 
+    as outliers.
+    
+    #INPUT
+    - values (np.ndarray); A 1D array of values.
+    - min_deviation (float); The minimum MAD employed to compute the z-score.
+    #OUTPUT
+    - z_score (np.ndarray); A 1D array with the robust z-score of each value.
+    """
+    median = np.median(values)
+    mad = max(np.median(np.abs(values - median)), min_deviation)
+    z_score = 0.6745 * (values - median) / mad
+
+    return z_score
+
+def compute_alignment_qc(gene_name, record_id_list, alignment_matrix):
+    """
+    This function computes the quality features of each record in an alignment, in 
+    vectorized form.
+    
+    #INPUT
+    - gene_name (string); The gene name of the alignment.
+    - record_id_list (list); A list with the header identifier of each record.
+    - alignment_matrix (np.ndarray); A 2D matrix of uint8 character codes, with one
+      row per record and one column per alignment position.
+    #OUTPUT
+    - gene_qc_df (pd.DataFrame); A dataframe with the quality features of each record.
+    """
+    record_count, alignment_length = alignment_matrix.shape
+
+    gap_mask = alignment_matrix == ord("-")
+    x_mask = alignment_matrix == ord("X")
+    residue_count = (~gap_mask).sum(axis=1)
+    safe_residue_count = np.maximum(residue_count, 1)
+
+    gap_fraction = gap_mask.sum(axis=1) / alignment_length
+    x_fraction = x_mask.sum(axis=1) / safe_residue_count
+
+    # Count each character per column and find the most frequent residue (consensus)
+    column_index = np.broadcast_to(np.arange(alignment_length), alignment_matrix.shape)
+    column_counts = np.bincount((column_index * 256 + alignment_matrix).ravel(), minlength=alignment_length * 256)
+    column_counts = column_counts.reshape(alignment_length, 256)
+    column_counts[:, [ord("-"), ord("X")]] = 0
+    consensus = column_counts.argmax(axis=1).astype(np.uint8)
+
+    # Identity of each record residue to the consensus
+    match_count = ((alignment_matrix == consensus) & ~gap_mask).sum(axis=1)
+    identity = match_count / safe_residue_count
+
+    # Outlier score, only if there are enough records to compare
+    if record_count >= 3:
+        outlier_score = np.maximum(-robust_z_score(identity), 0)
+    else:
+        outlier_score = np.zeros(record_count)
+
+    upi_identifier_list = [re.search(r"(UPI[0-9A-Z]{10})", record_id) for record_id in record_id_list]
+
+    gene_qc_df = pd.DataFrame({
+        "Gene": gene_name,
+        "Record": record_id_list,
+        "Unic Identifier": [match.group(1) if match else "NA" for match in upi_identifier_list],
+        "Records in gene": record_count,
+        "Sequence length": residue_count,
+        "Gap fraction": gap_fraction.round(4),
+        "X fraction": x_fraction.round(4),
+        "Identity to consensus": identity.round(4),
+        "Outlier score": outlier_score.round(4)
+    })
+
+    return gene_qc_df
+
+def write_records_qc_csv(records_qc_df, output_folder_path, outlier_threshold, max_x_fraction):
+    """
+    This function flags the potential bad-quality records and writes the quality features 
+    of all the records as a CSV file, ranked by the outlier score.
+    
+    #INPUT
+    - records_qc_df (pd.DataFrame); A dataframe with the quality features of each record.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    - outlier_threshold (float); The outlier score above which a record is flagged.
+    - max_x_fraction (float); The X fraction above which a record is flagged.
+    #OUTPUT
+    - records_qc_df (pd.DataFrame); The ranked dataframe, with a 'Flagged' column.
+    #WRITE OUTPUT
+    - records_qc.csv; A CSV file with the quality features of each record.
+    """
+    records_qc_df["Flagged"] = (records_qc_df["Outlier score"] > outlier_threshold) | \
+                               (records_qc_df["X fraction"] > max_x_fraction)
+
+    records_qc_df = records_qc_df.sort_values(["Outlier score", "X fraction"], ascending=[False, False], ignore_index=True)
+    records_qc_df.to_csv(f"{output_folder_path}/records_qc.csv", index=False)
+
+    return records_qc_df
+
+def write_excluded_records_txt(records_qc_df, output_folder_path):
+    """
+    This function writes the header identifier of the flagged records in a text file,
+    one per row.
+    
+    #INPUT
+    - records_qc_df (pd.DataFrame); A dataframe with the quality features of each record.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    #WRITE OUTPUT
+    - excluded_records.txt; A text file with the flagged records.
+    """
+    with open(f"{output_folder_path}/excluded_records.txt", "wt") as excluded_records:
+        for record_id in records_qc_df.loc[records_qc_df["Flagged"], "Record"]:
+            excluded_records.write(record_id + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+# Global imports
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import argparse
+import threading
+import socketserver
+import multiprocessing
+import multiprocessing.forkserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local imports
+from listing_cache import default_listing_cache_path
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script runs ProteoParc as a long-running build service ("python3 proteoparc.py serve"),
+accepting builds through a local HTTP API, on a TCP port of the local host or on a Unix socket:
+
+1. POST /jobs; Queue a build. The body is a JSON object with the arguments of proteoparc.py
+   ("args") and, optionally, the folder where relative paths are resolved ("cwd", default: the
+   folder where the service was started). E.g. {"args": ["-p", "hominidae", "-t", "9604"]}
+2. GET /jobs and GET /jobs/{id}; The status of all the jobs, or of one job (queued, running,
+   succeeded, failed or cancelled), with its exit code, times and error message.
+3. GET /jobs/{id}/log; The output printed by the build.
+4. DELETE /jobs/{id}; Cancel a queued job.
+5. GET /health; The number of queued and running jobs.
+
+Python, pandas, Biopython and matplotlib are imported once, by a fork server started with the
+service, and each build runs in a process forked from it (instead of from the service, which
+runs several threads), so it starts with all the modules loaded and its results are the same
+as running proteoparc.py with the same arguments. The lists of UniParc IDs and TaxIDs are
+shared by all the builds through the listing cache on disk (see listing_cache.py). The HTTP
+sessions, the records and the worker pools are not kept between builds: each build opens its
+own, as running the builds in separate processes keeps them independent from each other. The
+arguments are validated before queuing the job, at most --max-jobs builds run at the same time,
+and builds writing to the same results folder run one after the other. The output of each
+build is written in {jobs_path}/{id}.log.
+"""
+
+SERVICE_STATE = {"jobs": {}, "job_order": [], "busy_folders": set(), "running": 0, "max_jobs": 1, "jobs_path": None, "build_function": None, "build_parser": None}
+SERVICE_CONDITION = threading.Condition()
+
+def main(argument_list, build_function, build_parser):
+
+    host, port, socket_path, max_jobs, jobs_path = parser(argument_list)
+
+    os.makedirs(jobs_path, exist_ok=True)
+    SERVICE_STATE.update({"max_jobs": max_jobs, "jobs_path": jobs_path, "build_function": build_function, "build_parser": build_parser})
+
+    # Start the fork server of the builds before the threads of the service
+    warm_up_modules()
+
+    # Start the scheduler running the queued jobs
+    threading.Thread(target=schedule_jobs, daemon=True).start()
+
+    # Start the job API
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, JobRequestHandler)
+        print(f"# ProteoParc build service listening on '{socket_path}' ({max_jobs} concurrent builds)")
+    elif not socket_path:
+        server = ThreadingHTTPServer((host, port), JobRequestHandler)
+        print(f"# ProteoParc build service listening on http://{host}:{server.server_port} ({max_jobs} concurrent builds)")
+    sys.stdout.flush()
+
+    # Stop the service on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: threading.Thread(target=server.shutdown).start())
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("# Stopping the build service")
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        with SERVICE_CONDITION:
+            for job_dic in SERVICE_STATE["jobs"].values():
+                if job_dic["status"] == "running" and job_dic["process"].is_alive():
+                    job_dic["process"].terminate()
+
+def parser(argument_list=None):
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #INPUT
+    - argument_list (list); A list with the arguments to parse. If None, the arguments are
+      read from the terminal (sys.argv).
+    #OUTPUT
+    - host (string); The address of the local host to listen on.
+    - port (integer); The TCP port to listen on.
+    - socket_path (string); The path to the Unix socket to listen on. If no socket is
+      specified, the variable is assigned as None and the service listens on the TCP port.
+    - max_jobs (integer); The maximum number of builds running at the same time.
+    - jobs_path (string); The folder to write the output of each build.
+    """
+    parser = argparse.ArgumentParser(prog="proteoparc.py serve", description="A long-running ProteoParc build service, running the builds sent to a local job API")
+    parser.add_argument("--host", dest="host", type=str, help="The address to listen on (default: 127.0.0.1)", required=False, default=["127.0.0.1"], nargs=1)
+    parser.add_argument("--port", dest="port", type=int, help="The TCP port to listen on (default: 8642)", required=False, default=[8642], nargs=1)
+    parser.add_argument("--socket", dest="socket", type=str, help="The path to a Unix socket to listen on, instead of the TCP port (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--max-jobs", dest="max_jobs", type=int, help="The maximum number of builds running at the same time (default: 1)", required=False, default=[1], nargs=1)
+    parser.add_argument("--jobs-path", dest="jobs_path", type=str, help=f"The folder to write the output of each build (default: {os.path.join(os.path.dirname(default_listing_cache_path()), 'jobs')})", required=False, default=[os.path.join(os.path.dirname(default_listing_cache_path()), "jobs")], nargs=1)
+
+    args = parser.parse_args(argument_list)
+
+    host = args.host[0]
+    port = args.port[0]
+    if args.socket:
+        socket_path = os.path.realpath(args.socket[0])
+    elif not args.socket:
+        socket_path = None
+    max_jobs = max(1, args.max_jobs[0])
+    jobs_path = os.path.realpath(args.jobs_path[0])
+
+    return host, port, socket_path, max_jobs, jobs_path
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    An HTTP server listening on a Unix socket, handling each request in a thread.
+    """
+    daemon_threads = True
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    The handler of the job API requests.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code, content):
+        body = json.dumps(content, indent=2).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path_list = [path for path in self.path.split("?")[0].split("/") if path]
+
+        if path_list == ["health"]:
+            with SERVICE_CONDITION:
+                queued_count = sum(job_dic["status"] == "queued" for job_dic in SERVICE_STATE["jobs"].values())
+                health_dic = {"status": "ok", "queued": queued_count, "running": SERVICE_STATE["running"], "max_jobs": SERVICE_STATE["max_jobs"]}
+            self.send_json(200, health_dic)
+
+        elif path_list == ["jobs"]:
+            with SERVICE_CONDITION:
+                job_status_list = [job_status(SERVICE_STATE["jobs"][job_id]) for job_id in SERVICE_STATE["job_order"]]
+            self.send_json(200, job_status_list)
+
+        elif len(path_list) in [2, 3] and path_list[0] == "jobs" and path_list[1] in SERVICE_STATE["jobs"]:
+            job_dic = SERVICE_STATE["jobs"][path_list[1]]
+            if len(path_list) == 2:
+                with SERVICE_CONDITION:
+                    status_dic = job_status(job_dic)
+                self.send_json(200, status_dic)
+            elif path_list[2] == "log":
+                log_text = ""
+                if os.path.exists(job_dic["log_path"]):
+                    with open(job_dic["log_path"], "rb") as log_file:
+                        log_text = log_file.read().decode(errors="replace")
+                body = log_text.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+
+        else:
+            self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        if [path for path in self.path.split("/") if path] != ["jobs"]:
+            self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        try:
+            request_dic = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request_dic, dict):
+                raise ValueError("The request body must be a JSON object")
+            job_dic = submit_job(request_dic.get("args"), request_dic.get("cwd"))
+        except (ValueError, TypeError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+
+        self.send_json(202, job_status(job_dic))
+
+    def do_DELETE(self):
+        path_list = [path for path in self.path.split("/") if path]
+        if len(path_list) != 2 or path_list[0] != "jobs" or path_list[1] not in SERVICE_STATE["jobs"]:
+            self.send_json(404, {"error": f"Unknown path '{self.path}'"})
+            return
+
+        with SERVICE_CONDITION:
+            job_dic = SERVICE_STATE["jobs"][path_list[1]]
+            if job_dic["status"] == "queued":
+                job_dic["status"] = "cancelled"
+                job_dic["end_time"] = time.time()
+            status_dic = job_status(job_dic)
+
+        if status_dic["status"] != "cancelled":
+            self.send_json(409, {"error": f"The job is {status_dic['status']}, only queued jobs can be cancelled"})
+        else:
+            self.send_json(200, status_dic)
+
+def warm_up_modules():
+    """
+    This function starts the fork server the builds are forked from, importing ProteoParc
+    (the main module, with pandas and Biopython) and matplotlib, which the builds only import
+    when needed, so the process of each build already has them loaded.
+    """
+
+    multiprocessing.get_context("forkserver").set_forkserver_preload(["__main__", "metadata_plots", "matplotlib.pyplot"])
+    multiprocessing.forkserver.ensure_running()
+
+def validate_build_arguments(build_argument_list, cwd):
+    """
+    This function validates the arguments of a build with the parser of proteoparc.py, and
+    returns the results folder it writes.
+
+    #INPUT
+    - build_argument_list (list); A list with the arguments of proteoparc.py.
+    - cwd (string); The folder where the relative paths of the arguments are resolved.
+    #OUTPUT
+    - results_folder_path (string); The absolute path to the results folder of the build.
+    """
+
+    if build_argument_list[:1] in [["extract"], ["diff"], ["serve"]]:
+        raise ValueError(f"'{build_argument_list[0]}' can not be run as a build")
+
+    # The relative paths are resolved from cwd, and the parser errors are raised instead of exiting
+    results_folder_path = SERVICE_STATE["build_parser"](build_argument_list, cwd, exit_on_error=False)[0]
+
+    return results_folder_path
+
+def submit_job(build_argument_list, cwd=None):
+    """
+    This function queues a build.
+
+    #INPUT
+    - build_argument_list (list); A list with the arguments of proteoparc.py.
+    - cwd (string); The folder where the relative paths of the arguments are resolved. If
+      None, the folder where the service was started.
+    #OUTPUT
+    - job_dic (dictionary); A dictionary with the arguments and status of the job.
+    """
+
+    if not isinstance(build_argument_list, list) or not all(isinstance(argument, str) for argument in build_argument_list):
+        raise ValueError("'args' must be a list of strings")
+
+    cwd = os.path.realpath(cwd or os.getcwd())
+    if not os.path.isdir(cwd):
+        raise ValueError(f"The folder '{cwd}' does not exist")
+
+    results_folder_path = validate_build_arguments(build_argument_list, cwd)
+
+    job_id = uuid.uuid4().hex[:12]
+    job_dic = {"id": job_id, "args": build_argument_list, "cwd": cwd, "results_folder": results_folder_path, "status": "queued",
+               "exit_code": None, "error": None, "submit_time": time.time(), "start_time": None, "end_time": None,
+               "log_path": os.path.join(SERVICE_STATE["jobs_path"], f"{job_id}.log"), "process": None}
+
+    with SERVICE_CONDITION:
+        SERVICE_STATE["jobs"][job_id] = job_dic
+        SERVICE_STATE["job_order"].append(job_id)
+        SERVICE_CONDITION.notify_all()
+
+    return job_dic
+
+def job_status(job_dic):
+    """
+    This function returns the public fields of a job.
+
+    #INPUT
+    - job_dic (dictionary); A dictionary with the arguments and status of the job.
+    #OUTPUT
+    - status_dic (dictionary); A dictionary with the fields of the job returned by the API.
+    """
+
+    return {key: value for key, value in job_dic.items() if key not in ["process", "log_path"]}
+
+def schedule_jobs():
+    """
+    This function starts the queued jobs in order, as long as there are less than max_jobs
+    builds running and no other build is writing the same results folder.
+    """
+
+    with SERVICE_CONDITION:
+        while True:
+            for job_id in SERVICE_STATE["job_order"]:
+                job_dic = SERVICE_STATE["jobs"][job_id]
+                if SERVICE_STATE["running"] >= SERVICE_STATE["max_jobs"]:
+                    break
+                if job_dic["status"] == "queued" and job_dic["results_folder"] not in SERVICE_STATE["busy_folders"]:
+                    start_job(job_dic)
+
+            SERVICE_CONDITION.wait()
+
+def start_job(job_dic):
+    """
+    This function starts a process running the build of a job, forked from the fork server
+    of the service, and a thread waiting for it. It is called with SERVICE_CONDITION acquired.
+
+    #INPUT
+    - job_dic (dictionary); A dictionary with the arguments and status of the job.
+    """
+
+    job_dic["process"] = multiprocessing.get_context("forkserver").Process(target=run_build, args=(SERVICE_STATE["build_function"], job_dic["args"], job_dic["cwd"], job_dic["log_path"]))
+    job_dic["status"] = "running"
+    job_dic["start_time"] = time.time()
+    SERVICE_STATE["running"] += 1
+    SERVICE_STATE["busy_folders"].add(job_dic["results_folder"])
+
+    job_dic["process"].start()
+    threading.Thread(target=wait_job, args=(job_dic,), daemon=True).start()
+
+def run_build(build_function, build_argument_list, cwd, log_path):
+    """
+    This function runs a build in its own process, writing its output in the log file.
+
+    #INPUT
+    - build_function (function); The main function of proteoparc.py.
+    - build_argument_list (list); A list with the arguments of proteoparc.py.
+    - cwd (string); The folder where the relative paths of the arguments are resolved.
+    - log_path (string); The path to write the output of the build.
+    """
+
+    os.chdir(cwd)
+
+    # Redirect the output of the build and of the software it runs (mafft, R...) to the log
+    log_file = open(log_path, "w", buffering=1)
+    os.dup2(log_file.fileno(), 1)
+    os.dup2(log_file.fileno(), 2)
+    sys.stdout = sys.stderr = log_file
+
+    sys.argv = ["proteoparc.py"] + build_argument_list
+    build_function(build_argument_list)
+
+def wait_job(job_dic):
+    """
+    This function waits for the process of a job to finish and records its status. As the
+    errors of ProteoParc are printed before exiting, a build printing an "ERROR" or "EXIT"
+    line is also recorded as failed.
+
+    #INPUT
+    - job_dic (dictionary); A dictionary with the arguments and status of the job.
+    """
+
+    job_dic["process"].join()
+
+    error_message = None
+    if os.path.exists(job_dic["log_path"]):
+        with open(job_dic["log_path"], "rt", errors="replace") as log_file:
+            for line in log_file:
+                if line.startswith(("ERROR", "EXIT")):
+                    error_message = line.strip()
+
+    with SERVICE_CONDITION:
+        job_dic["exit_code"] = job_dic["process"].exitcode
+        job_dic["end_time"] = time.time()
+        if job_dic["exit_code"] == 0 and not error_message:
+            job_dic["status"] = "succeeded"
+        else:
+            job_dic["status"] = "failed"
+            job_dic["error"] = error_message or f"The build exited with code {job_dic['exit_code']}"
+        SERVICE_STATE["running"] -= 1
+        SERVICE_STATE["busy_folders"].discard(job_dic["results_folder"])
+        SERVICE_CONDITION.notify_all()
@@ -0,0 +1,422 @@
+# Global imports
+import os
+import re
+import csv
+import heapq
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+import pandas as pd
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+
+# Local imports
+from fasta_index import retrieve_upi
+from pipeline_profiler import profile_step
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script compares two databases built by proteoparc.py (e.g. two monthly refreshes of the
+same project), finding the records added, removed, or whose sequence or metadata changed. It
+can be run alone, or as "python3 proteoparc.py diff".
+
+The records are compared by their UniParc ID (UPI). Each database is read as a stream, and
+each record is reduced to its UPI, the digest and length of its sequence, and its header. The
+records are sorted by UPI in runs of a fixed size written to temporary files and merged, so
+the memory employed does not depend on the size of the databases. The extra metadata of the
+SQLite file (.records_metadata.sqlite), already sorted by UPI, is joined to the records of
+each database, and both sorted streams are compared in a single merge-join. The results are:
+
+1. record_changes.csv; A table with each record added, removed or changed, the fields of the
+   header or of the extra metadata that changed, and the old and new length and header.
+
+2. gene_changes.csv and species_changes.csv; The number of records of each gene and species
+   in both databases, and the number of records added, removed, and with a changed sequence
+   or metadata.
+"""
+
+SORT_RUN_RECORD_COUNT = 250000 # Number of records sorted in memory before writing them to a temporary run
+HEADER_FIELD_REGULAR_EXPRESSION_DIC = {"Repository": re.compile(r"^([^|]+)"), "Last update": re.compile(r"\|([\d-]+)"),
+                                       "Description": re.compile(r"^\S+\s(.*?)\s?OS="), "Species": re.compile(r"OS=(.*?)\sOX="),
+                                       "TaxID": re.compile(r"OX=(\w+)"), "Gene": re.compile(r"GN=(.*?)\sSV="),
+                                       "Sequence version": re.compile(r"SV=(\d+)")}
+METADATA_FIELD_LIST = ["Repositories", "Species list", "TaxIDs"] # The extra metadata fields of the SQLite file
+CHANGE_COLUMN_LIST = ["Records old", "Records new", "Added", "Removed", "Sequence changed", "Metadata changed"]
+
+def main(argument_list=None):
+
+    old_database_path, new_database_path, output_folder_path = parser(argument_list)
+
+    for database_path in [old_database_path, new_database_path]:
+        if not os.path.exists(database_path):
+            print(f"ERROR: The database '{database_path}' does not exist")
+            exit(0)
+
+    diff_databases(old_database_path, new_database_path, output_folder_path)
+
+def parser(argument_list=None):
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #INPUT
+    - argument_list (list); A list with the arguments to parse. If None, the arguments are
+      read from the terminal (sys.argv).
+    #OUTPUT
+    - old_database_path (string); The path to the multi-fasta database of the old build.
+    - new_database_path (string); The path to the multi-fasta database of the new build.
+    - output_folder_path (string); The folder to write the change tables.
+    """
+    parser = argparse.ArgumentParser(prog="proteoparc.py diff", description="A script to compare two ProteoParc databases, finding the records added, removed, or with a changed sequence or metadata")
+    parser.add_argument("old_build", type=str, help="The results folder (or the multi-fasta database) of the old build")
+    parser.add_argument("new_build", type=str, help="The results folder (or the multi-fasta database) of the new build")
+    parser.add_argument("--output", "-o", dest="output", type=str, help="The folder to write the change tables (default: database_diff)", required=False, default=["database_diff"], nargs=1)
+
+    args = parser.parse_args(argument_list)
+
+    old_database_path = retrieve_database_path(os.path.realpath(args.old_build))
+    new_database_path = retrieve_database_path(os.path.realpath(args.new_build))
+    output_folder_path = os.path.realpath(args.output[0])
+
+    return old_database_path, new_database_path, output_folder_path
+
+def retrieve_database_path(build_path):
+    """
+    This function returns the multi-fasta database of a build.
+
+    #INPUT
+    - build_path (string); The results folder of a ProteoParc project, or the path to its
+      multi-fasta database.
+    #OUTPUT
+    - database_path (string); The path to the multi-fasta database.
+    """
+    if os.path.isdir(build_path):
+        return f"{build_path}/{os.path.basename(build_path)}_database.fasta"
+
+    return build_path
+
+def parse_header_fields(header):
+    """
+    This function retrieves the fields of a record header compared between builds.
+
+    #INPUT
+    - header (string); The header of the record, without the ">".
+    #OUTPUT
+    - header_field_dic (dictionary); A dictionary with each field of the header. The missing
+      fields are assigned as an empty string.
+    """
+    header_field_dic = {}
+    for field_name, regular_expression in HEADER_FIELD_REGULAR_EXPRESSION_DIC.items():
+        match = regular_expression.search(header)
+        header_field_dic[field_name] = match.group(1) if match else ""
+
+    return header_field_dic
+
+def write_sorted_run(record_list, temporary_folder_path, run_index):
+    """
+    This function sorts a run of records by UPI and writes it to a temporary file.
+
+    #INPUT
+    - record_list (list); A list of (UPI, sequence digest, length, header) tuples.
+    - temporary_folder_path (string); The folder to write the run.
+    - run_index (integer); The number of the run.
+    #OUTPUT
+    - run_path (string); The path to the run file.
+    """
+    run_path = f"{temporary_folder_path}/run_{run_index}.tsv"
+
+    record_list.sort()
+    with open(run_path, "w") as run_file:
+        for upi, sequence_digest, sequence_length, header in record_list:
+            run_file.write(f"{upi}\t{sequence_digest}\t{sequence_length}\t{header}\n")
+
+    return run_path
+
+def read_sorted_run(run_path):
+    """
+    This function reads the records of a sorted run.
+
+    #INPUT
+    - run_path (string); The path to the run file.
+    #OUTPUT (yield)
+    - record (tuple); A (UPI, sequence digest, length, header) tuple, sorted by UPI.
+    """
+    with open(run_path, "r") as run_file:
+        for line in run_file:
+            upi, sequence_digest, sequence_length, header = line.rstrip("\n").split("\t", 3)
+            yield upi, sequence_digest, int(sequence_length), header
+
+def read_sorted_records(database_path, temporary_folder_path):
+    """
+    This function reads a multi-fasta database as a stream of records sorted by UPI. The
+    records are sorted in runs of SORT_RUN_RECORD_COUNT records, which are written to
+    temporary files and merged, so only one run is kept in memory. Records without UPI are
+    identified by their name.
+
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    - temporary_folder_path (string); The folder to write the sorted runs.
+    #OUTPUT (yield)
+    - record (tuple); A (UPI, sequence digest, length, header) tuple, sorted by UPI.
+    """
+    record_list = []
+    run_path_list = []
+
+    with open(database_path, "r") as database_file:
+        for header, sequence in SimpleFastaParser(database_file):
+            header = header.replace("\t", " ")
+            record_name = header.split(" ", 1)[0]
+            sequence_digest = hashlib.blake2b(sequence.encode(), digest_size=16).hexdigest()
+            record_list.append((retrieve_upi(record_name) or record_name, sequence_digest, len(sequence), header))
+
+            if len(record_list) == SORT_RUN_RECORD_COUNT:
+                run_path_list.append(write_sorted_run(record_list, temporary_folder_path, len(run_path_list)))
+                record_list = []
+
+    # Small databases are sorted in memory
+    if not run_path_list:
+        record_list.sort()
+        yield from record_list
+        return
+
+    if record_list:
+        run_path_list.append(write_sorted_run(record_list, temporary_folder_path, len(run_path_list)))
+        record_list = []
+
+    yield from heapq.merge(*[read_sorted_run(run_path) for run_path in run_path_list])
+
+def read_sorted_metadata(metadata_database_path):
+    """
+    This function reads the extra metadata of each record from the SQLite file, sorted by UPI.
+
+    #INPUT
+    - metadata_database_path (string); The path to the SQLite file.
+    #OUTPUT (yield)
+    - metadata (tuple); A (UPI, repositories, species, TaxIDs) tuple, sorted by UPI. If the
+      file does not exist, nothing is yielded.
+    """
+    if not os.path.exists(metadata_database_path):
+        return
+
+    metadata_connection = sqlite3.connect(metadata_database_path)
+    try:
+        yield from metadata_connection.execute("SELECT upi, repositories, species, taxids FROM records_metadata ORDER BY upi")
+    finally:
+        metadata_connection.close()
+
+def join_record_metadata(record_iterator, metadata_iterator):
+    """
+    This function joins the sorted records of a database with their sorted extra metadata.
+
+    #INPUT
+    - record_iterator (iterator); The (UPI, sequence digest, length, header) tuples, sorted by UPI.
+    - metadata_iterator (iterator); The (UPI, repositories, species, TaxIDs) tuples, sorted by UPI.
+    #OUTPUT (yield)
+    - record (tuple); A (UPI, sequence digest, length, header, metadata) tuple, sorted by UPI.
+      The metadata is a tuple with the repositories, species and TaxIDs, or None if the
+      record has no extra metadata.
+    """
+    metadata = next(metadata_iterator, None)
+
+    for record in record_iterator:
+        while metadata is not None and metadata[0] < record[0]:
+            metadata = next(metadata_iterator, None)
+
+        if metadata is not None and metadata[0] == record[0]:
+            yield (*record, tuple(metadata[1:]))
+        else:
+            yield (*record, None)
+
+def merge_join_records(old_record_iterator, new_record_iterator):
+    """
+    This function pairs the records of two databases by UPI, reading both sorted streams
+    only once.
+
+    #INPUT
+    - old_record_iterator (iterator); The records of the old database, sorted by UPI.
+    - new_record_iterator (iterator); The records of the new database, sorted by UPI.
+    #OUTPUT (yield)
+    - old_record (tuple); The record in the old database, or None if it was added.
+    - new_record (tuple); The record in the new database, or None if it was removed.
+    """
+    old_record = next(old_record_iterator, None)
+    new_record = next(new_record_iterator, None)
+
+    while old_record is not None or new_record is not None:
+        if new_record is None or (old_record is not None and old_record[0] < new_record[0]):
+            yield old_record, None
+            old_record = next(old_record_iterator, None)
+        elif old_record is None or new_record[0] < old_record[0]:
+            yield None, new_record
+            new_record = next(new_record_iterator, None)
+        else:
+            yield old_record, new_record
+            old_record = next(old_record_iterator, None)
+            new_record = next(new_record_iterator, None)
+
+def compare_records(old_record, new_record):
+    """
+    This function finds the fields that changed between two versions of a record.
+
+    #INPUT
+    - old_record (tuple); The record in the old database.
+    - new_record (tuple); The record in the new database.
+    #OUTPUT
+    - changed_field_list (list); A list with the name of each changed field ("Sequence",
+      the header fields, and the extra metadata fields).
+    - old_header_field_dic (dictionary); The fields of the old header.
+    - new_header_field_dic (dictionary); The fields of the new header.
+    """
+    changed_field_list = []
+    old_header_field_dic = parse_header_fields(old_record[3])
+    new_header_field_dic = parse_header_fields(new_record[3])
+
+    if old_record[1] != new_record[1]:
+        changed_field_list.append("Sequence")
+
+    changed_field_list.extend(field_name for field_name in HEADER_FIELD_REGULAR_EXPRESSION_DIC if old_header_field_dic[field_name] != new_header_field_dic[field_name])
+
+    if old_record[4] != new_record[4]:
+        old_metadata = old_record[4] or ("", "", "")
+        new_metadata = new_record[4] or ("", "", "")
+        changed_field_list.extend(field_name for field_name, old_value, new_value in zip(METADATA_FIELD_LIST, old_metadata, new_metadata) if old_value != new_value)
+
+    return changed_field_list, old_header_field_dic, new_header_field_dic
+
+def count_change(change_count_dic, key, column_name):
+    """
+    This function adds one to the count of a gene or species in a change column.
+
+    #INPUT
+    - change_count_dic (dictionary); A dictionary with the counts of each gene or species.
+    - key (string); The gene or species.
+    - column_name (string); The change column.
+    """
+    if key not in change_count_dic:
+        change_count_dic[key] = dict.fromkeys(CHANGE_COLUMN_LIST, 0)
+
+    change_count_dic[key][column_name] += 1
+
+def write_change_counts(change_count_dic, key_column_name, output_path):
+    """
+    This function writes the changes per gene or species as a CSV file, sorted by the number
+    of records added, removed or changed.
+
+    #INPUT
+    - change_count_dic (dictionary); A dictionary with the counts of each gene or species.
+    - key_column_name (string); The name of the first column ("Gene" or "Species").
+    - output_path (string); The path to write the CSV file.
+    #WRITE OUTPUT
+    - {output_path}; A CSV file with the counts of each gene or species.
+    """
+    change_count_df = pd.DataFrame.from_dict(change_count_dic, orient="index", columns=CHANGE_COLUMN_LIST)
+    change_count_df.index.name = key_column_name
+    change_count_df = change_count_df.reset_index()
+
+    change_count_df["Delta"] = change_count_df["Records new"] - change_count_df["Records old"]
+    change_count_df["Total changes"] = change_count_df[["Added", "Removed", "Sequence changed", "Metadata changed"]].sum(axis=1)
+    change_count_df = change_count_df.sort_values(["Total changes", key_column_name], ascending=[False, True])
+
+    change_count_df.to_csv(output_path, index=False)
+
+def diff_databases(old_database_path, new_database_path, output_folder_path):
+    """
+    This function compares two multi-fasta databases built by proteoparc.py, including the
+    extra metadata of their SQLite files, and writes the records added, removed or changed,
+    and the number of changes per gene and species.
+
+    #INPUT
+    - old_database_path (string); The path to the multi-fasta database of the old build.
+    - new_database_path (string); The path to the multi-fasta database of the new build.
+    - output_folder_path (string); The folder to write the change tables.
+    #OUTPUT
+    - change_total_dic (dictionary); A dictionary with the number of records added,
+      removed, with a changed sequence, with a changed metadata, and unchanged.
+    #WRITE OUTPUT
+    - record_changes.csv; A CSV file with each record added, removed or changed.
+    - gene_changes.csv; A CSV file with the number of records and changes per gene.
+    - species_changes.csv; A CSV file with the number of records and changes per species.
+    """
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    change_total_dic = {"added": 0, "removed": 0, "sequence changed": 0, "metadata changed": 0, "unchanged": 0}
+    gene_change_dic = {}
+    species_change_dic = {}
+
+    print(f"# Comparing '{old_database_path}' with '{new_database_path}'")
+    with profile_step("diff_databases"), tempfile.TemporaryDirectory(dir=output_folder_path) as temporary_folder_path, \
+         open(f"{output_folder_path}/record_changes.csv", "w", newline="") as change_file:
+
+        os.mkdir(f"{temporary_folder_path}/old")
+        os.mkdir(f"{temporary_folder_path}/new")
+        old_record_iterator = join_record_metadata(read_sorted_records(old_database_path, f"{temporary_folder_path}/old"),
+                                                   read_sorted_metadata(f"{os.path.dirname(old_database_path)}/.records_metadata.sqlite"))
+        new_record_iterator = join_record_metadata(read_sorted_records(new_database_path, f"{temporary_folder_path}/new"),
+                                                   read_sorted_metadata(f"{os.path.dirname(new_database_path)}/.records_metadata.sqlite"))
+
+        change_writer = csv.writer(change_file)
+        change_writer.writerow(["Unic Identifier", "Change", "Changed fields", "Gene", "Species", "Old length", "New length", "Old header", "New header"])
+
+        # Compare the records of both databases in a single pass
+        for old_record, new_record in merge_join_records(old_record_iterator, new_record_iterator):
+            if new_record is None:
+                header_field_dic = parse_header_fields(old_record[3])
+                count_change(gene_change_dic, header_field_dic["Gene"] or "no gene", "Records old")
+                count_change(species_change_dic, header_field_dic["Species"] or "no species", "Records old")
+                count_change(gene_change_dic, header_field_dic["Gene"] or "no gene", "Removed")
+                count_change(species_change_dic, header_field_dic["Species"] or "no species", "Removed")
+                change_writer.writerow([old_record[0], "removed", "", header_field_dic["Gene"], header_field_dic["Species"], old_record[2], "", old_record[3], ""])
+                change_total_dic["removed"] += 1
+                continue
+
+            if old_record is None:
+                header_field_dic = parse_header_fields(new_record[3])
+                count_change(gene_change_dic, header_field_dic["Gene"] or "no gene", "Records new")
+                count_change(species_change_dic, header_field_dic["Species"] or "no species", "Records new")
+                count_change(gene_change_dic, header_field_dic["Gene"] or "no gene", "Added")
+                count_change(species_change_dic, header_field_dic["Species"] or "no species", "Added")
+                change_writer.writerow([new_record[0], "added", "", header_field_dic["Gene"], header_field_dic["Species"], "", new_record[2], "", new_record[3]])
+                change_total_dic["added"] += 1
+                continue
+
+            # Records with the same sequence, header and extra metadata are only counted
+            if old_record[1:] == new_record[1:]:
+                header_field_dic = parse_header_fields(new_record[3])
+                for column_name in ["Records old", "Records new"]:
+                    count_change(gene_change_dic, header_field_dic["Gene"] or "no gene", column_name)
+                    count_change(species_change_dic, header_field_dic["Species"] or "no species", column_name)
+                change_total_dic["unchanged"] += 1
+                continue
+
+            changed_field_list, old_header_field_dic, new_header_field_dic = compare_records(old_record, new_record)
+            count_change(gene_change_dic, old_header_field_dic["Gene"] or "no gene", "Records old")
+            count_change(species_change_dic, old_header_field_dic["Species"] or "no species", "Records old")
+            count_change(gene_change_dic, new_header_field_dic["Gene"] or "no gene", "Records new")
+            count_change(species_change_dic, new_header_field_dic["Species"] or "no species", "Records new")
+
+            # Changes are counted in the gene and species of the new record
+            if "Sequence" in changed_field_list:
+                change_column_name = "Sequence changed"
+                change_total_dic["sequence changed"] += 1
+            else:
+                change_column_name = "Metadata changed"
+                change_total_dic["metadata changed"] += 1
+            count_change(gene_change_dic, new_header_field_dic["Gene"] or "no gene", change_column_name)
+            count_change(species_change_dic, new_header_field_dic["Species"] or "no species", change_column_name)
+
+            change_writer.writerow([new_record[0], "sequence" if "Sequence" in changed_field_list else "metadata", ";".join(changed_field_list),
+                                    new_header_field_dic["Gene"], new_header_field_dic["Species"], old_record[2], new_record[2], old_record[3], new_record[3]])
+
+    write_change_counts(gene_change_dic, "Gene", f"{output_folder_path}/gene_changes.csv")
+    write_change_counts(species_change_dic, "Species", f"{output_folder_path}/species_changes.csv")
+
+    print(f"   {change_total_dic['added']} records added, {change_total_dic['removed']} removed, {change_total_dic['sequence changed']} with a new sequence, "
+          f"{change_total_dic['metadata changed']} with new metadata and {change_total_dic['unchanged']} unchanged")
+
+    return change_total_dic
+
+if __name__ == "__main__":
+    main()
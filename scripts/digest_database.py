@@ -0,0 +1,373 @@
+# Global imports
+import io
+import os
+import re
+import json
+import mmap
+import argparse
+import numpy as np
+import pandas as pd
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+# Local imports
+from metadata_proteoparc import split_fasta_chunks
+from fasta_index import retrieve_upi
+from pipeline_profiler import profile_step
+from residue_masses import residue_mass_array, WATER_MASS, PROTON_MASS
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script digests in-silico a multi-fasta protein database, and writes a peptide-mass
+index that LC-MS/MS search engines (or other scripts) can read without digesting the
+database again. The digestion is configurable (enzyme, missed cleavages, peptide length and
+mass window), and the database is split in chunks digested in parallel processes.
+
+The index (peptide_index folder) is made of NumPy arrays, which are memory-mapped when
+read, so only the parts employed by a query are loaded:
+
+1. masses.npy; The monoisotopic neutral mass of each unique peptide, sorted.
+2. peptide_sequences.npy and peptide_offsets.npy; The concatenated peptide sequences, and
+   the position where each one starts (same order as the masses).
+3. postings.npy and posting_offsets.npy; The proteins containing each peptide (as indexes
+   of proteins.txt), and the position where the proteins of each peptide start.
+4. proteins.txt; The name of each protein record (the header until the first space).
+5. digestion_parameters.json; The parameters employed to digest the database.
+
+Precursor-mass queries are a binary search of the mass window in the sorted masses.
+"""
+
+# Cleavage sites of each enzyme, as zero-width regular expressions
+ENZYME_REGULAR_EXPRESSION_DIC = {"trypsin": r"(?<=[KR])(?!P)", "trypsin/p": r"(?<=[KR])", "lys-c": r"(?<=K)", "lys-n": r"(?=K)",
+                                 "arg-c": r"(?<=R)(?!P)", "asp-n": r"(?=D)", "glu-c": r"(?<=E)", "chymotrypsin": r"(?<=[FWYL])(?!P)"}
+
+PARALLEL_DIGESTION_MIN_SIZE = 4 * 1024 * 1024 # Minimum database size (bytes) to digest it in parallel
+MASS_BATCH_SIZE = 1 << 18 # Number of peptides whose mass is computed at the same time
+
+def main():
+
+    index_folder_path, database_path, digestion_parameter_dic, threads, query_mass_list, tolerance_ppm, charge = parser()
+
+    if query_mass_list:
+        if not os.path.exists(f"{index_folder_path}/masses.npy"):
+            print(f"ERROR: No peptide index found in '{index_folder_path}'. Please build it first with --database")
+            exit(0)
+
+        peptide_index = load_peptide_index(index_folder_path)
+        for query_mass in query_mass_list:
+            precursor_mass = (query_mass - PROTON_MASS) * charge if charge else query_mass
+            print(f"# Precursor mass {precursor_mass:.5f} Da (+/- {tolerance_ppm} ppm)")
+            print(query_precursor_mass(peptide_index, precursor_mass, tolerance_ppm).to_string(index=False))
+        return
+
+    if not database_path:
+        print("ERROR: Please indicate the multi-fasta database to digest (--database) or the masses to query (--query-mass)")
+        exit(0)
+
+    digest_database(database_path, index_folder_path, digestion_parameter_dic, threads)
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - index_folder_path (string); The path to the peptide index folder.
+    - database_path (string); The path to the multi-fasta database to digest. If no database
+      is specified, the variable is assigned as None.
+    - digestion_parameter_dic (dictionary); A dictionary with the enzyme, the maximum number
+      of missed cleavages, the peptide length and mass windows, and if the cysteines are
+      carbamidomethylated.
+    - threads (integer); The number of processes employed to digest the database.
+    - query_mass_list (list); A list with the precursor masses (or m/z, with charge) to search
+      in the index. If no masses are specified, the variable is assigned as None.
+    - tolerance_ppm (float); The mass tolerance of the queries, in ppm.
+    - charge (integer); The charge of the queried m/z values. If no charge is specified, the
+      variable is assigned as None and the queries are neutral masses.
+    """
+    parser = argparse.ArgumentParser(description="A script to digest in-silico a multi-fasta database and search peptides by precursor mass")
+    parser.add_argument("index_folder_path", type=str, help="The path to the peptide index folder")
+    parser.add_argument("--database", dest="database", type=str, help="The path to the multi-fasta database to digest (not mandatory)", required=False, nargs=1)
+    parser.add_argument("--enzyme", dest="enzyme", type=str, help="The enzyme employed in the digestion (default: trypsin)", required=False, default=["trypsin"], choices=list(ENZYME_REGULAR_EXPRESSION_DIC), nargs=1)
+    parser.add_argument("--missed-cleavages", dest="missed_cleavages", type=int, help="The maximum number of missed cleavages per peptide (default: 2)", required=False, default=[2], nargs=1)
+    parser.add_argument("--peptide-length", dest="peptide_length", type=int, help="The minimum and maximum peptide length (default: 7 30)", required=False, default=[7, 30], nargs=2)
+    parser.add_argument("--peptide-mass", dest="peptide_mass", type=float, help="The minimum and maximum peptide neutral mass in Da (default: 500 5000)", required=False, default=[500.0, 5000.0], nargs=2)
+    parser.add_argument("--carbamidomethyl", dest="carbamidomethyl", action=argparse.BooleanOptionalAction, help="Add the carbamidomethylation of the cysteines as a fixed modification (default: False; --no-carbamidomethyl)", default=False, required=False)
+    parser.add_argument("--threads", dest="threads", type=int, help="The number of processes employed to digest the database (default: 1)", required=False, default=[1], nargs=1)
+    parser.add_argument("--query-mass", dest="query_mass", type=float, help="The precursor masses to search in the index (not mandatory)", required=False, nargs="+")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, help="The mass tolerance of the queries in ppm (default: 10)", required=False, default=[10.0], nargs=1)
+    parser.add_argument("--charge", dest="charge", type=int, help="The charge of the queried values, to search m/z values instead of neutral masses (not mandatory)", required=False, nargs=1)
+
+    args = parser.parse_args()
+
+    index_folder_path = os.path.realpath(args.index_folder_path)
+    database_path = os.path.realpath(args.database[0]) if args.database else None
+    digestion_parameter_dic = build_digestion_parameters(args.enzyme[0], args.missed_cleavages[0], args.peptide_length, args.peptide_mass, args.carbamidomethyl)
+    threads = args.threads[0]
+    query_mass_list = args.query_mass
+    tolerance_ppm = args.tolerance[0]
+    charge = args.charge[0] if args.charge else None
+
+    return index_folder_path, database_path, digestion_parameter_dic, threads, query_mass_list, tolerance_ppm, charge
+
+def build_digestion_parameters(enzyme="trypsin", missed_cleavages=2, peptide_length=(7, 30), peptide_mass=(500.0, 5000.0), do_carbamidomethyl=False):
+    """
+    This function gathers the digestion parameters in a dictionary, checking their values.
+
+    #INPUT
+    - enzyme (string); The enzyme employed in the digestion.
+    - missed_cleavages (integer); The maximum number of missed cleavages per peptide.
+    - peptide_length (list); The minimum and maximum peptide length.
+    - peptide_mass (list); The minimum and maximum peptide neutral mass (Da).
+    - do_carbamidomethyl (boolean); A boolean indicator to indicate if the cysteines are
+      carbamidomethylated (fixed modification).
+    #OUTPUT
+    - digestion_parameter_dic (dictionary); A dictionary with the digestion parameters.
+    """
+    if enzyme not in ENZYME_REGULAR_EXPRESSION_DIC:
+        print(f"ERROR: Unknown enzyme '{enzyme}'. Please select one of: {', '.join(ENZYME_REGULAR_EXPRESSION_DIC)}")
+        exit(0)
+
+    if missed_cleavages < 0 or peptide_length[0] < 1 or peptide_length[0] > peptide_length[1] or peptide_mass[0] > peptide_mass[1]:
+        print("ERROR: The missed cleavages must be positive, and the minimum peptide length and mass lower than the maximum ones")
+        exit(0)
+
+    digestion_parameter_dic = {"enzyme": enzyme, "missed_cleavages": int(missed_cleavages),
+                               "peptide_length": [int(length) for length in peptide_length],
+                               "peptide_mass": [float(mass) for mass in peptide_mass],
+                               "carbamidomethyl": bool(do_carbamidomethyl)}
+
+    return digestion_parameter_dic
+
+def digest_sequence(sequence, cleavage_regular_expression, missed_cleavages, min_length, max_length):
+    """
+    This function digests in-silico a protein sequence, returning the unique peptides
+    within the length window. The peptides with residues without a defined mass (X, B, Z,
+    J...) are discarded.
+
+    #INPUT
+    - sequence (string); The protein sequence.
+    - cleavage_regular_expression (re.Pattern); The compiled cleavage sites of the enzyme.
+    - missed_cleavages (integer); The maximum number of missed cleavages per peptide.
+    - min_length (integer); The minimum peptide length.
+    - max_length (integer); The maximum peptide length.
+    #OUTPUT
+    - peptide_set (set); A set with the peptides of the protein.
+    """
+    site_list = sorted({0, len(sequence), *(match.start() for match in cleavage_regular_expression.finditer(sequence))})
+    has_undefined_residues = re.search(r"[^ACDEFGHIKLMNOPQRSTUVWY]", sequence) is not None
+
+    peptide_set = set()
+    for start_index, start in enumerate(site_list[:-1]):
+        for end in site_list[start_index + 1:start_index + missed_cleavages + 2]:
+            if end - start > max_length:
+                break
+            if end - start < min_length:
+                continue
+
+            peptide = sequence[start:end]
+            if has_undefined_residues and re.search(r"[^ACDEFGHIKLMNOPQRSTUVWY]", peptide):
+                continue
+            peptide_set.add(peptide)
+
+    return peptide_set
+
+def digest_fasta_chunk(database_path, digestion_parameter_dic, chunk_start=0, chunk_end=None):
+    """
+    This function digests in-silico the records of a chunk of a multi-fasta file.
+
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    - digestion_parameter_dic (dictionary); A dictionary with the digestion parameters.
+    - chunk_start (integer); The byte position where the chunk starts.
+    - chunk_end (integer); The byte position where the chunk ends. If None, the chunk ends
+      at the end of the file.
+    #OUTPUT
+    - protein_name_list (list); A list with the name of each record in the chunk.
+    - peptide_array (np.ndarray); A fixed-width bytes array with the peptides of each record.
+    - protein_index_array (np.ndarray); The index (within the chunk) of the record of each peptide.
+    """
+    cleavage_regular_expression = re.compile(ENZYME_REGULAR_EXPRESSION_DIC[digestion_parameter_dic["enzyme"]])
+    min_length, max_length = digestion_parameter_dic["peptide_length"]
+
+    with open(database_path, "rb") as database_file, mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ) as database_map:
+        chunk_text = database_map[chunk_start:chunk_end].decode()
+
+    protein_name_list = []
+    peptide_list = []
+    protein_index_list = []
+    for header, sequence in SimpleFastaParser(io.StringIO(chunk_text)):
+        peptide_set = digest_sequence(sequence.upper(), cleavage_regular_expression, digestion_parameter_dic["missed_cleavages"], min_length, max_length)
+
+        peptide_list.extend(peptide_set)
+        protein_index_list.extend([len(protein_name_list)] * len(peptide_set))
+        protein_name_list.append(header.split()[0] if header.strip() else "")
+
+    peptide_array = np.array(peptide_list, dtype=f"S{max_length}")
+    protein_index_array = np.array(protein_index_list, dtype=np.int32)
+
+    return protein_name_list, peptide_array, protein_index_array
+
+def compute_peptide_masses(peptide_array, mass_array):
+    """
+    This function computes the monoisotopic neutral mass of each peptide in vectorized
+    form, adding the mass of its residues (read as a byte matrix) and a water molecule.
+
+    #INPUT
+    - peptide_array (np.ndarray); A fixed-width bytes array with the peptides.
+    - mass_array (np.ndarray); The lookup array with the mass of each residue.
+    #OUTPUT
+    - peptide_mass_array (np.ndarray); The mass of each peptide.
+    """
+    residue_matrix = peptide_array.view(np.uint8).reshape(len(peptide_array), peptide_array.dtype.itemsize)
+    peptide_mass_array = np.empty(len(peptide_array))
+
+    # Compute the masses in batches, to limit the memory employed by the mass matrix
+    for batch_start in range(0, len(peptide_array), MASS_BATCH_SIZE):
+        batch_end = batch_start + MASS_BATCH_SIZE
+        peptide_mass_array[batch_start:batch_end] = mass_array[residue_matrix[batch_start:batch_end]].sum(axis=1) + WATER_MASS
+
+    return peptide_mass_array
+
+def digest_database(database_path, index_folder_path, digestion_parameter_dic, threads=1):
+    """
+    This function digests in-silico a multi-fasta database, and writes the peptide-mass
+    index. Large databases are split in chunks digested in parallel processes.
+
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    - index_folder_path (string); The path to the peptide index folder.
+    - digestion_parameter_dic (dictionary); A dictionary with the digestion parameters.
+    - threads (integer); The number of processes employed to digest the database.
+    #OUTPUT
+    - peptide_count (integer); The number of unique peptides in the index.
+    #WRITE OUTPUT
+    - masses.npy, peptide_sequences.npy, peptide_offsets.npy, postings.npy, posting_offsets.npy,
+      proteins.txt and digestion_parameters.json; The peptide index files.
+    """
+    print(f"# Digesting the database with {digestion_parameter_dic['enzyme']}")
+
+    with profile_step("digest_records"):
+        if threads == 1 or os.path.getsize(database_path) < PARALLEL_DIGESTION_MIN_SIZE:
+            chunk_result_list = [digest_fasta_chunk(database_path, digestion_parameter_dic)]
+        else:
+            chunk_list = split_fasta_chunks(database_path, threads * 4)
+            with ProcessPoolExecutor(max_workers=threads, mp_context=get_context("forkserver")) as executor:
+                chunk_result_list = list(executor.map(digest_fasta_chunk, [database_path] * len(chunk_list), [digestion_parameter_dic] * len(chunk_list), *zip(*chunk_list)))
+
+    with profile_step("build_peptide_index"):
+
+        # Merge the chunks, numbering the records in the order of the database
+        protein_name_list = []
+        protein_index_array_list = []
+        for chunk_protein_name_list, _, chunk_protein_index_array in chunk_result_list:
+            protein_index_array_list.append(chunk_protein_index_array + len(protein_name_list))
+            protein_name_list.extend(chunk_protein_name_list)
+
+        max_length = digestion_parameter_dic["peptide_length"][1]
+        peptide_array = np.concatenate([chunk_peptide_array for _, chunk_peptide_array, _ in chunk_result_list] + [np.array([], dtype=f"S{max_length}")])
+        protein_index_array = np.concatenate(protein_index_array_list + [np.array([], dtype=np.int32)])
+        del chunk_result_list
+
+        # Compute the mass of each unique peptide, keeping the peptides within the mass window
+        unique_peptide_array, peptide_id_array = np.unique(peptide_array, return_inverse=True)
+        del peptide_array
+        unique_mass_array = compute_peptide_masses(unique_peptide_array, residue_mass_array(digestion_parameter_dic["carbamidomethyl"]))
+        min_mass, max_mass = digestion_parameter_dic["peptide_mass"]
+        kept_peptide_array = np.flatnonzero((unique_mass_array >= min_mass) & (unique_mass_array <= max_mass))
+
+        # Sort the peptides by mass, and renumber them in that order
+        kept_peptide_array = kept_peptide_array[np.argsort(unique_mass_array[kept_peptide_array], kind="stable")]
+        new_peptide_id_array = np.full(len(unique_peptide_array), -1, dtype=np.int64)
+        new_peptide_id_array[kept_peptide_array] = np.arange(len(kept_peptide_array))
+
+        # Group the proteins of each peptide (postings), in the order of the peptides
+        posting_peptide_id_array = new_peptide_id_array[peptide_id_array.ravel()]
+        is_kept_array = posting_peptide_id_array >= 0
+        posting_peptide_id_array, protein_index_array = posting_peptide_id_array[is_kept_array], protein_index_array[is_kept_array]
+        posting_order_array = np.lexsort((protein_index_array, posting_peptide_id_array))
+        posting_offset_array = np.concatenate([[0], np.cumsum(np.bincount(posting_peptide_id_array, minlength=len(kept_peptide_array)))]).astype(np.int64)
+
+        # Concatenate the peptide sequences, removing the padding of the fixed-width array
+        sorted_peptide_array = unique_peptide_array[kept_peptide_array]
+        residue_matrix = sorted_peptide_array.view(np.uint8).reshape(len(sorted_peptide_array), max_length)
+        peptide_length_array = (residue_matrix != 0).sum(axis=1)
+        peptide_offset_array = np.concatenate([[0], np.cumsum(peptide_length_array)]).astype(np.int64)
+
+        if not os.path.exists(index_folder_path):
+            os.makedirs(index_folder_path)
+
+        np.save(f"{index_folder_path}/masses.npy", unique_mass_array[kept_peptide_array])
+        np.save(f"{index_folder_path}/peptide_sequences.npy", residue_matrix[residue_matrix != 0])
+        np.save(f"{index_folder_path}/peptide_offsets.npy", peptide_offset_array)
+        np.save(f"{index_folder_path}/postings.npy", protein_index_array[posting_order_array].astype(np.int32))
+        np.save(f"{index_folder_path}/posting_offsets.npy", posting_offset_array)
+
+        with open(f"{index_folder_path}/proteins.txt", "wt") as protein_file:
+            protein_file.writelines(f"{protein_name}\n" for protein_name in protein_name_list)
+
+        with open(f"{index_folder_path}/digestion_parameters.json", "wt") as parameter_file:
+            json.dump(digestion_parameter_dic, parameter_file, indent=2)
+
+    print(f"   {len(kept_peptide_array)} unique peptides from {len(protein_name_list)} records")
+
+    return len(kept_peptide_array)
+
+def load_peptide_index(index_folder_path):
+    """
+    This function opens a peptide index. The arrays are memory-mapped, so they are not
+    read until a query needs them.
+
+    #INPUT
+    - index_folder_path (string); The path to the peptide index folder.
+    #OUTPUT
+    - peptide_index (dictionary); A dictionary with the memory-mapped arrays of the index,
+      the list of protein names, and the digestion parameters.
+    """
+    peptide_index = {array_name: np.load(f"{index_folder_path}/{array_name}.npy", mmap_mode="r")
+                     for array_name in ["masses", "peptide_sequences", "peptide_offsets", "postings", "posting_offsets"]}
+
+    with open(f"{index_folder_path}/proteins.txt", "rt") as protein_file:
+        peptide_index["proteins"] = [line.rstrip("\n") for line in protein_file]
+
+    with open(f"{index_folder_path}/digestion_parameters.json", "rt") as parameter_file:
+        peptide_index["parameters"] = json.load(parameter_file)
+
+    return peptide_index
+
+def query_precursor_mass(peptide_index, precursor_mass, tolerance_ppm=10.0):
+    """
+    This function searches the peptides whose mass is within the tolerance of a precursor
+    mass, with a binary search in the sorted masses.
+
+    #INPUT
+    - peptide_index (dictionary); The peptide index, from load_peptide_index().
+    - precursor_mass (float); The neutral mass of the precursor (Da).
+    - tolerance_ppm (float); The mass tolerance, in ppm.
+    #OUTPUT
+    - peptide_match_df (pd.DataFrame); A dataframe with the sequence, mass, error (ppm)
+      and the UPIs of the proteins of each peptide found.
+    """
+    mass_tolerance = precursor_mass * tolerance_ppm / 1e6
+    first_peptide = int(np.searchsorted(peptide_index["masses"], precursor_mass - mass_tolerance, side="left"))
+    last_peptide = int(np.searchsorted(peptide_index["masses"], precursor_mass + mass_tolerance, side="right"))
+
+    peptide_match_list = []
+    for peptide_id in range(first_peptide, last_peptide):
+        peptide_start, peptide_end = peptide_index["peptide_offsets"][peptide_id:peptide_id + 2]
+        posting_start, posting_end = peptide_index["posting_offsets"][peptide_id:peptide_id + 2]
+        peptide_mass = float(peptide_index["masses"][peptide_id])
+        protein_name_list = [peptide_index["proteins"][protein_index] for protein_index in peptide_index["postings"][posting_start:posting_end]]
+
+        peptide_match_list.append({"Peptide": peptide_index["peptide_sequences"][peptide_start:peptide_end].tobytes().decode(),
+                                   "Mass": round(peptide_mass, 5), "Error_ppm": round((peptide_mass - precursor_mass) / precursor_mass * 1e6, 3),
+                                   "UPI": ";".join(dict.fromkeys(retrieve_upi(protein_name) or protein_name for protein_name in protein_name_list))})
+
+    return pd.DataFrame(peptide_match_list, columns=["Peptide", "Mass", "Error_ppm", "UPI"])
+
+if __name__ == "__main__":
+    main()
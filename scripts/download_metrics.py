@@ -0,0 +1,328 @@
+# Global imports
+import os
+import json
+import time
+import argparse
+import threading
+import collections
+import numpy as np
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script keeps live metrics of the download step, and exports them periodically to a
+status file, so the progress of long downloads can be followed by a monitoring system.
+The HTTP requests done through the requests library (also by requests_futures) are
+counted while the metrics are started, with the following values:
+
+1. Requests; The requests in flight, the responses per HTTP status code (including the
+   retried ones, e.g. 429 or 503 when the API throttles the download), the retries and the
+   requests failed without response.
+2. Bytes; The size of the responses received.
+3. Latency; A histogram of the duration of the requests, and the 50th, 90th and 99th
+   percentiles of the last 10,000 requests.
+4. Records; The JSON records expected and downloaded, the records per second (last minute),
+   the estimated time to finish (ETA) and the seconds since the last record (to spot stalls).
+
+The status file is written as a Prometheus textfile (to be read by the textfile collector
+of node_exporter) if its name ends with ".prom", or as JSON otherwise. It is replaced
+atomically, so it is never read half-written.
+
+The script can also be run from the command line to print the status of a JSON status file.
+"""
+
+METRICS_STATE = {"enabled": False, "start": 0.0, "metrics_path": None, "original_send": None, "stop_event": None, "exporter_thread": None}
+METRICS_LOCK = threading.Lock()
+LATENCY_BUCKET_LIST = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0] # Upper bounds (s) of the latency histogram
+LATENCY_RESERVOIR_SIZE = 10000 # Number of recent requests employed to compute the latency percentiles
+RATE_WINDOW = 60.0 # Seconds employed to compute the records per second
+
+def main():
+
+    metrics_path = parser()
+
+    with open(metrics_path, "r") as metrics_file:
+        metrics_dic = json.load(metrics_file)
+
+    latency_dic = metrics_dic["latency_s"]
+    print(f"# {'Finished' if metrics_dic['finished'] else 'Running'} for {metrics_dic['elapsed_s']:.0f} s (updated {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(metrics_dic['updated_at']))})")
+    print(f"   {metrics_dic['records_downloaded']}/{metrics_dic['records_expected']} records, {metrics_dic['records_per_second']:.1f} records/s, ETA {format_seconds(metrics_dic['eta_s'])}")
+    print(f"   {metrics_dic['requests_in_flight']} requests in flight, {metrics_dic['retries_total']} retries, {metrics_dic['request_errors_total']} errors, {metrics_dic['bytes_received'] / 1e6:.1f} MB received")
+    print(f"   Responses per status: {', '.join(f'{status}={count}' for status, count in sorted(metrics_dic['responses_per_status'].items())) or '-'}")
+    print(f"   Latency p50={format_seconds(latency_dic['p50'], 3)} p90={format_seconds(latency_dic['p90'], 3)} p99={format_seconds(latency_dic['p99'], 3)}")
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - metrics_path (string); The path to the JSON status file.
+    """
+    parser = argparse.ArgumentParser(description="A script to print the status file of a ProteoParc download")
+    parser.add_argument("metrics_path", type=str, help="The path to the JSON status file written with --metrics-file")
+
+    args = parser.parse_args()
+
+    metrics_path = os.path.realpath(args.metrics_path)
+
+    return metrics_path
+
+def start_download_metrics(metrics_path, interval=15.0):
+    """
+    This function starts counting the HTTP requests done through the requests library, and
+    exports the metrics to the status file every interval seconds, in a background thread.
+    Without a status file, nothing is recorded.
+
+    #INPUT
+    - metrics_path (string); The path to the status file (.prom for Prometheus, JSON otherwise).
+    - interval (float); The number of seconds between two exports of the metrics.
+    """
+    import requests
+
+    if not metrics_path or METRICS_STATE["enabled"]:
+        return
+
+    if os.path.dirname(metrics_path):
+        os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+
+    with METRICS_LOCK:
+        METRICS_STATE.update({"enabled": True, "start": time.time(), "metrics_path": metrics_path, "original_send": requests.Session.send,
+                              "in_flight": 0, "status_counter": collections.Counter(), "retries": 0, "errors": 0, "bytes_received": 0,
+                              "latency_bucket_array": np.zeros(len(LATENCY_BUCKET_LIST) + 1, dtype=np.int64), "latency_sum": 0.0,
+                              "latency_count": 0, "latency_reservoir": collections.deque(maxlen=LATENCY_RESERVOIR_SIZE),
+                              "records_expected": 0, "records_downloaded": 0, "last_record_time": None,
+                              "rate_sample_deque": collections.deque(), "finished": False})
+
+    original_send = METRICS_STATE["original_send"]
+
+    def measured_send(session, request, **kwargs):
+        with METRICS_LOCK:
+            METRICS_STATE["in_flight"] += 1
+        request_start = time.perf_counter()
+
+        try:
+            response = original_send(session, request, **kwargs)
+        except Exception:
+            with METRICS_LOCK:
+                METRICS_STATE["errors"] += 1
+            raise
+        finally:
+            with METRICS_LOCK:
+                METRICS_STATE["in_flight"] -= 1
+
+        # The content of the streamed responses is not read, to not consume it
+        bytes_received = 0 if kwargs.get("stream") else len(response.content)
+        record_response(response, time.perf_counter() - request_start, bytes_received)
+
+        return response
+
+    requests.Session.send = measured_send
+
+    # Export the metrics periodically until the download finishes
+    stop_event = threading.Event()
+
+    def export_periodically():
+        while not stop_event.wait(interval):
+            write_download_metrics(metrics_path)
+
+    exporter_thread = threading.Thread(target=export_periodically, name="download_metrics", daemon=True)
+    METRICS_STATE.update({"stop_event": stop_event, "exporter_thread": exporter_thread})
+    exporter_thread.start()
+    write_download_metrics(metrics_path)
+
+def stop_download_metrics():
+    """
+    This function stops counting the HTTP requests and writes the final metrics to the
+    status file, marked as finished.
+
+    #WRITE OUTPUT
+    - {metrics_path}; The status file with the final metrics of the download.
+    """
+    import requests
+
+    if not METRICS_STATE["enabled"]:
+        return
+
+    METRICS_STATE["stop_event"].set()
+    METRICS_STATE["exporter_thread"].join()
+
+    with METRICS_LOCK:
+        requests.Session.send = METRICS_STATE["original_send"]
+        METRICS_STATE["finished"] = True
+
+    write_download_metrics(METRICS_STATE["metrics_path"])
+    METRICS_STATE["enabled"] = False
+
+def record_response(response, latency, bytes_received):
+    """
+    This function adds a response to the metrics: its status code, the status codes of the
+    attempts retried before it, its latency and its size.
+
+    #INPUT
+    - response (requests.Response); The response of the request.
+    - latency (float); The seconds since the request was sent until its content was read.
+    - bytes_received (integer); The size of the content of the response.
+    """
+    retry_history = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+
+    with METRICS_LOCK:
+        METRICS_STATE["status_counter"][str(response.status_code)] += 1
+        for retry in retry_history:
+            METRICS_STATE["status_counter"][str(retry.status) if retry.status else "error"] += 1
+        METRICS_STATE["retries"] += len(retry_history)
+        METRICS_STATE["bytes_received"] += bytes_received
+
+        METRICS_STATE["latency_bucket_array"][np.searchsorted(LATENCY_BUCKET_LIST, latency)] += 1
+        METRICS_STATE["latency_sum"] += latency
+        METRICS_STATE["latency_count"] += 1
+        METRICS_STATE["latency_reservoir"].append(latency)
+
+def expect_records(record_count):
+    """
+    This function adds a number of records to the records expected in the download. It
+    does nothing unless the metrics have been started.
+
+    #INPUT
+    - record_count (integer); The number of records that will be downloaded.
+    """
+    if not METRICS_STATE["enabled"]:
+        return
+
+    with METRICS_LOCK:
+        METRICS_STATE["records_expected"] += record_count
+
+def count_records(record_count=1):
+    """
+    This function adds a number of records to the records downloaded. It does nothing
+    unless the metrics have been started.
+
+    #INPUT
+    - record_count (integer); The number of records downloaded.
+    """
+    if not METRICS_STATE["enabled"]:
+        return
+
+    with METRICS_LOCK:
+        METRICS_STATE["records_downloaded"] += record_count
+        METRICS_STATE["last_record_time"] = time.time()
+
+def snapshot_download_metrics():
+    """
+    This function computes the current values of the metrics.
+
+    #OUTPUT
+    - metrics_dic (dictionary); A dictionary with the value of each metric.
+    """
+    now = time.time()
+
+    with METRICS_LOCK:
+        records_downloaded = METRICS_STATE["records_downloaded"]
+        records_expected = max(METRICS_STATE["records_expected"], records_downloaded)
+
+        # Compute the records per second in the last minute, from the samples of the previous exports
+        rate_sample_deque = METRICS_STATE["rate_sample_deque"]
+        rate_sample_deque.append((now, records_downloaded))
+        while len(rate_sample_deque) > 2 and now - rate_sample_deque[1][0] >= RATE_WINDOW:
+            rate_sample_deque.popleft()
+        if now - rate_sample_deque[0][0] > 0:
+            records_per_second = (records_downloaded - rate_sample_deque[0][1]) / (now - rate_sample_deque[0][0])
+        else:
+            records_per_second = 0.0
+
+        latency_array = np.array(METRICS_STATE["latency_reservoir"], dtype=float)
+        metrics_dic = {
+            "updated_at": now,
+            "elapsed_s": now - METRICS_STATE["start"],
+            "finished": METRICS_STATE["finished"],
+            "requests_in_flight": METRICS_STATE["in_flight"],
+            "responses_per_status": dict(METRICS_STATE["status_counter"]),
+            "retries_total": METRICS_STATE["retries"],
+            "request_errors_total": METRICS_STATE["errors"],
+            "bytes_received": METRICS_STATE["bytes_received"],
+            "records_expected": records_expected,
+            "records_downloaded": records_downloaded,
+            "records_per_second": records_per_second,
+            "eta_s": (records_expected - records_downloaded) / records_per_second if records_per_second > 0 else (0.0 if records_expected == records_downloaded else None),
+            "last_record_age_s": now - METRICS_STATE["last_record_time"] if METRICS_STATE["last_record_time"] else None,
+            "latency_s": {f"p{percentile}": float(np.percentile(latency_array, percentile)) if len(latency_array) else None for percentile in [50, 90, 99]},
+            "latency_histogram": {"buckets": dict(zip([str(bucket) for bucket in LATENCY_BUCKET_LIST] + ["+Inf"], np.cumsum(METRICS_STATE["latency_bucket_array"]).tolist())),
+                                  "sum": METRICS_STATE["latency_sum"], "count": METRICS_STATE["latency_count"]}}
+
+    return metrics_dic
+
+def format_prometheus_metrics(metrics_dic):
+    """
+    This function formats the metrics in the Prometheus text exposition format.
+
+    #INPUT
+    - metrics_dic (dictionary); A dictionary with the value of each metric.
+    #OUTPUT
+    - prometheus_text (string); The metrics in Prometheus text format.
+    """
+    line_list = []
+
+    def add_metric(name, metric_type, help_text, sample_list):
+        line_list.extend([f"# HELP proteoparc_download_{name} {help_text}", f"# TYPE proteoparc_download_{name} {metric_type}"])
+        for suffix, label_text, value in sample_list:
+            line_list.append(f"proteoparc_download_{name}{suffix}{label_text} {'NaN' if value is None else value}")
+
+    add_metric("requests_in_flight", "gauge", "HTTP requests sent and not answered yet.", [("", "", metrics_dic["requests_in_flight"])])
+    add_metric("responses_total", "counter", "HTTP responses per status code, including the retried ones.",
+               [("", f'{{status="{status}"}}', count) for status, count in sorted(metrics_dic["responses_per_status"].items())])
+    add_metric("retries_total", "counter", "HTTP requests retried.", [("", "", metrics_dic["retries_total"])])
+    add_metric("request_errors_total", "counter", "HTTP requests failed without a response.", [("", "", metrics_dic["request_errors_total"])])
+    add_metric("received_bytes_total", "counter", "Size of the HTTP responses received.", [("", "", metrics_dic["bytes_received"])])
+    add_metric("request_duration_seconds", "histogram", "Duration of the HTTP requests.",
+               [("_bucket", f'{{le="{bucket}"}}', count) for bucket, count in metrics_dic["latency_histogram"]["buckets"].items()] +
+               [("_sum", "", metrics_dic["latency_histogram"]["sum"]), ("_count", "", metrics_dic["latency_histogram"]["count"])])
+    add_metric("request_duration_quantile_seconds", "gauge", f"Percentiles of the duration of the last {LATENCY_RESERVOIR_SIZE} HTTP requests.",
+               [("", f'{{quantile="{int(percentile_name[1:]) / 100:g}"}}', value) for percentile_name, value in metrics_dic["latency_s"].items()])
+    add_metric("records_expected", "gauge", "JSON records listed to download.", [("", "", metrics_dic["records_expected"])])
+    add_metric("records_total", "counter", "JSON records downloaded.", [("", "", metrics_dic["records_downloaded"])])
+    add_metric("records_per_second", "gauge", f"JSON records downloaded per second in the last {RATE_WINDOW:.0f} seconds.", [("", "", metrics_dic["records_per_second"])])
+    add_metric("eta_seconds", "gauge", "Estimated seconds to download the remaining records.", [("", "", metrics_dic["eta_s"])])
+    add_metric("last_record_age_seconds", "gauge", "Seconds since the last record was downloaded.", [("", "", metrics_dic["last_record_age_s"])])
+    add_metric("finished", "gauge", "1 if the download has finished.", [("", "", int(metrics_dic["finished"]))])
+    add_metric("updated_timestamp_seconds", "gauge", "Unix time of the last update of the metrics.", [("", "", metrics_dic["updated_at"])])
+
+    return "\n".join(line_list) + "\n"
+
+def write_download_metrics(metrics_path):
+    """
+    This function writes the current metrics to the status file, replacing it atomically.
+
+    #INPUT
+    - metrics_path (string); The path to the status file (.prom for Prometheus, JSON otherwise).
+    #WRITE OUTPUT
+    - {metrics_path}; The status file with the current metrics of the download.
+    """
+    metrics_dic = snapshot_download_metrics()
+
+    with open(f"{metrics_path}.tmp", "w") as metrics_file:
+        if metrics_path.endswith(".prom"):
+            metrics_file.write(format_prometheus_metrics(metrics_dic))
+        else:
+            json.dump(metrics_dic, metrics_file, indent=1)
+
+    os.replace(f"{metrics_path}.tmp", metrics_path)
+
+def format_seconds(seconds, decimals=0):
+    """
+    This function formats a number of seconds for the status summary.
+
+    #INPUT
+    - seconds (float); The number of seconds. It can be None if unknown.
+    - decimals (integer); The number of decimals.
+    #OUTPUT
+    - seconds_text (string); The formatted seconds, or "-" if unknown.
+    """
+    if seconds is None:
+        return "-"
+
+    return f"{seconds:.{decimals}f} s"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# Global imports
+import os
+import json
+import mmap
+import sqlite3
+import argparse
+import pandas as pd
+
+# Local imports
+from fasta_index import write_fasta_index
+from metadata_proteoparc import read_metadata_database, scan_fasta_headers
+from pipeline_profiler import profile_step
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script extracts a sub-database from a database built by proteoparc.py, selecting the
+records by gene name, species (or genus), TaxID or repository. It can be run alone, or as
+"python3 proteoparc.py extract".
+
+The selection is backed by a query index (metadata/.query_index.sqlite), built the first
+time from the faidx index of the database, metadata/records_info.csv and the extra
+metadata of the SQLite file (.records_metadata.sqlite). The index stores the byte range of
+each record in the database, and a table with each gene, species, genus, TaxID and
+repository of each record. Records associated with several species or repositories are
+indexed under all of them. The index is built again if the database or its metadata change.
+
+The records selected are copied as bytes from the database, without parsing it, so the
+time to write a sub-database depends on its size instead of the size of the database. The
+values of the same filter are combined with OR, and different filters with AND. For
+instance, "--genus Elephas --repository RefSeq" selects the Elephas records in RefSeq.
+"""
+
+QUERY_INDEX_NAME = ".query_index.sqlite" # The query index file, stored in the metadata folder
+QUERY_FIELD_LIST = ["gene", "species", "genus", "taxid", "repository"]
+
+def main(argument_list=None):
+
+    results_folder_path, query_dic, output_path = parser(argument_list)
+
+    database_path = f"{results_folder_path}/{os.path.basename(results_folder_path)}_database.fasta"
+    if not os.path.exists(database_path):
+        print(f"ERROR: The database '{database_path}' does not exist")
+        exit(0)
+
+    if not query_dic:
+        print("ERROR: No filter selected. Please select at least one of --gene, --species, --genus, --taxid or --repository")
+        exit(0)
+
+    query_connection = open_query_index(results_folder_path, database_path)
+    record_range_list = query_record_ranges(query_connection, query_dic)
+    query_connection.close()
+
+    write_record_ranges(database_path, record_range_list, output_path)
+    print(f"# {len(record_range_list)} records written in '{output_path}'")
+
+def parser(argument_list=None):
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #INPUT
+    - argument_list (list); A list with the arguments to parse. If None, the arguments are
+      read from the terminal (sys.argv).
+    #OUTPUT
+    - results_folder_path (string); The path to the results folder of a ProteoParc project.
+    - query_dic (dictionary); A dictionary with the values of each filter selected.
+    - output_path (string); The path to write the sub-database.
+    """
+    parser = argparse.ArgumentParser(description="A script to extract the records of a ProteoParc database by gene, species, TaxID or repository")
+    parser.add_argument("results_folder_path", type=str, help="The path to the results folder of a project (the folder containing {project}_database.fasta)")
+    parser.add_argument("--output", "-o", dest="output", type=str, help="The path to write the extracted multi-fasta", required=True, nargs=1)
+    parser.add_argument("--gene", dest="gene", type=str, help="The gene names to extract ('no gene' for the records without gene name)", required=False, nargs="+")
+    parser.add_argument("--species", dest="species", type=str, help="The scientific names of the species to extract", required=False, nargs="+")
+    parser.add_argument("--genus", dest="genus", type=str, help="The genera to extract", required=False, nargs="+")
+    parser.add_argument("--taxid", dest="taxid", type=str, help="The TaxIDs of the species to extract", required=False, nargs="+")
+    parser.add_argument("--repository", dest="repository", type=str, help="The repositories to extract (e.g. RefSeq, UniProtKB/Swiss-Prot)", required=False, nargs="+")
+
+    args = parser.parse_args(argument_list)
+
+    results_folder_path = os.path.realpath(args.results_folder_path)
+    query_dic = {field: getattr(args, field) for field in QUERY_FIELD_LIST if getattr(args, field)}
+    output_path = os.path.realpath(args.output[0])
+
+    return results_folder_path, query_dic, output_path
+
+def file_signature(path):
+    """
+    This function computes a cheap signature of a file, based on its size and last
+    modification time.
+
+    #INPUT
+    - path (string); The path to the file.
+    #OUTPUT
+    - signature (list); A list with the size and the modification time (ns) of the file.
+      If the file does not exist, the variable is assigned as None.
+    """
+    if not os.path.exists(path):
+        return None
+
+    file_stat = os.stat(path)
+
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+def open_query_index(results_folder_path, database_path):
+    """
+    This function opens the query index of a database, building it first if it does not
+    exist or if the database or its metadata have changed since it was built.
+
+    #INPUT
+    - results_folder_path (string); The path to the results folder of a ProteoParc project.
+    - database_path (string); The path to the multi-fasta database.
+    #OUTPUT
+    - query_connection (sqlite3.Connection); An open connection to the query index.
+    """
+    metadata_folder_path = f"{results_folder_path}/metadata"
+    query_index_path = f"{metadata_folder_path}/{QUERY_INDEX_NAME}"
+    index_signature = json.dumps([file_signature(database_path), file_signature(f"{metadata_folder_path}/records_info.csv"),
+                                  file_signature(f"{results_folder_path}/.records_metadata.sqlite")])
+
+    if os.path.exists(query_index_path):
+        query_connection = sqlite3.connect(query_index_path)
+        try:
+            stored_signature = query_connection.execute("SELECT signature FROM index_signature").fetchone()[0]
+        except (sqlite3.DatabaseError, TypeError):
+            stored_signature = None
+
+        if stored_signature == index_signature:
+            return query_connection
+        query_connection.close()
+
+    if not os.path.exists(metadata_folder_path):
+        os.mkdir(metadata_folder_path)
+
+    print("# Building the query index of the database")
+    with profile_step("build_query_index"):
+        build_query_index(results_folder_path, database_path, query_index_path, index_signature)
+
+    return sqlite3.connect(query_index_path)
+
+def read_record_ranges(database_path):
+    """
+    This function reads the byte range of each record in a multi-fasta database from its
+    faidx index (written first if it does not exist). The faidx index stores where each
+    sequence starts, so the header start is found reading backwards until the previous
+    line break.
+
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    #OUTPUT
+    - record_range_df (pd.DataFrame); A dataframe with the name, start and end byte of
+      each record, in the order of the database.
+    """
+    if not os.path.exists(f"{database_path}.fai") or os.path.getmtime(f"{database_path}.fai") < os.path.getmtime(database_path):
+        write_fasta_index(database_path)
+
+    fasta_index_df = pd.read_csv(f"{database_path}.fai", sep="\t", header=None, usecols=[0, 2], names=["Name", "Offset"],
+                                 dtype={"Name": str, "Offset": "int64"}, quoting=3, keep_default_na=False)
+    fasta_index_df = fasta_index_df.sort_values("Offset", kind="stable").reset_index(drop=True)
+
+    with open(database_path, "rb") as database_file:
+        database_mmap = mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ)
+        start_list = [database_mmap.rfind(b"\n", 0, offset - 1) + 1 for offset in fasta_index_df["Offset"]]
+        database_size = len(database_mmap)
+        database_mmap.close()
+
+    # Each record ends where the header of the next one starts
+    record_range_df = pd.DataFrame({"Name": fasta_index_df["Name"], "Start": start_list})
+    record_range_df["End"] = record_range_df["Start"].shift(-1, fill_value=database_size).astype("int64")
+
+    return record_range_df
+
+def build_query_index(results_folder_path, database_path, query_index_path, index_signature):
+    """
+    This function builds the query index of a database, combining the byte range of each
+    record with its metadata. The metadata is read from metadata/records_info.csv (or from
+    the database headers if it does not exist), and the repositories, species and TaxIDs
+    are replaced by the ones of the SQLite metadata file, if it exists.
+
+    #INPUT
+    - results_folder_path (string); The path to the results folder of a ProteoParc project.
+    - database_path (string); The path to the multi-fasta database.
+    - query_index_path (string); The path to write the query index.
+    - index_signature (string); The signature of the database and its metadata.
+    #WRITE OUTPUT
+    - {query_index_path}; A SQLite file with the byte range of each record ('records' table),
+      each gene, species, genus, TaxID and repository of each record ('record_keys' table),
+      and the signature of the files employed to build it.
+    """
+    record_range_df = read_record_ranges(database_path)
+
+    # Read the metadata of each record, in the order of the database
+    if os.path.exists(f"{results_folder_path}/metadata/records_info.csv"):
+        record_info_df = pd.read_csv(f"{results_folder_path}/metadata/records_info.csv", dtype=str, keep_default_na=False)
+    else:
+        record_info_df, _ = scan_fasta_headers(database_path)
+    record_info_df = record_info_df.reset_index(drop=True)
+
+    if len(record_info_df) != len(record_range_df) or \
+       not record_range_df["Name"].str.contains(r"|", regex=False).all() or \
+       (record_range_df["Name"].str.split("|").str[1].str[:13] != record_info_df["Unic Identifier"].to_numpy()).any():
+        print("ERROR: metadata/records_info.csv does not match the database. Please generate the metadata again (proteoparc.py or metadata_proteoparc.py)")
+        exit(0)
+
+    if os.path.exists(f"{results_folder_path}/.records_metadata.sqlite"):
+        records_metadata_df = read_metadata_database(f"{results_folder_path}/.records_metadata.sqlite", record_info_df["Unic Identifier"])
+        for column_name in ["Repository", "Species", "TaxID"]:
+            metadata_sr = record_info_df["Unic Identifier"].map(records_metadata_df[column_name])
+            record_info_df[column_name] = metadata_sr.where(metadata_sr.fillna("") != "", record_info_df[column_name])
+
+    # Store a row per each value of each field, splitting the semicolon-separated values
+    record_key_df_list = []
+    for field, column_name in [("gene", "Gene"), ("species", "Species"), ("taxid", "TaxID"), ("repository", "Repository")]:
+        value_sr = record_info_df[column_name].astype(str)
+        if field != "gene":
+            value_sr = value_sr.str.split(";").explode()
+        record_key_df_list.append(pd.DataFrame({"field": field, "value": value_sr.str.strip(), "record": value_sr.index}))
+
+        if field == "species":
+            record_key_df_list.append(pd.DataFrame({"field": "genus", "value": value_sr.str.split(" ").str[0], "record": value_sr.index}))
+
+    record_key_df = pd.concat(record_key_df_list, ignore_index=True).drop_duplicates()
+    record_key_df = record_key_df.loc[record_key_df["value"] != ""]
+
+    if os.path.exists(query_index_path):
+        os.remove(query_index_path)
+
+    with sqlite3.connect(query_index_path) as query_connection:
+        query_connection.execute("CREATE TABLE records (record INTEGER PRIMARY KEY, name TEXT, start INTEGER, end INTEGER)")
+        query_connection.execute("CREATE TABLE record_keys (field TEXT, value TEXT COLLATE NOCASE, record INTEGER)")
+        query_connection.execute("CREATE TABLE index_signature (signature TEXT)")
+
+        query_connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?)", zip(record_range_df.index.tolist(), record_range_df["Name"],
+                                                                                     record_range_df["Start"].tolist(), record_range_df["End"].tolist()))
+        query_connection.executemany("INSERT INTO record_keys VALUES (?, ?, ?)", zip(record_key_df["field"], record_key_df["value"], record_key_df["record"].tolist()))
+        query_connection.execute("CREATE INDEX record_keys_index ON record_keys (field, value)")
+        query_connection.execute("INSERT INTO index_signature VALUES (?)", (index_signature,))
+
+    query_connection.close()
+
+def query_record_ranges(query_connection, query_dic):
+    """
+    This function selects the records fulfilling all the filters of a query. The values of
+    the same filter are combined with OR, and different filters with AND. The values are
+    compared case-insensitively.
+
+    #INPUT
+    - query_connection (sqlite3.Connection); An open connection to the query index.
+    - query_dic (dictionary); A dictionary with the values of each filter (gene, species,
+      genus, taxid and/or repository).
+    #OUTPUT
+    - record_range_list (list); A list with the (start, end) byte range of each record
+      selected, in the order of the database.
+    """
+    subquery_list = []
+    parameter_list = []
+    for field, value_list in query_dic.items():
+        subquery_list.append(f"SELECT record FROM record_keys WHERE field = ? AND value IN ({', '.join('?' * len(value_list))})")
+        parameter_list += [field] + [str(value).strip() for value in value_list]
+
+    record_range_list = query_connection.execute(f"SELECT start, end FROM records WHERE record IN ({' INTERSECT '.join(subquery_list)}) ORDER BY record",
+                                                 parameter_list).fetchall()
+
+    return record_range_list
+
+def write_record_ranges(database_path, record_range_list, output_path):
+    """
+    This function copies some byte ranges of a multi-fasta database in a new file. The
+    consecutive ranges are copied together.
+
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    - record_range_list (list); A list with the (start, end) byte range of each record.
+    - output_path (string); The path to write the extracted multi-fasta.
+    #WRITE OUTPUT
+    - {output_path}; A multi-fasta file with the records selected.
+    """
+    # Merge the consecutive ranges
+    merged_range_list = []
+    for start, end in record_range_list:
+        if merged_range_list and merged_range_list[-1][1] == start:
+            merged_range_list[-1][1] = end
+        else:
+            merged_range_list.append([start, end])
+
+    with open(database_path, "rb") as database_file, open(output_path, "wb") as output_file:
+        if not merged_range_list:
+            return
+
+        database_mmap = mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ)
+        for start, end in merged_range_list:
+            output_file.write(database_mmap[start:end])
+        database_mmap.close()
+
+if __name__ == "__main__":
+    main()
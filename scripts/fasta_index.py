@@ -0,0 +1,326 @@
+# Global imports
+import os
+import sys
+import mmap
+import struct
+import bisect
+import argparse
+from Bio import SeqIO, bgzf
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+# Local imports
+from pipeline_profiler import profile_step
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script indexes a multi-fasta database, so single records can be retrieved without
+reading the whole file. The index is written in the samtools faidx format ({database}.fai),
+so it can also be employed by other tools (samtools, pyfaidx, IGV...). It has a line per
+record with 5 tab-separated columns: the record name (the header until the first space), the
+sequence length, the byte offset of the sequence, and the number of residues and bytes per
+sequence line.
+
+Optionally, the database can also be compressed in BGZF format ({database}.gz), a gzip
+file made of independent blocks, together with its index ({database}.gz.fai) and the
+position of each block ({database}.gz.gzi), as written by "samtools faidx" and "bgzip -i".
+
+The records are retrieved by their name or UniParc ID (UPI): the plain database is mapped
+in memory and only the bytes of the requested records are read, while in the compressed
+database only the blocks containing them are decompressed.
+"""
+
+def main():
+
+    fasta_path, fetch_id_list, do_bgzip = parser()
+
+    if not fetch_id_list:
+        write_fasta_index(fasta_path, do_bgzip)
+        return
+
+    if not os.path.exists(f"{fasta_path}.fai"):
+        print(f"ERROR: The index '{fasta_path}.fai' does not exist. Please run this script without --fetch first")
+        exit(0)
+
+    SeqIO.write(fetch_records(fasta_path, fetch_id_list), sys.stdout, "fasta")
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - fasta_path (string); The path to the multi-fasta database (or its BGZF version).
+    - fetch_id_list (list); A list with the names or UPIs of the records to retrieve. If no
+      records are specified, the variable is assigned as None and the index is written.
+    - do_bgzip (boolean); A boolean indicator to indicate if the database is also
+      compressed in BGZF format.
+    """
+    parser = argparse.ArgumentParser(description="A script to index a multi-fasta database and retrieve records by their UPI")
+    parser.add_argument("fasta_path", type=str, help="The path to the multi-fasta database (or its .gz BGZF version with --fetch)")
+    parser.add_argument("--fetch", dest="fetch", type=str, help="The names or UPIs of the records to print, instead of writing the index (not mandatory)", required=False, nargs="+")
+    parser.add_argument("--bgzip", dest="bgzip", action=argparse.BooleanOptionalAction, help="Also compress the database in BGZF format, with its index (default: False; --no-bgzip)", default=False, required=False)
+
+    args = parser.parse_args()
+
+    fasta_path = os.path.realpath(args.fasta_path)
+    fetch_id_list = args.fetch
+    do_bgzip = args.bgzip
+
+    return fasta_path, fetch_id_list, do_bgzip
+
+def write_fasta_index(fasta_path, do_bgzip=False):
+    """
+    This function writes the faidx index of a multi-fasta database, and optionally its
+    BGZF compressed version.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta database.
+    - do_bgzip (boolean); A boolean indicator to indicate if the database is also
+      compressed in BGZF format.
+    #OUTPUT
+    - fasta_index_list (list); A list with the index entry of each record.
+    #WRITE OUTPUT
+    - {fasta_path}.fai; The faidx index of the database.
+    - {fasta_path}.gz; The BGZF compressed database (only if do_bgzip).
+    - {fasta_path}.gz.fai; The faidx index of the compressed database (only if do_bgzip).
+    - {fasta_path}.gz.gzi; The position of each BGZF block (only if do_bgzip).
+    """
+    with profile_step("fasta_index"):
+        fasta_index_list = compute_fasta_index(fasta_path)
+        fasta_index_lines = "".join("\t".join(str(value) for value in index_entry) + "\n" for index_entry in fasta_index_list)
+
+        with open(f"{fasta_path}.fai", "wt") as index_file:
+            index_file.write(fasta_index_lines)
+
+    # The offsets of the BGZF index refer to the uncompressed file, so both indexes are equal
+    if do_bgzip:
+        with profile_step("bgzip"):
+            bgzip_fasta(fasta_path, f"{fasta_path}.gz")
+            with open(f"{fasta_path}.gz.fai", "wt") as index_file:
+                index_file.write(fasta_index_lines)
+
+    return fasta_index_list
+
+def compute_fasta_index(fasta_path):
+    """
+    This function reads a multi-fasta file line by line, storing the position and line
+    layout of each record. As in samtools, all the sequence lines of a record (except the
+    last one) must have the same length, and the records with a repeated name are ignored.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta file.
+    #OUTPUT
+    - fasta_index_list (list); A list with a (name, length, offset, line_bases, line_width)
+      tuple per each record.
+    """
+    fasta_index_list = []
+    name_set = set()
+    index_entry = None
+    offset = 0
+
+    def close_record(index_entry):
+        if index_entry is None:
+            return
+        if index_entry["name"] in name_set:
+            print(f"WARNING: Ignoring the duplicated record '{index_entry['name']}' in the index")
+            return
+        name_set.add(index_entry["name"])
+        fasta_index_list.append((index_entry["name"], index_entry["length"], index_entry["offset"], index_entry["line_bases"], index_entry["line_width"]))
+
+    with open(fasta_path, "rb") as fasta_file:
+        for line in fasta_file:
+
+            if line.startswith(b">"):
+                close_record(index_entry)
+                header = line[1:].decode().strip()
+                index_entry = {"name": header.split()[0] if header else "", "length": 0, "offset": offset + len(line),
+                               "line_bases": 0, "line_width": 0, "is_last_line": False}
+
+            elif index_entry is not None and not line.strip():
+                index_entry["is_last_line"] = True
+
+            elif index_entry is not None:
+                line_bases = len(line.rstrip(b"\r\n"))
+
+                # Only the last sequence line of a record can be shorter than the rest
+                if index_entry["is_last_line"] or (index_entry["line_bases"] and line_bases > index_entry["line_bases"]):
+                    raise ValueError(f"Different line length in the sequence of '{index_entry['name']}' ({fasta_path})")
+                if not index_entry["line_bases"]:
+                    index_entry["line_bases"], index_entry["line_width"] = line_bases, len(line)
+                elif line_bases < index_entry["line_bases"] or len(line) != index_entry["line_width"]:
+                    index_entry["is_last_line"] = True
+
+                index_entry["length"] += line_bases
+
+            offset += len(line)
+
+    close_record(index_entry)
+
+    return fasta_index_list
+
+def bgzip_fasta(fasta_path, bgzf_path):
+    """
+    This function compresses a file in BGZF format, and writes the position of each block
+    in the compressed and uncompressed file (the .gzi index of bgzip).
+
+    #INPUT
+    - fasta_path (string); The path to the uncompressed file.
+    - bgzf_path (string); The path to write the compressed file.
+    #WRITE OUTPUT
+    - {bgzf_path}; The BGZF compressed file.
+    - {bgzf_path}.gzi; A binary file with the number of blocks (except the first one) and
+      the compressed and uncompressed offset of each block, as little-endian 64-bit integers.
+    """
+    with open(fasta_path, "rb") as fasta_file, bgzf.BgzfWriter(bgzf_path, "wb") as bgzf_writer:
+        for chunk in iter(lambda: fasta_file.read(1 << 20), b""):
+            bgzf_writer.write(chunk)
+
+    with open(bgzf_path, "rb") as bgzf_file:
+        block_offset_list = [(block_start, data_start) for block_start, _, data_start, data_length in bgzf.BgzfBlocks(bgzf_file) if data_length]
+
+    with open(f"{bgzf_path}.gzi", "wb") as gzi_file:
+        gzi_file.write(struct.pack("<Q", len(block_offset_list) - 1))
+        for block_start, data_start in block_offset_list[1:]:
+            gzi_file.write(struct.pack("<QQ", block_start, data_start))
+
+def retrieve_upi(record_name):
+    """
+    This function retrieves the UniParc ID from the name of a record, written as
+    "{repository}|{UPI}|{last update}" (or "{repository}|{UPI}_{gene}|{last update}").
+
+    #INPUT
+    - record_name (string); The record name (the header until the first space).
+    #OUTPUT
+    - upi (string); The UniParc ID of the record. If the name has a different format,
+      the variable is assigned as None.
+    """
+    name_field_list = record_name.split("|")
+
+    if len(name_field_list) < 3:
+        return None
+
+    return name_field_list[1].split("_")[0]
+
+def read_fasta_index(fasta_path):
+    """
+    This function reads the faidx index of a multi-fasta database, so its records can be
+    retrieved by name or UPI. The index is read once, and can be employed to retrieve
+    records as many times as required.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta database (or its BGZF version).
+    #OUTPUT
+    - fasta_index (dictionary); A dictionary with the index entry (length, offset, line
+      bases and line width) of each record name ("records"), the record names of each
+      UPI ("upis"), and the block offsets of the BGZF database ("blocks", None if the
+      database is not compressed).
+    """
+    fasta_index = {"records": {}, "upis": {}, "blocks": None}
+
+    with open(f"{fasta_path}.fai", "rt") as index_file:
+        for line in index_file:
+            name, length, offset, line_bases, line_width = line.rstrip("\n").split("\t")[:5]
+            fasta_index["records"][name] = (int(length), int(offset), int(line_bases), int(line_width))
+            fasta_index["upis"].setdefault(retrieve_upi(name), []).append(name)
+
+    if os.path.exists(f"{fasta_path}.gzi"):
+        with open(f"{fasta_path}.gzi", "rb") as gzi_file:
+            block_count = struct.unpack("<Q", gzi_file.read(8))[0]
+            block_offset_list = [struct.unpack("<QQ", gzi_file.read(16)) for _ in range(block_count)]
+        fasta_index["blocks"] = [(0, 0)] + block_offset_list
+
+    return fasta_index
+
+def fetch_records(fasta_path, record_id_list, fasta_index=None):
+    """
+    This function retrieves some records from an indexed multi-fasta database, reading
+    only their bytes (or the BGZF blocks containing them).
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta database (or its BGZF version).
+    - record_id_list (list); A list with the names or UPIs of the records to retrieve. If
+      a UPI is present in several records (one per gene), all of them are retrieved.
+    - fasta_index (dictionary); The index of the database, from read_fasta_index(). If no
+      index is specified, it is read from the .fai file.
+    #OUTPUT
+    - records_fasta_list (list); A list with the SeqRecord objects of the records found,
+      in the requested order.
+    """
+    if fasta_index is None:
+        fasta_index = read_fasta_index(fasta_path)
+
+    with open(fasta_path, "rb") as fasta_file:
+
+        # Read the byte ranges from the memory-mapped file, or from the BGZF blocks
+        if fasta_index["blocks"] is None:
+            fasta_mmap = mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ)
+            read_range = lambda start, end: fasta_mmap[start:end]
+        else:
+            bgzf_reader = bgzf.BgzfReader(fileobj=fasta_file, mode="rb")
+            read_range = lambda start, end: read_bgzf_range(bgzf_reader, fasta_index["blocks"], start, end)
+
+        records_fasta_list = []
+        for record_id in record_id_list:
+            for record_name in fasta_index["upis"].get(record_id, [record_id] if record_id in fasta_index["records"] else []):
+                records_fasta_list.append(read_indexed_record(read_range, fasta_index["records"][record_name]))
+
+        if fasta_index["blocks"] is None:
+            fasta_mmap.close()
+
+    return records_fasta_list
+
+def read_bgzf_range(bgzf_reader, block_offset_list, start, end):
+    """
+    This function reads a byte range of the uncompressed content of a BGZF file, seeking
+    the block that contains the start of the range.
+
+    #INPUT
+    - bgzf_reader (Bio.bgzf.BgzfReader); An open reader of the BGZF file.
+    - block_offset_list (list); A list with the (compressed, uncompressed) offset of each block.
+    - start (integer); The uncompressed offset of the first byte.
+    - end (integer); The uncompressed offset after the last byte.
+    #OUTPUT
+    - range_bytes (bytes); The uncompressed bytes of the range.
+    """
+    block_index = bisect.bisect_right(block_offset_list, start, key=lambda block_offset: block_offset[1]) - 1
+    block_start, data_start = block_offset_list[block_index]
+
+    bgzf_reader.seek(bgzf.make_virtual_offset(block_start, start - data_start))
+
+    return bgzf_reader.read(end - start)
+
+def read_indexed_record(read_range, index_entry):
+    """
+    This function reads a record from its index entry. The header is found reading
+    backwards from the start of the sequence until the previous line break.
+
+    #INPUT
+    - read_range (function); A function returning the bytes between two offsets.
+    - index_entry (tuple); The (length, offset, line bases, line width) of the record.
+    #OUTPUT
+    - protein_record_fasta (SeqRecord); The record, with the whole header as ID.
+    """
+    length, offset, line_bases, line_width = index_entry
+
+    # Read the header, which ends right before the sequence offset
+    window = 256
+    while True:
+        header_bytes = read_range(max(0, offset - window), offset).rstrip(b"\r\n")
+        if b"\n" in header_bytes or window >= offset:
+            break
+        window *= 2
+    header = header_bytes.rsplit(b"\n", 1)[-1][1:].decode().strip()
+
+    # Read the sequence lines, removing the line breaks
+    line_count, last_line_bases = divmod(length, line_bases) if line_bases else (0, 0)
+    sequence_bytes = read_range(offset, offset + line_count * line_width + last_line_bases)
+    sequence = sequence_bytes.replace(b"\n", b"").replace(b"\r", b"").decode()
+
+    return SeqRecord(Seq(sequence), id=header, description="")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,627 @@
+# Global imports
+import os
+import re
+import json
+import time
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+import contextlib
+
+# Local imports
+from sequence_store import create_sequence_store, build_sequence_store, store_header_list, write_store_fasta
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script keeps a store shared by several ProteoParc projects, so the records and the
+per-gene outputs that are the same in different projects are stored only once on disk. A
+SQLite index (store.sqlite) keeps six tables:
+
+1. records; Each protein record, keyed by its UPI and the SHA-256 digest of its sequence,
+   with the sequence stored once for all the projects.
+2. project_files; Each indexed project database file, with its size and modification time
+   when it was indexed, so the files not modified since then are not read again.
+3. project_records; The index of each project database file into the records: the position
+   and header of each record of the file. A database file removed from a project (but not
+   its folder) can be written again from its index (materialize command).
+4. objects; The per-gene artifacts stored once, named by the SHA-256 digest of their content
+   (objects/{2 first characters}/{digest}), with their size and modification time when they
+   were stored.
+5. refs; Each project file materialized from an object, with the way it was linked: a reflink
+   (copy-on-write clone, in file systems such as Btrfs or XFS), a hard link or, if none of
+   them is possible, a copy.
+6. gene_artifacts; The output of a per-gene step (e.g. the alignment of a gene), keyed by the
+   digest of the step, its parameters and the records of the gene (UPI headers and sequences).
+   A gene with the same records in another project reuses the stored alignment instead of
+   running the aligner again.
+
+The database files are not linked to the store, as they can be edited by hand: the store only
+keeps their records once, so they can be written again from it. The objects are read-only, so a
+project file hard-linked to an object cannot be modified in place (ProteoParc replaces its
+outputs instead of writing over them when a step runs again), while a reflinked or copied file
+stays writable. Each build holds a shared lock of the store (gc.lock) while it runs, so the
+garbage collector, which removes the records and objects not employed by any project (e.g.
+after removing a project folder), waits for the running builds.
+
+The script can also be run from the command line to show the size of the store, to run the
+garbage collector or to write a project database file again from its index.
+"""
+
+GLOBAL_STORE_STATE = {"store_path": None, "gc_lock_file": None}
+FICLONE = 0x40049409 # The Linux ioctl request to clone (reflink) a file
+UPI_REGULAR_EXPRESSION = r"\|(UPI[0-9A-Z]{10})" # As the "Unic Identifier" column of metadata_proteoparc.py
+
+def main():
+
+    store_path, command, path_list, do_dry_run = parser()
+
+    if not os.path.exists(f"{store_path}/store.sqlite"):
+        print(f"ERROR: No global store found in '{store_path}'")
+        exit(0)
+
+    if command == "stats":
+        stats_dic = global_store_stats(store_path)
+        print(f"# Global store '{store_path}'")
+        print(f"   {stats_dic['records']} records ({stats_dic['record_bytes'] / 1e6:.1f} MB), indexed {stats_dic['project_records']} times by the projects ({max(stats_dic['project_record_bytes'] - stats_dic['record_bytes'], 0) / 1e6:.1f} MB saved)")
+        print(f"   {stats_dic['objects']} objects ({stats_dic['object_bytes'] / 1e6:.1f} MB)")
+        print(f"   {stats_dic['references']} project files linked to the objects ({stats_dic['reference_bytes'] / 1e6:.1f} MB, {max(stats_dic['reference_bytes'] - stats_dic['object_bytes'], 0) / 1e6:.1f} MB saved)")
+        print(f"   {stats_dic['gene_artifacts']} per-gene artifacts")
+
+    elif command == "gc":
+        removed_reference_count, removed_object_count, removed_record_count, removed_bytes = collect_garbage(store_path, do_dry_run)
+        print(f"# {'Unreferenced entries found' if do_dry_run else 'Garbage collected'} in '{store_path}'")
+        print(f"   {removed_reference_count} stale project references")
+        print(f"   {removed_object_count} unreferenced objects and {removed_record_count} unreferenced records ({removed_bytes / 1e6:.1f} MB)")
+
+    elif command == "materialize":
+        if not path_list:
+            print("ERROR: Please indicate the project files to materialize with --paths")
+            exit(0)
+
+        configure_global_store(store_path)
+        for path in path_list:
+            if materialize_project_records(path):
+                print(f"# '{path}' written from the global store")
+            else:
+                print(f"WARNING: '{path}' is not indexed in the global store")
+        configure_global_store(None)
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - store_path (string); The path to the global store.
+    - command (string); The action to run (stats, gc or materialize).
+    - path_list (list); A list with the absolute paths to the project files to materialize.
+      If no path is specified, the variable is assigned as an empty list.
+    - do_dry_run (boolean); A boolean indicator to indicate if the garbage collector only
+      reports the unreferenced entries, without removing them.
+    """
+    parser = argparse.ArgumentParser(description="A script to show or clean the global store shared by ProteoParc projects")
+    parser.add_argument("store_path", type=str, help="The path to the global store")
+    parser.add_argument("command", type=str, help="Show the size of the store (stats), remove the unreferenced entries (gc) or write project database files again from the store (materialize)", choices=["stats", "gc", "materialize"])
+    parser.add_argument("--paths", dest="paths", type=str, help="The project database files to write again from the store (materialize)", required=False, default=[], nargs="+")
+    parser.add_argument("--dry-run", dest="dry_run", action=argparse.BooleanOptionalAction, help="Report the unreferenced entries without removing them (default: False; --no-dry-run)", default=False, required=False)
+
+    args = parser.parse_args()
+
+    store_path = os.path.realpath(args.store_path)
+    command = args.command
+    path_list = [os.path.realpath(path) for path in args.paths]
+    do_dry_run = args.dry_run
+
+    return store_path, command, path_list, do_dry_run
+
+def configure_global_store(store_path=None):
+    """
+    This function sets the global store employed by store_database_files() and the per-gene
+    artifact functions, and holds a shared lock of the store until the store is changed, so
+    the garbage collector does not run meanwhile. Without a store path, they do nothing.
+
+    #INPUT
+    - store_path (string); The path to the global store. If None, the store is disabled.
+    """
+
+    # Release the lock of the previous store
+    if GLOBAL_STORE_STATE["gc_lock_file"]:
+        GLOBAL_STORE_STATE["gc_lock_file"].close()
+        GLOBAL_STORE_STATE["gc_lock_file"] = None
+
+    if store_path:
+        os.makedirs(f"{store_path}/objects", exist_ok=True)
+        gc_lock_file = open(f"{store_path}/gc.lock", "a")
+        fcntl.flock(gc_lock_file, fcntl.LOCK_SH)
+        GLOBAL_STORE_STATE["gc_lock_file"] = gc_lock_file
+        open_global_store(store_path).close()
+
+    GLOBAL_STORE_STATE["store_path"] = store_path
+
+@contextlib.contextmanager
+def global_store_lock(store_path):
+    """
+    This function locks the index and the objects of the global store while they are
+    modified, for the threads of this process and for other processes (e.g. other builds).
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    """
+
+    with open(f"{store_path}/index.lock", "a") as index_lock_file:
+        fcntl.flock(index_lock_file, fcntl.LOCK_EX)
+        yield
+
+def open_global_store(store_path):
+    """
+    This function opens the index of the global store, creating its tables if needed.
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    #OUTPUT
+    - store_connection (sqlite3.Connection); The connection to the index of the store.
+    """
+
+    store_connection = sqlite3.connect(f"{store_path}/store.sqlite", timeout=60)
+    # The records are keyed by the binary digest of their sequence, and the index of the files has no row IDs, so its keys are not stored twice
+    store_connection.executescript("""CREATE TABLE IF NOT EXISTS records (upi TEXT, sequence_digest BLOB, sequence BLOB, created_at REAL, PRIMARY KEY (upi, sequence_digest));
+                                      CREATE TABLE IF NOT EXISTS project_files (file_id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime_ns INTEGER);
+                                      CREATE TABLE IF NOT EXISTS project_records (file_id INTEGER, position INTEGER, upi TEXT, sequence_digest BLOB, header TEXT, PRIMARY KEY (file_id, position)) WITHOUT ROWID;
+                                      CREATE INDEX IF NOT EXISTS project_records_key ON project_records (upi, sequence_digest);
+                                      CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, created_at REAL);
+                                      CREATE TABLE IF NOT EXISTS refs (path TEXT PRIMARY KEY, digest TEXT, method TEXT, size INTEGER, mtime_ns INTEGER);
+                                      CREATE TABLE IF NOT EXISTS gene_artifacts (artifact_key TEXT PRIMARY KEY, kind TEXT, digest TEXT, created_at REAL);""")
+
+    return store_connection
+
+def object_path(store_path, digest):
+    """
+    This function returns the path of an object in the global store.
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    - digest (string); The SHA-256 digest of the object.
+    #OUTPUT
+    - object_path (string); The path to the object.
+    """
+
+    return f"{store_path}/objects/{digest[:2]}/{digest}"
+
+def content_digest(path):
+    """
+    This function computes the SHA-256 digest of a file, reading it in blocks.
+
+    #INPUT
+    - path (string); The path to the file.
+    #OUTPUT
+    - digest (string); A SHA-256 hexadecimal digest.
+    """
+
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b""):
+            content_hash.update(block)
+
+    return content_hash.hexdigest()
+
+def file_signature(path):
+    """
+    This function returns the size and modification time of a file, to detect if it has been
+    modified.
+
+    #INPUT
+    - path (string); The path to the file.
+    #OUTPUT
+    - signature_list (list); A list with the size and the modification time (ns) of the file.
+    """
+
+    path_stat = os.stat(path)
+
+    return [path_stat.st_size, path_stat.st_mtime_ns]
+
+def link_file(source_path, target_path):
+    """
+    This function places a file in a new path sharing its content: as a reflink if the file
+    system supports it (the copies are independent once modified), as a hard link if both
+    paths are in the same file system, or as a copy otherwise. The target is replaced
+    atomically if it exists. It is only employed with the objects of the store, which are
+    read-only, so a hard link is never modified in place.
+
+    #INPUT
+    - source_path (string); The path to the file.
+    - target_path (string); The path to place the file.
+    #OUTPUT
+    - method (string); The way the file was placed (reflink, hardlink or copy).
+    """
+
+    temporary_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    try:
+        with open(source_path, "rb") as source_file, open(temporary_path, "wb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        method = "reflink"
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        try:
+            os.link(source_path, temporary_path)
+            method = "hardlink"
+        except OSError:
+            shutil.copyfile(source_path, temporary_path)
+            method = "copy"
+
+    os.replace(temporary_path, target_path)
+
+    return method
+
+def is_object_intact(store_connection, store_path, digest):
+    """
+    This function checks if an object of the global store has not been modified since it was
+    stored (e.g. through a hard link of a project file written in place).
+
+    #INPUT
+    - store_connection (sqlite3.Connection); The connection to the index of the store.
+    - store_path (string); The path to the global store.
+    - digest (string); The SHA-256 digest of the object.
+    #OUTPUT
+    - is_intact (boolean); True if the object exists and keeps its size and modification time.
+    """
+
+    object_row = store_connection.execute("SELECT size, mtime_ns FROM objects WHERE digest = ?", (digest,)).fetchone()
+    if not object_row or not os.path.exists(object_path(store_path, digest)):
+        return False
+
+    return file_signature(object_path(store_path, digest)) == list(object_row)
+
+def remove_object(store_connection, store_path, digest):
+    """
+    This function removes an object from the global store, with its per-gene artifacts. The
+    project files linked to it are kept.
+
+    #INPUT
+    - store_connection (sqlite3.Connection); The connection to the index of the store.
+    - store_path (string); The path to the global store.
+    - digest (string); The SHA-256 digest of the object.
+    """
+
+    with store_connection:
+        store_connection.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+        store_connection.execute("DELETE FROM gene_artifacts WHERE digest = ?", (digest,))
+
+    if os.path.exists(object_path(store_path, digest)):
+        os.remove(object_path(store_path, digest))
+
+def add_object(store_connection, store_path, source_path, digest):
+    """
+    This function adds a file to the objects of the global store, if it is not stored yet
+    (or if the stored object was modified). The object shares the content of the file when
+    possible, and it is made read-only (with the file, if both are a hard link).
+
+    #INPUT
+    - store_connection (sqlite3.Connection); The connection to the index of the store.
+    - store_path (string); The path to the global store.
+    - source_path (string); The path to the file.
+    - digest (string); The SHA-256 digest of the file.
+    """
+
+    stored_object_path = object_path(store_path, digest)
+
+    if is_object_intact(store_connection, store_path, digest):
+        return
+
+    remove_object(store_connection, store_path, digest)
+    os.makedirs(os.path.dirname(stored_object_path), exist_ok=True)
+    link_file(source_path, stored_object_path)
+    os.chmod(stored_object_path, 0o444)
+
+    with store_connection:
+        store_connection.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)", (digest, *file_signature(stored_object_path), time.time()))
+
+def materialize_object(store_connection, store_path, digest, target_path):
+    """
+    This function places an object of the global store in a project path, and records the
+    reference to the object.
+
+    #INPUT
+    - store_connection (sqlite3.Connection); The connection to the index of the store.
+    - store_path (string); The path to the global store.
+    - digest (string); The SHA-256 digest of the object.
+    - target_path (string); The path to place the object.
+    """
+
+    stored_object_path = object_path(store_path, digest)
+
+    # The file may already be the object (e.g. if it was linked when it was stored)
+    if os.path.exists(target_path) and os.path.samefile(stored_object_path, target_path):
+        method = "hardlink"
+    else:
+        method = link_file(stored_object_path, target_path)
+
+    with store_connection:
+        store_connection.execute("INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?)", (os.path.realpath(target_path), digest, method, *file_signature(target_path)))
+
+def is_reference_live(store_path, reference_row):
+    """
+    This function checks if a project file still employs its object: if it has not been
+    modified since it was materialized and, for a hard link, if it is still the same file.
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    - reference_row (tuple); The path, digest, method, size and modification time (ns) of the reference.
+    #OUTPUT
+    - is_live (boolean); True if the project file employs the object.
+    """
+
+    path, digest, method, size, mtime_ns = reference_row
+
+    if not os.path.exists(path) or not os.path.exists(object_path(store_path, digest)):
+        return False
+
+    if method == "hardlink" and not os.path.samefile(path, object_path(store_path, digest)):
+        return False
+
+    return file_signature(path) == [size, mtime_ns]
+
+def project_record_rows(fasta_path):
+    """
+    This function reads the records of a multi-fasta file as rows of the global store: the
+    record (UPI, sequence digest and sequence) and its entry in the index of the file.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta file.
+    #OUTPUT
+    - record_row_list (list); A list with the UPI, sequence digest, sequence and time of each record.
+    - project_row_list (list); A list with the position, UPI, sequence digest and header of each record.
+    """
+
+    sequence_store = build_sequence_store(fasta_path)
+    sequence_bytes = sequence_store["sequences"].tobytes()
+    sequence_offset_list = sequence_store["sequence_offsets"].tolist()
+
+    record_row_list = []
+    project_row_list = []
+    for position, header in enumerate(store_header_list(sequence_store)):
+        sequence = sequence_bytes[sequence_offset_list[position]:sequence_offset_list[position + 1]]
+        sequence_digest = hashlib.sha256(sequence).digest()
+        upi_match = re.search(UPI_REGULAR_EXPRESSION, header)
+        upi = upi_match.group(1) if upi_match else ""
+
+        record_row_list.append((upi, sequence_digest, sequence, time.time()))
+        project_row_list.append((position, upi, sequence_digest, header))
+
+    return record_row_list, project_row_list
+
+def store_database_files(path_list):
+    """
+    This function indexes a list of project multi-fasta files in the global store: the
+    records of each file are stored once (UPI and sequence digest) and indexed by the project,
+    so the file can be written again from the store. The files themselves are not linked, as
+    they can be edited by hand. Files not modified since they were indexed are skipped
+    without reading them. It does nothing unless the global store has been configured.
+
+    #INPUT
+    - path_list (list); A list with the paths to the multi-fasta files. Missing files are skipped.
+    """
+
+    store_path = GLOBAL_STORE_STATE["store_path"]
+    if not store_path:
+        return
+
+    for path in path_list:
+        if not os.path.isfile(path):
+            continue
+
+        signature_list = file_signature(path)
+        with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+            file_row = store_connection.execute("SELECT size, mtime_ns FROM project_files WHERE path = ?", (os.path.realpath(path),)).fetchone()
+            if file_row and list(file_row) == signature_list:
+                continue
+
+        record_row_list, project_row_list = project_record_rows(path)
+
+        with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+            with store_connection:
+                store_connection.executemany("INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?)", record_row_list)
+                store_connection.execute("""INSERT INTO project_files (path, size, mtime_ns) VALUES (?, ?, ?)
+                                            ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns""", (os.path.realpath(path), *signature_list))
+                file_id = store_connection.execute("SELECT file_id FROM project_files WHERE path = ?", (os.path.realpath(path),)).fetchone()[0]
+                store_connection.execute("DELETE FROM project_records WHERE file_id = ?", (file_id,))
+                store_connection.executemany("INSERT INTO project_records VALUES (?, ?, ?, ?, ?)", [(file_id, *project_row) for project_row in project_row_list])
+
+def materialize_project_records(path):
+    """
+    This function writes a project multi-fasta file again from its index of records in the
+    global store.
+
+    #INPUT
+    - path (string); The path to the project multi-fasta file.
+    #OUTPUT
+    - is_materialized (boolean); True if the file was indexed in the store and written.
+    #WRITE OUTPUT
+    - {path}; The multi-fasta file, with the records in the same order.
+    """
+
+    store_path = GLOBAL_STORE_STATE["store_path"]
+    if not store_path:
+        return False
+
+    with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+        record_row_list = store_connection.execute("""SELECT project_records.header, records.sequence FROM project_files JOIN project_records USING (file_id)
+                                                      JOIN records USING (upi, sequence_digest) WHERE path = ? ORDER BY position""", (os.path.realpath(path),)).fetchall()
+
+    if not record_row_list:
+        return False
+
+    sequence_offset_list = [0]
+    for _, sequence in record_row_list:
+        sequence_offset_list.append(sequence_offset_list[-1] + len(sequence))
+    sequence_store = create_sequence_store([header for header, _ in record_row_list], b"".join(sequence for _, sequence in record_row_list), sequence_offset_list)
+    write_store_fasta(sequence_store, path)
+
+    # Keep the index of the written file, which is not modified
+    with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+        with store_connection:
+            store_connection.execute("UPDATE project_files SET size = ?, mtime_ns = ? WHERE path = ?", (*file_signature(path), os.path.realpath(path)))
+
+    return True
+
+def gene_artifact_key(kind, parameters, input_content):
+    """
+    This function computes the key of a per-gene artifact.
+
+    #INPUT
+    - kind (string); The kind of artifact (e.g. alignment).
+    - parameters (string); The parameters of the step that builds the artifact.
+    - input_content (bytes); The input of the step (e.g. the records of the gene as a multi-fasta).
+    #OUTPUT
+    - artifact_key (string); The SHA-256 digest of the kind, parameters and input.
+    """
+
+    return hashlib.sha256(kind.encode() + b"\0" + parameters.encode() + b"\0" + input_content).hexdigest()
+
+def reuse_gene_artifact(kind, parameters, input_content, target_path):
+    """
+    This function places a per-gene artifact stored by a previous project in a project path,
+    if the global store has an artifact with the same kind, parameters and input.
+
+    #INPUT
+    - kind (string); The kind of artifact (e.g. alignment).
+    - parameters (string); The parameters of the step that builds the artifact.
+    - input_content (bytes); The input of the step (e.g. the records of the gene as a multi-fasta).
+    - target_path (string); The path to place the artifact.
+    #OUTPUT
+    - is_reused (boolean); True if the artifact was found and placed in the target path.
+    """
+
+    store_path = GLOBAL_STORE_STATE["store_path"]
+    if not store_path:
+        return False
+
+    artifact_key = gene_artifact_key(kind, parameters, input_content)
+    with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+        artifact_row = store_connection.execute("SELECT digest FROM gene_artifacts WHERE artifact_key = ?", (artifact_key,)).fetchone()
+
+        is_reused = bool(artifact_row) and is_object_intact(store_connection, store_path, artifact_row[0])
+        if is_reused:
+            materialize_object(store_connection, store_path, artifact_row[0], target_path)
+
+    return is_reused
+
+def store_gene_artifact(kind, parameters, input_content, artifact_path):
+    """
+    This function stores a per-gene artifact in the global store, so other projects with the
+    same input can reuse it, and replaces the project file by a link to the stored object.
+
+    #INPUT
+    - kind (string); The kind of artifact (e.g. alignment).
+    - parameters (string); The parameters of the step that builds the artifact.
+    - input_content (bytes); The input of the step (e.g. the records of the gene as a multi-fasta).
+    - artifact_path (string); The path to the artifact built by the project.
+    """
+
+    store_path = GLOBAL_STORE_STATE["store_path"]
+    if not store_path:
+        return
+
+    digest = content_digest(artifact_path)
+    with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+        add_object(store_connection, store_path, artifact_path, digest)
+        materialize_object(store_connection, store_path, digest, artifact_path)
+        with store_connection:
+            store_connection.execute("INSERT OR REPLACE INTO gene_artifacts VALUES (?, ?, ?, ?)", (gene_artifact_key(kind, parameters, input_content), kind, digest, time.time()))
+
+def collect_garbage(store_path, do_dry_run=False):
+    """
+    This function removes the entries of the global store that no project employs: the
+    references to project files removed or modified, the objects without references (or
+    modified in place), the per-gene artifacts of the removed objects, the indices of the
+    database files modified or whose folder was removed, and the records without indices.
+    It waits for the builds employing the store to finish.
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    - do_dry_run (boolean); A boolean indicator to indicate if the entries are only counted.
+    #OUTPUT
+    - removed_reference_count (integer); The number of stale references.
+    - removed_object_count (integer); The number of unreferenced objects.
+    - removed_record_count (integer); The number of unreferenced records.
+    - removed_bytes (integer); The size of the unreferenced objects and records.
+    """
+
+    with open(f"{store_path}/gc.lock", "a") as gc_lock_file:
+        lock_type = fcntl.LOCK_SH if do_dry_run else fcntl.LOCK_EX
+        try:
+            fcntl.flock(gc_lock_file, lock_type | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("# Waiting for the builds employing the global store to finish")
+            fcntl.flock(gc_lock_file, lock_type)
+
+        with global_store_lock(store_path), contextlib.closing(open_global_store(store_path)) as store_connection:
+
+            # Select the references whose project file no longer employs the object
+            reference_row_list = store_connection.execute("SELECT path, digest, method, size, mtime_ns FROM refs").fetchall()
+            stale_path_set = {reference_row[0] for reference_row in reference_row_list if not is_reference_live(store_path, reference_row)}
+            live_digest_set = {reference_row[1] for reference_row in reference_row_list if reference_row[0] not in stale_path_set}
+
+            # Select the objects without live references, or modified since they were stored
+            object_row_list = store_connection.execute("SELECT digest, size FROM objects").fetchall()
+            unreferenced_row_list = [object_row for object_row in object_row_list
+                                     if object_row[0] not in live_digest_set or not is_object_intact(store_connection, store_path, object_row[0])]
+
+            # Select the indices of the database files modified, or whose folder was removed. The index of a
+            # removed file is kept while its folder exists, so the file can be materialized again
+            file_row_list = store_connection.execute("SELECT file_id, path, size, mtime_ns FROM project_files").fetchall()
+            stale_file_id_list = [file_id for file_id, path, size, mtime_ns in file_row_list
+                                  if not os.path.isdir(os.path.dirname(path)) or (os.path.exists(path) and file_signature(path) != [size, mtime_ns])]
+
+            # Select the records without indices once the stale indices are removed
+            unreferenced_record_query = """FROM records WHERE NOT EXISTS (SELECT 1 FROM project_records WHERE project_records.upi = records.upi
+                                           AND project_records.sequence_digest = records.sequence_digest AND file_id NOT IN (SELECT value FROM json_each(?)))"""
+            removed_record_count, removed_record_bytes = store_connection.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(sequence)), 0) {unreferenced_record_query}",
+                                                                                  (json.dumps(stale_file_id_list),)).fetchone()
+
+            if not do_dry_run:
+                with store_connection:
+                    store_connection.executemany("DELETE FROM refs WHERE path = ?", [(path,) for path in stale_path_set])
+                    store_connection.execute(f"DELETE {unreferenced_record_query}", (json.dumps(stale_file_id_list),))
+                    store_connection.executemany("DELETE FROM project_records WHERE file_id = ?", [(file_id,) for file_id in stale_file_id_list])
+                    store_connection.executemany("DELETE FROM project_files WHERE file_id = ?", [(file_id,) for file_id in stale_file_id_list])
+
+            if not do_dry_run:
+                for digest, _ in unreferenced_row_list:
+                    remove_object(store_connection, store_path, digest)
+
+    return len(stale_path_set), len(unreferenced_row_list), removed_record_count, sum(object_row[1] for object_row in unreferenced_row_list) + removed_record_bytes
+
+def global_store_stats(store_path):
+    """
+    This function summarizes the size of the global store.
+
+    #INPUT
+    - store_path (string); The path to the global store.
+    #OUTPUT
+    - stats_dic (dictionary); A dictionary with the number and size of the records and of
+      their entries in the project indices, the number and size of the objects and of the
+      project files referencing them, and the number of per-gene artifacts.
+    """
+
+    with contextlib.closing(open_global_store(store_path)) as store_connection:
+        record_count, record_bytes = store_connection.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(sequence)), 0) FROM records").fetchone()
+        project_record_count, project_record_bytes = store_connection.execute("""SELECT COUNT(*), COALESCE(SUM(LENGTH(records.sequence)), 0) FROM project_records
+                                                                                 JOIN records USING (upi, sequence_digest)""").fetchone()
+        object_count, object_bytes = store_connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        reference_count, reference_bytes = store_connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM refs").fetchone()
+        artifact_count = store_connection.execute("SELECT COUNT(*) FROM gene_artifacts").fetchone()[0]
+
+    return {"records": record_count, "record_bytes": record_bytes, "project_records": project_record_count, "project_record_bytes": project_record_bytes,
+            "objects": object_count, "object_bytes": object_bytes, "references": reference_count, "reference_bytes": reference_bytes,
+            "gene_artifacts": artifact_count}
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Global imports
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script stores the listings downloaded from the UniProt API (the UniParc IDs of a TaxID
+and gene, and the descendent TaxIDs of a TaxID) in a local SQLite cache, so running ProteoParc
+again does not page the whole listings when they have not changed. Each listing is keyed by
+the fingerprint of its query URL, and stored with the HTTP validators of its first page:
+
+1. ETag and Last-Modified; Sent back as If-None-Match and If-Modified-Since, so the API answers
+   "304 Not Modified" without any content if the listing has not changed.
+2. X-UniProt-Release; The UniProt release of the listing. The data only changes between
+   releases, so a first page from the same release means the stored listing is still valid.
+
+A listing revalidated less than max_age seconds ago is reused without any request (default: 0,
+always revalidated). If a listing has changed, it is paged again from its first page, which is
+not downloaded twice. The cache is stored in the user's cache folder ($XDG_CACHE_HOME or
+~/.cache, proteoparc/listing_cache.sqlite), as the results folder is removed before each download.
+
+The script can also be run from the command line to list or clear the cached listings.
+"""
+
+LISTING_CACHE_STATE = {"cache_path": None, "max_age": 0.0}
+LISTING_CACHE_LOCK = threading.Lock()
+NEXT_LINK_REGULAR_EXPRESSION = re.compile(r'<(.+)>; rel="next"')
+
+def main():
+
+    cache_path, do_clear = parser()
+
+    if not os.path.exists(cache_path):
+        print(f"WARNING: No listing cache found in '{cache_path}'")
+        exit(0)
+
+    if do_clear:
+        os.remove(cache_path)
+        print(f"# Listing cache '{cache_path}' removed")
+        return
+
+    with sqlite3.connect(cache_path) as cache_connection:
+        cache_row_list = cache_connection.execute("SELECT url, release, fetched_at, item_count FROM listings ORDER BY fetched_at").fetchall()
+    cache_connection.close()
+
+    for url, release, fetched_at, item_count in cache_row_list:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(fetched_at))}\t{release or '-'}\t{item_count}\t{url}")
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - cache_path (string); The path to the listing cache.
+    - do_clear (boolean); A boolean indicator to indicate if the cache is removed.
+    """
+    parser = argparse.ArgumentParser(description="A script to list or clear the cached UniProt listings of ProteoParc")
+    parser.add_argument("--cache-path", dest="cache_path", type=str, help=f"The path to the listing cache (default: {default_listing_cache_path()})", required=False, default=[default_listing_cache_path()], nargs=1)
+    parser.add_argument("--clear", dest="clear", action=argparse.BooleanOptionalAction, help="Remove the listing cache (default: False; --no-clear)", default=False, required=False)
+
+    args = parser.parse_args()
+
+    cache_path = os.path.realpath(args.cache_path[0])
+    do_clear = args.clear
+
+    return cache_path, do_clear
+
+def default_listing_cache_path():
+    """
+    This function returns the default path of the listing cache, in the user's cache folder.
+
+    #OUTPUT
+    - cache_path (string); The path to the listing cache.
+    """
+
+    cache_folder_path = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(cache_folder_path, "proteoparc", "listing_cache.sqlite")
+
+def configure_listing_cache(cache_path=None, max_age=0.0):
+    """
+    This function sets the cache employed by fetch_listing(). Without a cache path, the
+    listings are always paged from the API.
+
+    #INPUT
+    - cache_path (string); The path to the listing cache. If None, the cache is disabled.
+    - max_age (float); The number of seconds a listing is reused without revalidating it.
+    """
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    LISTING_CACHE_STATE["cache_path"] = cache_path
+    LISTING_CACHE_STATE["max_age"] = max_age
+
+def open_listing_cache(cache_path):
+    """
+    This function opens the listing cache, creating its table if needed.
+
+    #INPUT
+    - cache_path (string); The path to the listing cache.
+    #OUTPUT
+    - cache_connection (sqlite3.Connection); The connection to the listing cache.
+    """
+
+    cache_connection = sqlite3.connect(cache_path, timeout=60)
+    cache_connection.execute("""CREATE TABLE IF NOT EXISTS listings (
+                                    fingerprint TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,
+                                    release TEXT, fetched_at REAL, item_count INTEGER, listing TEXT)""")
+
+    return cache_connection
+
+def listing_fingerprint(url):
+    """
+    This function computes the fingerprint of a listing query.
+
+    #INPUT
+    - url (string); The URL of the first page of the listing.
+    #OUTPUT
+    - fingerprint (string); The SHA-256 digest of the URL.
+    """
+
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def parse_listing_page(response):
+    """
+    This function splits a page of a listing ("format=list") in its items.
+
+    #INPUT
+    - response (requests.Response); A page of the listing.
+    #OUTPUT
+    - item_list (list); A list with the non-empty lines of the page.
+    """
+
+    return [item for item in response.text.split("\n") if item]
+
+def page_listing(session, response):
+    """
+    This function pages a listing from its first page, following the "next" links of the
+    Link header until the last page.
+
+    #INPUT
+    - session (requests.Session); The session employed to download the pages.
+    - response (requests.Response); The first page of the listing.
+    #OUTPUT
+    - item_list (list); A list with all the items of the listing.
+    """
+
+    item_list = parse_listing_page(response)
+
+    while "Link" in response.headers:
+        match = NEXT_LINK_REGULAR_EXPRESSION.match(response.headers["Link"])
+        if not match:
+            break
+        response = session.get(match.group(1))
+        response.raise_for_status()
+        item_list.extend(parse_listing_page(response))
+
+    return item_list
+
+def fetch_listing(session, url):
+    """
+    This function downloads a listing of the UniProt API, reusing the cached listing if it
+    was revalidated less than max_age seconds ago, or if a conditional request of its first
+    page shows that it has not changed. Otherwise, the listing is paged and cached again.
+
+    #INPUT
+    - session (requests.Session); The session employed to download the pages.
+    - url (string); The URL of the first page of the listing.
+    #OUTPUT
+    - item_list (list); A list with all the items of the listing.
+    """
+
+    cache_path = LISTING_CACHE_STATE["cache_path"]
+
+    # Download the listing without cache
+    if not cache_path:
+        response = session.get(url)
+        response.raise_for_status()
+        return page_listing(session, response)
+
+    fingerprint = listing_fingerprint(url)
+    with LISTING_CACHE_LOCK:
+        cache_connection = open_listing_cache(cache_path)
+        cache_row = cache_connection.execute("SELECT etag, last_modified, release, fetched_at, listing FROM listings WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        cache_connection.close()
+
+    # Reuse the listing without revalidating it if it is recent enough
+    if cache_row and time.time() - cache_row[3] <= LISTING_CACHE_STATE["max_age"]:
+        return cache_row[4].split("\n") if cache_row[4] else []
+
+    # Revalidate the cached listing with a conditional request of its first page
+    conditional_header_dic = {}
+    if cache_row and cache_row[0]:
+        conditional_header_dic["If-None-Match"] = cache_row[0]
+    if cache_row and cache_row[1]:
+        conditional_header_dic["If-Modified-Since"] = cache_row[1]
+
+    response = session.get(url, headers=conditional_header_dic)
+    release = response.headers.get("X-UniProt-Release")
+
+    if cache_row and (response.status_code == 304 or (release and release == cache_row[2])):
+        item_list = cache_row[4].split("\n") if cache_row[4] else []
+        etag = response.headers.get("ETag") or cache_row[0]
+        last_modified = response.headers.get("Last-Modified") or cache_row[1]
+        release = release or cache_row[2]
+    else:
+        response.raise_for_status()
+        item_list = page_listing(session, response)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    # Store the listing with the validators of its first page
+    with LISTING_CACHE_LOCK:
+        cache_connection = open_listing_cache(cache_path)
+        with cache_connection:
+            cache_connection.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (fingerprint, url, etag, last_modified, release, time.time(), len(item_list), "\n".join(item_list)))
+        cache_connection.close()
+
+    return item_list
+
+if __name__ == "__main__":
+    main()
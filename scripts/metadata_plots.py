@@ -0,0 +1,200 @@
+# Global imports
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script is the Python version of proteoparc_barplot.R and proteoparc_grid.R. It takes
+the species and genes counts (species_genes.csv, ouputed from metadata_proteoparc.py) and
+generates the same two plots with matplotlib, so R is not needed to run the pipeline. The
+plotting functions can also be called directly from metadata_proteoparc.py, using the
+dataframe already in memory instead of reading the CSV file again.
+
+1. species_per_gene_barplot.jpg; A barplot representing the number of different protein
+   records per each species and gene name.
+
+2. species_per_gene_grid.jpg; A grid representing the presence or absence of each gene
+   name per species. If a gene list is provided, the genes that were not retrieved are
+   also displayed.
+
+Databases with many species or genes are summarized to keep the plots readable. The
+barplot only colours the most frequent species (the rest are grouped as "Other species"),
+and the grid only displays the species with more genes present.
+"""
+
+BARPLOT_MAX_SPECIES = 15 # Maximum number of species coloured in the barplot
+GRID_MAX_SPECIES = 60 # Maximum number of species displayed in the grid
+GRID_MAX_GENES = 150 # Maximum number of genes displayed in the grid
+
+def main():
+
+    species_genes_path, gene_list_path = parser()
+
+    species_gene_df = pd.read_csv(species_genes_path, keep_default_na=False)
+    plots_folder_path = os.path.dirname(species_genes_path)
+
+    if gene_list_path:
+        with open(gene_list_path, "rt") as gene_list_file:
+            gene_list = [gene.strip() for gene in gene_list_file if gene.strip()]
+    elif not gene_list_path:
+        gene_list = None
+
+    plot_species_per_gene_barplot(species_gene_df, plots_folder_path)
+    plot_species_per_gene_grid(species_gene_df, plots_folder_path, gene_list)
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - species_genes_path (string); The path to the species_genes.csv file.
+    - gene_list_path (string); The path to the gene list employed to construct the multi-fasta.
+      database. If no gene list is specified, the variable is assigned as None.
+    """
+    parser = argparse.ArgumentParser(description="A script to plot the species and genes retrieved in a database created by proteoparc.py")
+    parser.add_argument("species_genes_path", type=str, help="The path to the species_genes.csv file")
+    parser.add_argument("gene_list_path", type=str, help="The path to the list of genes (not mandatory)", nargs="?", default=None)
+
+    args = parser.parse_args()
+
+    species_genes_path = os.path.realpath(args.species_genes_path)
+    gene_list_path = os.path.realpath(args.gene_list_path) if args.gene_list_path else None
+
+    return species_genes_path, gene_list_path
+
+def load_pyplot():
+    """
+    This function imports matplotlib with a non-interactive backend, so the plots can be
+    written without a display.
+
+    #OUTPUT
+    - plt (module); The matplotlib.pyplot module.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.rcParams.update({"font.size": 16})
+
+    return plt
+
+def plot_species_per_gene_barplot(species_gene_df, plots_folder_path):
+    """
+    This function plots a stacked barplot with the number of different protein records per
+    each gene name and species. Genes are sorted by their total count, and records without
+    gene name are displayed in a separated panel.
+
+    #INPUT
+    - species_gene_df (pd.DataFrame); A dataframe with the 'Species', 'Gene' and 'Count' columns.
+    - plots_folder_path (string); The path to a folder where the plot will be stored.
+    #WRITE OUTPUT
+    - species_per_gene_barplot.jpg; A barplot representing the number of diferent protein
+      records per each specie and gene name.
+    """
+    plt = load_pyplot()
+
+    if species_gene_df["Gene"].nunique() > 35 or species_gene_df["Species"].nunique() > 15:
+        print("WARNING: Barplot might be messy due to a high number of gene names or species")
+
+    # Group the less frequent species, so the number of colours is limited
+    species_total_sr = species_gene_df.groupby("Species")["Count"].sum().sort_values(ascending=False, kind="stable")
+    kept_species = set(species_total_sr.index[:BARPLOT_MAX_SPECIES])
+    species_sr = species_gene_df["Species"].where(species_gene_df["Species"].isin(kept_species), "Other species")
+
+    # Build a gene x species count matrix, sorting the genes by their total count
+    count_matrix_df = species_gene_df.assign(Species=species_sr).pivot_table(index="Gene", columns="Species", values="Count", aggfunc="sum", fill_value=0)
+    count_matrix_df = count_matrix_df.loc[count_matrix_df.sum(axis=1).sort_values(ascending=False, kind="stable").index]
+
+    # Split the genes with and without gene name in two panels, with widths proportional to the number of bars
+    panel_list = [count_matrix_df.loc[count_matrix_df.index != "no gene"], count_matrix_df.loc[count_matrix_df.index == "no gene"]]
+    panel_list = [panel_df for panel_df in panel_list if not panel_df.empty]
+
+    figure, axes_list = plt.subplots(1, len(panel_list), figsize=(11, 6), sharey=False, squeeze=False,
+                                     gridspec_kw={"width_ratios": [len(panel_df) for panel_df in panel_list]})
+    colour_list = plt.get_cmap("tab20").colors
+
+    for axes, panel_df in zip(axes_list[0], panel_list):
+        bottom = np.zeros(len(panel_df))
+        for species_index, species in enumerate(count_matrix_df.columns):
+            axes.bar(panel_df.index, panel_df[species].to_numpy(), bottom=bottom, label=species, color=colour_list[species_index % len(colour_list)])
+            bottom += panel_df[species].to_numpy()
+
+        axes.tick_params(axis="x", labelrotation=75)
+        for label in axes.get_xticklabels():
+            label.set_horizontalalignment("right")
+        axes.spines[["top", "right"]].set_visible(False)
+        axes.margins(x=0.01)
+
+    axes_list[0][0].set_title("Protein variations count in database", loc="left")
+    handles, labels = axes_list[0][0].get_legend_handles_labels()
+    figure.legend(handles, labels, title="Species", loc="center left", bbox_to_anchor=(1.0, 0.5), frameon=False)
+
+    figure.savefig(f"{plots_folder_path}/species_per_gene_barplot.jpg", dpi=300, bbox_inches="tight")
+    plt.close(figure)
+
+def plot_species_per_gene_grid(species_gene_df, plots_folder_path, gene_list=None):
+    """
+    This function plots a grid with the presence or absence of each gene name per species.
+    If a gene list is provided, the genes that were not retrieved are also displayed.
+
+    #INPUT
+    - species_gene_df (pd.DataFrame); A dataframe with the 'Species', 'Gene' and 'Count' columns.
+    - plots_folder_path (string); The path to a folder where the plot will be stored.
+    - gene_list (list); A list with the gene names employed to build the database. If no gene
+      list is specified, the variable is assigned as None.
+    #WRITE OUTPUT
+    - species_per_gene_grid.jpg; A grid plot representing the presence or absence of each gene
+      name per species.
+    """
+    plt = load_pyplot()
+    from matplotlib.colors import ListedColormap
+    from matplotlib.patches import Patch
+
+    # Remove the "no gene" records from the gene list and the dataframe
+    species_gene_df = species_gene_df.loc[species_gene_df["Gene"] != "no gene"]
+    if gene_list is None:
+        gene_list = list(species_gene_df["Gene"].unique())
+    gene_list = sorted(set(gene for gene in gene_list if gene != "no gene"))
+
+    # Build the species x gene presence matrix, completing all the possible combinations
+    presence_matrix_df = species_gene_df.pivot_table(index="Species", columns="Gene", values="Count", aggfunc="sum", fill_value=0) > 0
+    presence_matrix_df = presence_matrix_df.reindex(columns=gene_list, fill_value=False).sort_index()
+
+    if len(gene_list) > 35 or len(presence_matrix_df) > 15:
+        print("WARNING: Grid plot might be messy due to a high number of gene names or species")
+
+    # Downsample large grids, keeping the species and genes with more presences
+    if len(presence_matrix_df) > GRID_MAX_SPECIES:
+        kept_species = presence_matrix_df.sum(axis=1).sort_values(ascending=False, kind="stable").index[:GRID_MAX_SPECIES]
+        print(f"WARNING: Grid plot only displays the {GRID_MAX_SPECIES} species with more genes out of {len(presence_matrix_df)}")
+        presence_matrix_df = presence_matrix_df.loc[presence_matrix_df.index.isin(kept_species)]
+
+    if len(presence_matrix_df.columns) > GRID_MAX_GENES:
+        kept_genes = presence_matrix_df.sum(axis=0).sort_values(ascending=False, kind="stable").index[:GRID_MAX_GENES]
+        print(f"WARNING: Grid plot only displays the {GRID_MAX_GENES} genes present in more species out of {len(presence_matrix_df.columns)}")
+        presence_matrix_df = presence_matrix_df.loc[:, presence_matrix_df.columns.isin(kept_genes)]
+
+    figure, axes = plt.subplots(figsize=(11, 6))
+    axes.pcolormesh(presence_matrix_df.to_numpy(dtype=int), cmap=ListedColormap(["white", "royalblue"]), vmin=0, vmax=1, edgecolors="black", linewidth=0.5)
+
+    axes.set_aspect("equal")
+    axes.set_xticks(np.arange(len(presence_matrix_df.columns)) + 0.5, presence_matrix_df.columns, rotation=75, ha="right")
+    axes.set_yticks(np.arange(len(presence_matrix_df)) + 0.5, presence_matrix_df.index)
+    axes.tick_params(length=0)
+    axes.spines[:].set_visible(False)
+    axes.set_title("Protein presence in database", loc="left")
+
+    legend_handles = [Patch(facecolor="white", edgecolor="black", label="Absence"), Patch(facecolor="royalblue", edgecolor="black", label="Presence")]
+    axes.legend(handles=legend_handles, loc="center left", bbox_to_anchor=(1.02, 0.5), frameon=False)
+
+    figure.savefig(f"{plots_folder_path}/species_per_gene_grid.jpg", dpi=300, bbox_inches="tight")
+    plt.close(figure)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
 # Global imports
 import os
-import re
+import mmap
+import itertools
+import contextlib
 import argparse
 import json
+import sqlite3
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from Bio import SeqIO
 from datetime import datetime
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from pipeline_profiler import profile_step
+from sequence_store import build_sequence_store, open_sequence_store, store_header_list
+from residue_masses import residue_mass_array, WATER_MASS
 
 # Script information - Written in Python 3.9.12 - May 2023
 __author__ = "Guillermo Carrillo Martin"
@@ -17,10 +25,10 @@ __email__ = "guillermo.carrillo@upf.edu"
 This script generates metadata files with information about a multi-fasta protein 
 database outputed from the uniparc_download.py script. The software only generates 
 the "genes_NOT_retrieved.csv" file if a gene list has been specified. It also might combine
-the information present within the database with the information present in the JSON files
-generated during the download step (if --no-ignore-json). These JSON files contain the 
-repositories, species, and TaxID metadata of each record in the database, as there might be
-more than one value per record in these features.
+the information present within the database with the information present in the SQLite file
+(or the JSON files of previous versions) generated during the download step (if --no-ignore-json). 
+This file contains the repositories, species, and TaxID metadata of each record in the database, 
+as there might be more than one value per record in these features.
 
 Six (or seven if gene list) metadata files are generated by this script:
 
@@ -33,7 +41,8 @@ Six (or seven if gene list) metadata files are generated by this script:
 
 3. records_info.csv; A CSV file that contains all the information present in each 
    record header. See the README.md file for a detailed description of the header 
-   information.
+   information. It also contains the length, monoisotopic mass, fraction of unknown
+   residues (X) and isoelectric point of each sequence.
 
 4. genes_retrieved.csv; A CSV file that contains the number of genes retrieved.
 
@@ -46,35 +55,90 @@ Six (or seven if gene list) metadata files are generated by this script:
 7. species_genes.csv; A CSV file that shows the number of genes retrieved for each 
    species.
 """
+
+UPI_REGULAR_EXPRESSION = r"\|(UPI[0-9A-Z]{10})" # UPI\d{10}\w* or UPI[0-9A-Z]{10}
+PARALLEL_SCAN_MIN_SIZE = 64 * 1024 * 1024 # Minimum database size (bytes) to parse the headers in parallel
+
+# Bjellqvist pK values, as in Bio.SeqUtils.IsoelectricPoint
+POSITIVE_PK_DIC = {"K": 10.0, "R": 12.0, "H": 5.98}
+NEGATIVE_PK_DIC = {"D": 4.05, "E": 4.45, "C": 9.0, "Y": 10.0}
+N_TERMINAL_PK_DIC = {"A": 7.59, "M": 7.0, "S": 6.93, "P": 8.36, "T": 6.82, "V": 7.44, "E": 7.7} # Default: 7.5
+C_TERMINAL_PK_DIC = {"D": 4.55, "E": 4.75} # Default: 3.55
+PROPERTY_BATCH_SIZE = 1 << 17 # Number of residues whose composition is counted at the same time
+
 def main():
 
+  database_path, metadata_folder_path, tax_id, gene_list_path, do_ignore_json, threads, do_plots = parser()
+
+  produce_metadata(database_path, metadata_folder_path, tax_id, gene_list_path, do_ignore_json, threads, do_plots)
+
+def produce_metadata(database_path, metadata_folder_path, tax_id, gene_list_path=None, do_ignore_json=False, threads=1, do_plots=False, sequence_store=None):
+  """
+  This function runs the whole metadata step, writing all the metadata files of a multi-fasta 
+  database. If the records of the database are already in memory (e.g. passed from the previous 
+  steps of the pipeline), they are parsed directly instead of reading the multi-fasta file again.
+
+  #INPUT
+  - database_path (string); The path to the multi-fasta database.
+  - metadata_folder_path (string); The path to a folder where the results will be stored.
+  - tax_id (integer); The TaxID number employed to construct the multi-fasta database.
+  - gene_list_path (string); The path to the gene list employed to construct the multi-fasta.
+    database. If no gene list is specified, the variable is assigned as None.
+  - do_ignore_json (boolean); A boolean indicator to indicate if the
+    'ignore JSON files' process happens.
+  - threads (integer); The number of processes employed to parse the database headers.
+  - do_plots (boolean); A boolean indicator to indicate if the metadata plots are generated
+    with matplotlib.
+  - sequence_store (dictionary); A dictionary with the arrays of the records in the database
+    (see sequence_store.py). If None, the records are read from the multi-fasta database.
+  #OUTPUT
+  - record_info_df (pd.DataFrame); A dataframe containing all the information present 
+    in each record header. If the metadata files are not found, the variable is assigned as None.
+  """
+
   print("# Generating metadata information")
-  database_path, metadata_folder_path, tax_id, gene_list_path, do_ignore_json = parser()
 
   # Create a folder to store metadata information
   if not os.path.exists(metadata_folder_path):    
       os.mkdir(metadata_folder_path)
 
-  # Create a dataframe with all the info per record and write it as csv
-  repos_metadata_dic = None
-  species_metadata_dic = None
-  taxid_metadata_dic = None
+  # Read the records once, as both their headers and sequences are parsed
+  if sequence_store is None:
+    with profile_step("read_database"):
+      sequence_store = read_database_store(database_path)
+
+  # Parse the information present in each record header
+  with profile_step("parse_headers"):
+    header_table_df, header_stats_dic = parse_store_headers(sequence_store, threads)
+
+  # Compute the length, mass, unknown residues and isoelectric point of each sequence
+  with profile_step("sequence_properties"):
+    sequence_property_df, sequence_stats_dic = compute_sequence_properties(sequence_store)
+
+  # Read the extra metadata generated during the download step
+  records_metadata_df = None
 
   if not do_ignore_json:
-    json_directory_path = Path(database_path).parent
-    
-    # If there are not JSON files in the directory, print an error
-    if not os.path.exists(f"{json_directory_path}/.repos_metadata.json") or \
-       not os.path.exists(f"{json_directory_path}/.species_metadata.json") or \
-       not os.path.exists(f"{json_directory_path}/.taxid_metadata.json"):
-      print("ERROR: No JSON files found in the directory. Please try --ignore-json.")
-      exit(0)
-
-    repos_metadata_dic = json.load(open(f"{json_directory_path}/.repos_metadata.json", 'r'))
-    species_metadata_dic = json.load(open(f"{json_directory_path}/.species_metadata.json", 'r'))
-    taxid_metadata_dic = json.load(open(f"{json_directory_path}/.taxid_metadata.json", 'r'))
-
-  record_info_df = write_records_info_csv(database_path, metadata_folder_path, repos_metadata_dic, species_metadata_dic, taxid_metadata_dic)
+    metadata_directory_path = Path(database_path).parent
+
+    if os.path.exists(f"{metadata_directory_path}/.records_metadata.sqlite"):
+      with profile_step("read_metadata_database"):
+        records_metadata_df = read_metadata_database(f"{metadata_directory_path}/.records_metadata.sqlite", header_table_df["Unic Identifier"])
+
+    # JSON files written by previous versions of the software
+    elif os.path.exists(f"{metadata_directory_path}/.repos_metadata.json") and \
+         os.path.exists(f"{metadata_directory_path}/.species_metadata.json") and \
+         os.path.exists(f"{metadata_directory_path}/.taxid_metadata.json"):
+      records_metadata_df = read_json_metadata(metadata_directory_path)
+
+    # If there are not metadata files in the directory, print an error
+    else:
+      print("ERROR: No metadata files (.records_metadata.sqlite or JSON) found in the directory. Please try --ignore-json.")
+      return None
+
+  # Create a dataframe with all the info per record and write it as csv
+  with profile_step("write_records_info"):
+    record_info_df = write_records_info_csv(header_table_df, metadata_folder_path, records_metadata_df, sequence_property_df)
   
   # If a gene list was inputed, write the 'genes_NOT_retrieved' list
   if gene_list_path:
@@ -83,13 +147,22 @@ def main():
     gene_search_count = None    
   
   # Write the 'count' csv files
-  genes_retrieved_count = write_genes_retrieved_csv(record_info_df, metadata_folder_path)
-  repositories_total_count = write_repositories_employed_csv(record_info_df, metadata_folder_path)
-  species_total_count = write_species_retrieved_csv(record_info_df, metadata_folder_path)
-  write_species_per_gene_csv(record_info_df, metadata_folder_path)
+  with profile_step("write_count_tables"):
+    genes_retrieved_count = write_genes_retrieved_csv(record_info_df, metadata_folder_path)
+    repositories_total_count = write_repositories_employed_csv(record_info_df, metadata_folder_path)
+    species_total_count = write_species_retrieved_csv(record_info_df, metadata_folder_path)
+    species_gene_df = write_species_per_gene_csv(record_info_df, metadata_folder_path)
+
+  # Plot the species and genes retrieved, using the counts already in memory
+  if do_plots:
+    with profile_step("matplotlib_plots"):
+      write_metadata_plots(species_gene_df, metadata_folder_path, gene_list_path)
   
   # Write the summary.txt file
-  write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_id, genes_retrieved_count, gene_search_count, repositories_total_count, species_total_count)
+  write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_id, header_stats_dic, genes_retrieved_count, gene_search_count, repositories_total_count, species_total_count,
+                    sequence_stats_dic)
+
+  return record_info_df
 
 def parser():
     """
@@ -103,6 +176,9 @@ def parser():
       database. If no gene list is specified, the variable will be assigned as None.
     - do_ignore_json (boolean); A boolean indicator to indicate if the
       'ignore JSON files' process happens.
+    - threads (integer); The number of processes employed to parse the database headers.
+    - do_plots (boolean); A boolean indicator to indicate if the metadata plots are generated
+      with matplotlib.
     """
   
     parser = argparse.ArgumentParser(description="A script that creates metadata information for a database created by uniparc_download.py")
@@ -112,6 +188,8 @@ def parser():
     parser.add_argument("--tax-id", dest="TaxID", type=int, help="The TaxID number employed to construct the multi-fasta database", required=True, nargs=1)
     parser.add_argument("--genes", dest="gene_list", type=str, help="The path to the list of genes (not mandatory)", required=False, nargs=1)
     parser.add_argument("--ignore-json", dest="ignore_json", action=argparse.BooleanOptionalAction, help="Ignore JSON files containing extra metadata per each record (default: False; --no-ignore-json)", default=False, required=False)
+    parser.add_argument("--plots", dest="plots", action=argparse.BooleanOptionalAction, help="Generate the metadata plots with matplotlib instead of R (default: False; --no-plots)", default=False, required=False)
+    parser.add_argument("--threads", dest="threads", type=int, help="The number of processes employed to parse the database headers (default: 1)", required=False, default=[1], nargs=1)
 
     args = parser.parse_args()
   
@@ -128,51 +206,472 @@ def parser():
         gene_list_path = None
 
     do_ignore_json = args.ignore_json
+    threads = max(args.threads[0], 1)
+    do_plots = args.plots
+
+    return database_path, metadata_folder_path, tax_id, gene_list_path, do_ignore_json, threads, do_plots
+
+def split_fasta_chunks(database_path, chunk_count):
+    """
+    This function splits a multi-fasta file into byte ranges (chunks) of similar size.
+    Each chunk starts at the beginning of a record header (">"), so no record is split 
+    between two chunks.
+    
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    - chunk_count (integer); The maximum number of chunks.
+    #OUTPUT
+    - chunk_list (list); A list of (chunk_start, chunk_end) byte positions.
+    """
+    file_size = os.path.getsize(database_path)
+    if file_size == 0:
+        return []
+
+    with open(database_path, "rb") as database_file, mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ) as database_map:
+
+        # Find the record boundary closest to each evenly spaced position
+        boundary_list = []
+        for chunk_index in range(chunk_count):
+            position = file_size * chunk_index // chunk_count
+
+            if position == 0 and database_map[:1] == b">":
+                boundary = 0
+            else:
+                boundary = database_map.find(b"\n>", max(position - 1, 0))
+                boundary = boundary + 1 if boundary != -1 else file_size
+
+            if not boundary_list or boundary > boundary_list[-1]:
+                boundary_list.append(boundary)
+
+    boundary_list.append(file_size)
+    chunk_list = [(chunk_start, chunk_end) for chunk_start, chunk_end in zip(boundary_list[:-1], boundary_list[1:]) if chunk_start < chunk_end]
+
+    return chunk_list
+
+def read_fasta_headers(database_path):
+    """
+    This function reads the headers of a multi-fasta file through a memory map, skipping 
+    the sequence lines without parsing them.
+    
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    #OUTPUT
+    - header_sr (pd.Series); A series with the header of each record, without the ">".
+    """
+    header_list = []
+
+    if os.path.getsize(database_path) == 0:
+        return pd.Series(header_list, dtype=object)
+
+    with open(database_path, "rb") as database_file, mmap.mmap(database_file.fileno(), 0, access=mmap.ACCESS_READ) as database_map:
+        # Find the first header of the file
+        if database_map[:1] == b">":
+            header_start = 0
+        else:
+            header_start = database_map.find(b"\n>")
+            header_start = header_start + 1 if header_start != -1 else len(database_map)
+
+        # Read each header and jump to the next one
+        while header_start < len(database_map):
+            header_end = database_map.find(b"\n", header_start)
+            if header_end == -1:
+                header_end = len(database_map)
 
-    return database_path, metadata_folder_path, tax_id, gene_list_path, do_ignore_json
+            header_list.append(database_map[header_start + 1:header_end].decode().rstrip())
 
-def retrieve_tag(regular_expression, header):
+            header_start = database_map.find(b"\n>", header_end)
+            header_start = header_start + 1 if header_start != -1 else len(database_map)
+
+    header_sr = pd.Series(header_list, dtype=object)
+
+    return header_sr
+
+def parse_header_table(header_sr, species_sr=None):
+    """
+    This function retrieves all the information present in a series of record headers,
+    in vectorized form. It also counts the number of headers with each tag.
+    
+    #INPUT
+    - header_sr (pd.Series); A series with the header of each record, without the ">".
+    - species_sr (pd.Series); A series with the species (OS=) of each record, if they were
+      already retrieved (e.g. by the sequence store). If None, they are retrieved from the headers.
+    #OUTPUT
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
+    - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+      of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
+    """
+    # Count the records and the header tags
+    header_stats_dic = {
+        "records": len(header_sr),
+        "records_with_gene": int(header_sr.str.contains("GN=", regex=False).sum()),
+        "records_with_taxname": int(header_sr.str.contains("OS=", regex=False).sum()),
+        "records_with_taxid": int(header_sr.str.contains("OX=", regex=False).sum())
+    }
+
+    # Retrieve each tag per fasta header as a column
+    header_table_df = pd.DataFrame()
+    header_table_df["Unic Identifier"] = retrieve_tag(UPI_REGULAR_EXPRESSION, header_sr)
+    header_table_df["Repository"] = retrieve_tag(r"^([^|]+)", header_sr)
+    header_table_df["Gene"] = retrieve_tag(r"GN=(.*?)\sSV=", header_sr)
+    header_table_df["Species"] = retrieve_tag(r"OS=(.*?)\sOX=", header_sr) if species_sr is None else species_sr.set_axis(header_sr.index)
+    header_table_df["TaxID"] = retrieve_tag(r"OX=(\w+)", header_sr)
+    header_table_df["Last update"] = retrieve_tag(r"\|([\d-]+)", header_sr)
+    header_table_df["Sequence version"] = retrieve_tag(r"SV=(\d+)", header_sr)
+
+    return header_table_df, header_stats_dic
+
+def scan_fasta_headers(database_path):
+    """
+    This function retrieves all the information present in each record header of a 
+    multi-fasta file.
+    
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    #OUTPUT
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
+    - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+      of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
     """
-    This function extracts a substring from a fasta header using a regular expression.
-    If the expression is not fullfilled, it would return an empty string.
+    header_sr = read_fasta_headers(database_path)
+
+    return parse_header_table(header_sr)
+
+def parse_store_headers(sequence_store, threads=1):
+    """
+    This function retrieves all the information present in each record header of a 
+    sequence store. Large stores are split into ranges of records, whose header bytes are 
+    parsed in parallel processes and merged in the original order of the records.
+    
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records in the database.
+    - threads (integer); The number of processes employed to parse the headers.
+    #OUTPUT
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
+    - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+      of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
+    """
+    header_offset_array = sequence_store["header_offsets"]
+    record_count = len(header_offset_array) - 1
+    species_name_list = list(sequence_store["species_names"])
+
+    # Small stores are parsed in a single process, as starting the workers is slower
+    if threads == 1 or len(sequence_store["headers"]) + len(sequence_store["sequences"]) < PARALLEL_SCAN_MIN_SIZE:
+        return parse_store_header_chunk(sequence_store["headers"], header_offset_array, sequence_store["species_codes"], species_name_list)
+
+    # Each worker receives the header bytes of its records, which are sent faster than the header strings
+    chunk_size = record_count // threads + 1
+    chunk_list = [(chunk_start, min(chunk_start + chunk_size, record_count)) for chunk_start in range(0, record_count, chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=threads, mp_context=get_context("forkserver")) as executor:
+        chunk_result_list = list(executor.map(parse_store_header_chunk,
+                                              [sequence_store["headers"][header_offset_array[chunk_start]:header_offset_array[chunk_end]] for chunk_start, chunk_end in chunk_list],
+                                              [header_offset_array[chunk_start:chunk_end + 1] - header_offset_array[chunk_start] for chunk_start, chunk_end in chunk_list],
+                                              [sequence_store["species_codes"][chunk_start:chunk_end] for chunk_start, chunk_end in chunk_list],
+                                              [species_name_list] * len(chunk_list)))
+
+    return merge_header_tables(chunk_result_list)
+
+def parse_store_header_chunk(header_array, header_offset_array, species_code_array, species_name_list):
+    """
+    This function retrieves all the information present in the headers of a range of 
+    records of a sequence store. It also counts the number of headers with each tag.
+    
+    #INPUT
+    - header_array (np.ndarray); The bytes of the headers of the records.
+    - header_offset_array (np.ndarray); The offsets of each header in header_array.
+    - species_code_array (np.ndarray); The species code of each record (-1 if missing).
+    - species_name_list (list); The species names of the store, indexed by the species codes.
+    #OUTPUT
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
+    - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+      of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
+    """
+    header_sr = pd.Series(store_header_list({"headers": header_array, "header_offsets": header_offset_array}), dtype=object)
+
+    # The species are interned by the store with the same regular expression, so they are not extracted again
+    species_name_array = np.array(species_name_list + ["no gene"], dtype=object)
+    species_sr = pd.Series(species_name_array[species_code_array], dtype=object)
+
+    return parse_header_table(header_sr, species_sr)
+
+def merge_header_tables(chunk_result_list):
+    """
+    This function merges the header tables and counts of the chunks of a database, in order.
+    
+    #INPUT
+    - chunk_result_list (list); A list with the (header_table_df, header_stats_dic) of each chunk.
+    #OUTPUT
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
+    - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+      of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
+    """
+    header_table_df = pd.concat([chunk_table_df for chunk_table_df, _ in chunk_result_list], ignore_index=True)
+    header_stats_dic = {key: sum(chunk_stats_dic[key] for _, chunk_stats_dic in chunk_result_list) for key in chunk_result_list[0][1]}
+
+    return header_table_df, header_stats_dic
+
+def retrieve_tag(regular_expression, header_sr):
+    """
+    This function extracts a substring from each fasta header using a regular expression,
+    in vectorized form. If the expression is not fullfilled, it would return "no gene".
     
     #INPUT
     - regular_expression (string); The regular expression to select the substring.
-    - header (string); A fasta header, formatted from the uniparc_download.py script.
+    - header_sr (pd.Series); A series of fasta headers, formatted from the uniparc_download.py script.
+    #OUTPUT
+    - tag_sr (pd.Series); The retrieved substring from each fasta header.
+    """
+    tag_sr = header_sr.str.extract(regular_expression, expand=False).fillna("no gene")
+
+    return tag_sr
+
+def read_metadata_database(metadata_database_path, upi_identifier_sr):
+    """
+    This function reads the extra metadata stored in the SQLite file generated during the
+    download step. Only the rows of the records present in the database are read.
+    
+    #INPUT
+    - metadata_database_path (string); The path to the SQLite metadata file.
+    - upi_identifier_sr (pd.Series); A series with the UPI identifier of each record.
     #OUTPUT
-    - tag (String); The retrieved substring from the fasta header.
+    - records_metadata_df (pd.DataFrame); A dataframe indexed by the UPI identifier, with
+      the semicolon-separated repositories, species, and TaxIDs of each record.
     """
-    # Retrieve the tag
-    tag_match = re.search(regular_expression, header)
-    if tag_match:
-        tag = tag_match.group(1)
+    with contextlib.closing(sqlite3.connect(metadata_database_path)) as metadata_connection:
+
+        # Filter the query with the UPI identifiers of the database, passed as a single JSON array
+        records_metadata_df = pd.read_sql_query("SELECT upi, repositories AS Repository, species AS Species, taxids AS TaxID \
+                                                 FROM records_metadata WHERE upi IN (SELECT value FROM json_each(?))",
+                                                metadata_connection, params=(json.dumps(upi_identifier_sr.tolist()),), index_col="upi")
+
+    return records_metadata_df
+
+def read_json_metadata(json_directory_path):
+    """
+    This function reads the extra metadata stored in the JSON files generated by previous
+    versions of the download step.
+    
+    #INPUT
+    - json_directory_path (string); The path to the folder storing the JSON files.
+    #OUTPUT
+    - records_metadata_df (pd.DataFrame); A dataframe indexed by the UPI identifier, with
+      the semicolon-separated repositories, species, and TaxIDs of each record.
+    """
+    metadata_sr_dic = {}
+
+    for column_name, json_name in [("Repository", "repos"), ("Species", "species"), ("TaxID", "taxid")]:
+        with open(f"{json_directory_path}/.{json_name}_metadata.json", "r") as json_file:
+            metadata_dic = json.load(json_file)
+
+        # Join the list of values of each record by semicolons
+        metadata_sr = pd.Series(metadata_dic, dtype=object).explode().dropna().astype(str)
+        metadata_sr = metadata_sr.groupby(level=0, sort=False).agg(";".join)
+        metadata_sr_dic[column_name] = metadata_sr.reindex(list(metadata_dic), fill_value="")
+
+    records_metadata_df = pd.DataFrame(metadata_sr_dic)
+
+    return records_metadata_df
+
+def read_database_store(database_path):
+    """
+    This function reads the records of a multi-fasta database as a sequence store. If the
+    database is in a ProteoParc results folder, the store saved by proteoparc.py is reused.
+    
+    #INPUT
+    - database_path (string); The path to the multi-fasta database.
+    #OUTPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records in the database.
+    """
+    store_folder_path = f"{Path(database_path).parent}/.sequence_store"
+
+    if os.path.exists(store_folder_path):
+        return open_sequence_store(database_path, store_folder_path)
+
+    return build_sequence_store(database_path)
+
+def count_residue_composition(residue_array, length_array):
+    """
+    This function counts the residues of each letter (A-Z) in a batch of records, in
+    vectorized form, with a single bincount of the record and letter codes of each residue.
+    
+    #INPUT
+    - residue_array (np.ndarray); The residues (bytes) of the records of the batch, concatenated.
+    - length_array (np.ndarray); The length of each record of the batch.
+    #OUTPUT
+    - composition_matrix (np.ndarray); A matrix with a row per record and a column per letter
+      (A-Z), plus a last column counting the other bytes.
+    """
+    letter_code_array = np.full(256, 26, dtype=np.uint8)
+    letter_code_array[ord("A"):ord("Z") + 1] = np.arange(26)
+
+    record_code_array = np.repeat(np.arange(len(length_array), dtype=np.int64) * 27, length_array)
+    record_code_array += letter_code_array[residue_array]
+
+    composition_matrix = np.bincount(record_code_array, minlength=len(length_array) * 27).reshape(-1, 27)
+
+    return composition_matrix
+
+def compute_sequence_properties(sequence_store):
+    """
+    This function computes the length, monoisotopic mass, fraction of unknown residues (X)
+    and isoelectric point of each sequence in a store. The records are processed in batches
+    with NumPy, counting the residues of each letter per record, so the properties are
+    computed from the composition of the records instead of a loop per record. The isoelectric point
+    is found by bisection with the Bjellqvist pK values, as in Bio.SeqUtils.IsoelectricPoint.
+    
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records in the database.
+    #OUTPUT
+    - sequence_property_df (pd.DataFrame); A dataframe with the length, monoisotopic mass,
+      X fraction and isoelectric point of each record. The mass of the sequences with residues
+      without a defined mass (X, B, Z...) is left empty.
+    - sequence_stats_dic (dictionary); A dictionary with the number of residues, the length and
+      mass ranges, and the number of records with unknown residues.
+    """
+    residue_array = sequence_store["sequences"]
+    sequence_offset_array = np.asarray(sequence_store["sequence_offsets"], dtype=np.int64)
+    length_array = np.diff(sequence_offset_array)
+    record_count = len(length_array)
+    is_empty_array = length_array == 0
+
+    # Mass of each letter, and letters (or other bytes) without a defined mass
+    letter_mass_array = np.append(residue_mass_array()[ord("A"):ord("Z") + 1], np.nan)
+    is_undefined_array = np.isnan(letter_mass_array)
+    letter_mass_array[is_undefined_array] = 0.0
+
+    charged_residue_list = list(POSITIVE_PK_DIC) + list(NEGATIVE_PK_DIC)
+    charged_column_list = [ord(residue) - ord("A") for residue in charged_residue_list]
+
+    monoisotopic_mass_array = np.full(record_count, np.nan)
+    unknown_count_array = np.zeros(record_count, dtype=np.int64)
+    charged_count_matrix = np.zeros((record_count, len(charged_residue_list)), dtype=np.int64)
+
+    # Process the records in batches of similar number of residues, to bound the memory
+    record_start = 0
+    while record_start < record_count:
+        record_end = int(np.searchsorted(sequence_offset_array, sequence_offset_array[record_start] + PROPERTY_BATCH_SIZE, side="right")) - 1
+        record_end = min(max(record_end, record_start + 1), record_count)
+
+        batch_start, batch_end = sequence_offset_array[record_start], sequence_offset_array[record_end]
+        batch_residue_array = np.asarray(residue_array[batch_start:batch_end])
+        batch_length_array = length_array[record_start:record_end]
+        composition_matrix = count_residue_composition(batch_residue_array, batch_length_array)
+
+        # Monoisotopic mass, leaving out the sequences with residues without a defined mass
+        batch_mass_array = composition_matrix @ letter_mass_array + WATER_MASS
+        batch_mass_array[composition_matrix[:, is_undefined_array].sum(axis=1) > 0] = np.nan
+        monoisotopic_mass_array[record_start:record_end] = batch_mass_array
+
+        unknown_count_array[record_start:record_end] = composition_matrix[:, ord("X") - ord("A")]
+        charged_count_matrix[record_start:record_end] = composition_matrix[:, charged_column_list]
+
+        record_start = record_end
+
+    # Isoelectric point, from the charged residues and the first and last residue of each record
+    has_residues_array = ~is_empty_array
+    residue_count_dic = {residue: charged_count_matrix[has_residues_array, column_index] for column_index, residue in enumerate(charged_residue_list)}
+    n_terminal_array = residue_array[sequence_offset_array[:-1][has_residues_array]]
+    c_terminal_array = residue_array[sequence_offset_array[1:][has_residues_array] - 1]
+
+    isoelectric_point_array = np.full(record_count, np.nan)
+    isoelectric_point_array[has_residues_array] = compute_isoelectric_points(residue_count_dic, n_terminal_array, c_terminal_array)
+
+    monoisotopic_mass_array[is_empty_array] = np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        unknown_fraction_array = np.where(is_empty_array, np.nan, unknown_count_array / length_array)
+
+    sequence_property_df = pd.DataFrame({
+        "Length": length_array,
+        "Monoisotopic mass": monoisotopic_mass_array.round(5),
+        "X fraction": unknown_fraction_array.round(4),
+        "Isoelectric point": isoelectric_point_array.round(2)})
+
+    has_mass_array = ~np.isnan(monoisotopic_mass_array)
+    sequence_stats_dic = {
+        "residues": int(length_array.sum()),
+        "min_length": int(length_array.min()) if record_count else 0,
+        "median_length": float(np.median(length_array)) if record_count else 0,
+        "max_length": int(length_array.max()) if record_count else 0,
+        "records_with_mass": int(np.count_nonzero(has_mass_array)),
+        "min_mass": float(monoisotopic_mass_array[has_mass_array].min()) if has_mass_array.any() else None,
+        "max_mass": float(monoisotopic_mass_array[has_mass_array].max()) if has_mass_array.any() else None,
+        "records_with_x": int(np.count_nonzero(unknown_count_array)),
+        "x_residues": int(unknown_count_array.sum()),
+        "median_isoelectric_point": float(np.median(isoelectric_point_array[~is_empty_array])) if (~is_empty_array).any() else None}
+
+    return sequence_property_df, sequence_stats_dic
+
+def compute_isoelectric_points(residue_count_dic, n_terminal_array, c_terminal_array):
+    """
+    This function computes the isoelectric point of each record by bisection, updating the
+    pH interval of all the records at the same time. The starting pH, interval and precision
+    are the ones of Bio.SeqUtils.IsoelectricPoint, so the results are the same.
     
-    # If no match, retrieves the string "NA"
-    elif not tag_match:
-        tag = "no gene"
+    #INPUT
+    - residue_count_dic (dictionary); A dictionary with the count of each charged residue
+      (K, R, H, D, E, C, Y) per record.
+    - n_terminal_array (np.ndarray); The first residue (byte) of each record.
+    - c_terminal_array (np.ndarray); The last residue (byte) of each record.
+    #OUTPUT
+    - isoelectric_point_array (np.ndarray); An array with the isoelectric point of each record.
+    """
+    record_count = len(n_terminal_array)
+
+    # The pK of the N-terminal and C-terminal groups depends on the first and last residue
+    n_terminal_pk_lookup = np.full(256, 7.5)
+    for residue, residue_pk in N_TERMINAL_PK_DIC.items():
+        n_terminal_pk_lookup[ord(residue)] = residue_pk
+    c_terminal_pk_lookup = np.full(256, 3.55)
+    for residue, residue_pk in C_TERMINAL_PK_DIC.items():
+        c_terminal_pk_lookup[ord(residue)] = residue_pk
+
+    n_terminal_pk_array = n_terminal_pk_lookup[n_terminal_array]
+    c_terminal_pk_array = c_terminal_pk_lookup[c_terminal_array]
+
+    # Bisection of the pH interval of each record, until its width is lower than the precision
+    ph_array = np.full(record_count, 7.775)
+    min_ph_array = np.full(record_count, 4.05)
+    max_ph_array = np.full(record_count, 12.0)
+    is_active_array = np.ones(record_count, dtype=bool)
 
-    return tag
+    while is_active_array.any():
+        charge_array = 1.0 / (10 ** (ph_array - n_terminal_pk_array) + 1.0) - 1.0 / (10 ** (c_terminal_pk_array - ph_array) + 1.0)
 
-def write_records_info_csv(database_path, metadata_folder_path, repos_metadata_dic, species_metadata_dic, taxid_metadata_dic):
+        # 10 ** (pH - pK) is computed once per record, and scaled by the constant 10 ** -pK of each residue
+        hydrogen_exponent_array = 10 ** ph_array
+        for residue, residue_pk in POSITIVE_PK_DIC.items():
+            charge_array += residue_count_dic[residue] / (hydrogen_exponent_array * 10 ** -residue_pk + 1.0)
+        for residue, residue_pk in NEGATIVE_PK_DIC.items():
+            charge_array -= residue_count_dic[residue] / (10 ** residue_pk / hydrogen_exponent_array + 1.0)
+
+        is_positive_array = charge_array > 0.0
+        min_ph_array = np.where(is_active_array & is_positive_array, ph_array, min_ph_array)
+        max_ph_array = np.where(is_active_array & ~is_positive_array, ph_array, max_ph_array)
+        ph_array = np.where(is_active_array, (min_ph_array + max_ph_array) / 2, ph_array)
+        is_active_array = max_ph_array - min_ph_array > 0.0001
+
+    isoelectric_point_array = ph_array
+
+    return isoelectric_point_array
+
+def write_records_info_csv(header_table_df, metadata_folder_path, records_metadata_df, sequence_property_df=None):
     """
-    This function retrieves all the information present in each record header and writes it 
-    as a CSV file. It also returns a dataframe with all the information present in each record header.
+    This function writes as a CSV file all the information present in each record header. 
+    It also returns a dataframe with all the information present in each record header.
     The information retrieved includes the UPI identifier, repository, gene, species, TaxID,
     last update date, and sequence version. If do_ignore_json = False, the information of
-    repositories, species and TaxIDs is retrieved from the JSON files generated during the download step.
+    repositories, species and TaxIDs is retrieved from the metadata files generated during the 
+    download step. The properties of each sequence (length, monoisotopic mass, X fraction and
+    isoelectric point) are appended as the last columns.
     
     #INPUT
-    - database_path (string); The path to the multi-fasta database.
+    - header_table_df (pd.DataFrame); A dataframe with the information of each record header.
     - metadata_folder_path (string); The path to a folder where the results will be stored.
-    - repos_metadata_dic (dictionary); A dictionary containing the repositories metadata
-      for each record in the database. The key is the UPI identifier and the value is a list
-      of repositories.
-    - species_metadata_dic (dictionary); A dictionary containing the species metadata
-      for each record in the database. The key is the UPI identifier and the value is a list
-      of species.
-    - taxid_metadata_dic (dictionary); A dictionary containing the TaxID metadata
-      for each record in the database. The key is the UPI identifier and the value is a list
-      of TaxIDs.
+    - records_metadata_df (pd.DataFrame); A dataframe indexed by the UPI identifier, with
+      the semicolon-separated repositories, species, and TaxIDs of each record. If the
+      metadata files are ignored, the variable is assigned as None.
+    - sequence_property_df (pd.DataFrame); A dataframe with the properties of each sequence,
+      in the same order as the headers. If None, the columns are not written.
     #OUTPUT
     - record_info_df (pd.DataFrame); A dataframe containing all the information present 
       in each record header.
@@ -181,46 +680,71 @@ def write_records_info_csv(database_path, metadata_folder_path, repos_metadata_d
       record header. See the README.md file for a detailed description of the header 
       information.
     """
-    record_info_list = []
-    
-    # Retrieve each tag per fasta header and store the result in a list of lists
-    for record in SeqIO.parse(database_path, "fasta"):
-        upi_identifier = retrieve_tag(r"\|(UPI[0-9A-Z]{10})", record.description) # UPI\d{10}\w* or UPI[0-9A-Z]{10}
-        
-        if repos_metadata_dic:
-          repository_list = repos_metadata_dic[upi_identifier]
-          repository = ';'.join(repository_list)
-        else:    
-          repository = retrieve_tag(r"^([^|]+)", record.description)
-        
-        gene = retrieve_tag(r"GN=(.*?)\sSV=", record.description)        
-        
-        if species_metadata_dic:
-          species_list = species_metadata_dic[upi_identifier]
-          species = ';'.join(species_list)
-        else:    
-          species = retrieve_tag(r"OS=(.*?)\sOX=", record.description)
-        
-        if taxid_metadata_dic:
-          taxid_list = taxid_metadata_dic[upi_identifier]
-          taxid = ';'.join(str(taxid) for taxid in taxid_list)
-        else:
-          taxid = retrieve_tag(r"OX=(\w+)", record.description)
-        
-        date = retrieve_tag(r"\|([\d-]+)", record.description)
-        
-        version = retrieve_tag(r"SV=(\d+)", record.description)   
-
-        header_info = [upi_identifier, repository, gene, species, taxid, date, version]
-        record_info_list.append(header_info)
-
-    # Generate the pandas dataframe and write the csv
-    colnames = ["Unic Identifier", "Repository", "Gene", "Species", "TaxID", "Last update", "Sequence version"]
-    record_info_df = pd.DataFrame(record_info_list, columns=colnames)
+    record_info_df = header_table_df
+
+    # Replace the header information with the extra metadata of each record
+    if records_metadata_df is not None and not records_metadata_df.empty:
+      for column_name in ["Repository", "Species", "TaxID"]:
+        record_info_df[column_name] = record_info_df["Unic Identifier"].map(records_metadata_df[column_name]).fillna("")
+
+    # Append the properties of each sequence
+    if sequence_property_df is not None:
+      for column_name in sequence_property_df.columns:
+        record_info_df[column_name] = sequence_property_df[column_name].to_numpy()
+
+    # Write the csv
     record_info_df.to_csv(f"{metadata_folder_path}/records_info.csv", index=False)
 
     return record_info_df
 
+def count_separated_values(record_info_columns_df, separator, split_column_count=None):
+    """
+    This function counts the times each value appears in one or more columns of separated
+    values (e.g. "EMBL;RefSeq"), without splitting the values of each record into different
+    rows. Records are grouped by their (integer-coded) combination of values, and only the
+    distinct combinations are split, so the memory usage is close to the size of the input 
+    columns. Values in the same position of each split column are paired together (with an
+    empty value if a column has fewer values), and the columns that are not split are kept
+    as they are.
+    
+    #INPUT
+    - record_info_columns_df (pd.DataFrame); A dataframe with the columns to count.
+    - separator (string); The string separating the values in each record.
+    - split_column_count (integer); The number of columns to split, starting from the first
+      one. If None, all the columns are split.
+    #OUTPUT
+    - value_count_sr (pd.Series); A series with the count of each value combination, in order
+      of first appearance, indexed by the column names.
+    """
+    column_list = list(record_info_columns_df.columns)
+    if split_column_count is None:
+        split_column_count = len(column_list)
+
+    # Integer-code each distinct combination of values and count them
+    combination_codes, combination_index = pd.MultiIndex.from_frame(record_info_columns_df).factorize()
+    combination_counts = np.bincount(combination_codes[combination_codes >= 0], minlength=len(combination_index))
+
+    # Split each distinct combination and accumulate its count per value. The split columns with
+    # fewer values than the others are paired with empty values, instead of dropping the extra ones
+    value_count_dic = {}
+    mismatched_record_count = 0
+    for combination, count in zip(combination_index, combination_counts):
+        split_values = [value.split(separator) for value in combination[:split_column_count]]
+        if len({len(values) for values in split_values}) > 1:
+            mismatched_record_count += count
+
+        for paired_values in itertools.zip_longest(*split_values, fillvalue=""):
+            key = paired_values + combination[split_column_count:]
+            value_count_dic[key] = value_count_dic.get(key, 0) + count
+
+    if mismatched_record_count:
+        print(f"WARNING: {mismatched_record_count} records have a different number of {' and '.join(column_list[:split_column_count])} values, the missing values are left empty")
+
+    value_count_index = pd.MultiIndex.from_tuples(list(value_count_dic), names=column_list)
+    value_count_sr = pd.Series(list(value_count_dic.values()), index=value_count_index, dtype=np.int64)
+
+    return value_count_sr
+
 def write_genes_not_retrieved_txt(record_info_df, gene_list_path, metadata_folder_path):
     """
     This function outputs a text file with the genes not retrieved after the protein
@@ -308,14 +832,9 @@ def write_repositories_employed_csv(record_info_df, metadata_folder_path):
       has been found.
     """
 
-    local_record_info_df = record_info_df.copy() # Create a copy of the dataframe to avoid modifying the original one
-
-    # Split the semicolon-separated values into different rows
-    local_record_info_df["Repository"] = local_record_info_df["Repository"].str.split("; ")    
-    local_record_info_df = local_record_info_df.explode("Repository")
-
-    # Count the occurrences of each "Repository"
-    repositories_count_sr = local_record_info_df["Repository"].value_counts()
+    # Count the occurrences of each "Repository", splitting the semicolon-separated values
+    repositories_count_sr = count_separated_values(record_info_df[["Repository"]], "; ")
+    repositories_count_sr = repositories_count_sr.sort_values(ascending=False, kind="stable")
     repositories_count_sr.to_csv(metadata_folder_path + "/repositories_employed.csv", index_label="Repository", header=["Count"])
 
     # Count the number of different repositories
@@ -341,15 +860,10 @@ def write_species_retrieved_csv(record_info_df, metadata_folder_path):
       has been found, with its corresponding TaxID.
     """
 
-    local_record_info_df = record_info_df.copy() # Create a copy of the dataframe to avoid modifying the original one
-
-    # Split the semicolon-separated values into different rows
-    local_record_info_df["Species"] = local_record_info_df["Species"].str.split(";")
-    local_record_info_df["TaxID"] = local_record_info_df["TaxID"].str.split(";")
-    local_record_info_df = local_record_info_df.explode(["Species", "TaxID"])
-
-    # Count, in a Panda series, the time each "Species-TaxID" appears in the database
-    species_count_sr = local_record_info_df[["Species", "TaxID"]].value_counts()
+    # Count, in a Panda series, the time each "Species-TaxID" appears in the database, splitting 
+    # the semicolon-separated values
+    species_count_sr = count_separated_values(record_info_df[["Species", "TaxID"]], ";")
+    species_count_sr = species_count_sr.sort_values(ascending=False, kind="stable")
     species_count_sr.to_csv(metadata_folder_path + "/species_retrieved.csv", index_label=["Species", "TaxID"], header=["Count"])
 
     # Count the number of different species
@@ -367,16 +881,16 @@ def write_species_per_gene_csv(record_info_df, metadata_folder_path):
     - record_info_df (pd.DataFrame); A dataframe containing all the information present 
       in each record header.
     - metadata_folder_path (string); The path to a folder where the results will be stored.
+    #OUTPUT
+    - species_gene_df (pd.DataFrame); A dataframe with the number of times each different 
+      gene-species combination has been found.
     #WRITE OUTPUT
     - species_genes.csv; A CSV file with the number of times each different gene-species 
       combination has been found.
     """
-    # Split the semicolon-separated values into different rows
-    record_info_df["Species"] = record_info_df["Species"].str.split(";")
-    record_info_df = record_info_df.explode("Species")
-    
-    # Calculate the count per each gene and species combination
-    species_gene_df = record_info_df.groupby(["Gene", "Species"]).size().reset_index(name="Count")
+    # Calculate the count per each gene and species combination, splitting the semicolon-separated species
+    species_gene_count_sr = count_separated_values(record_info_df[["Species", "Gene"]], ";", split_column_count=1)
+    species_gene_df = species_gene_count_sr.reset_index(name="Count").sort_values(["Gene", "Species"])
     
     # Sort and reorder the possition of the columns
     species_gene_df.sort_values(["Species", "Count"], axis=0,ascending=[True, False], inplace=True)
@@ -385,7 +899,46 @@ def write_species_per_gene_csv(record_info_df, metadata_folder_path):
     # Write the dataframe as a csv
     species_gene_df.to_csv(f"{metadata_folder_path}/species_genes.csv", index=False)
 
-def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_id, genes_retrieved_count, gene_search_count, repositories_total_count, species_total_count):
+    return species_gene_df
+
+def write_metadata_plots(species_gene_df, metadata_folder_path, gene_list_path):
+    """
+    This function plots the frequency and presence of the species and genes retrieved in 
+    the multi-fasta database with matplotlib (see metadata_plots.py), as an alternative to
+    the R scripts.
+    
+    #INPUT
+    - species_gene_df (pd.DataFrame); A dataframe with the number of times each different 
+      gene-species combination has been found.
+    - metadata_folder_path (string); The path to a folder where the results will be stored.
+    - gene_list_path (string); The path to the gene list employed to construct the multi-fasta.
+      If no gene list is specified, the variable is assigned as None.
+    #WRITE OUTPUT
+    - plots/species_per_gene_barplot.jpg; A barplot representing the number of diferent 
+      protein records per each specie and gene name.
+    - plots/species_per_gene_grid.jpg; A grid plot representing the presence or absence 
+      of each gene name per species.
+    """
+    try:
+      from metadata_plots import plot_species_per_gene_barplot, plot_species_per_gene_grid
+    except ImportError:
+      print("ERROR: matplotlib is required to generate the metadata plots")
+      return
+
+    if not os.path.exists(f"{metadata_folder_path}/plots"):
+      os.mkdir(f"{metadata_folder_path}/plots")
+
+    if gene_list_path:
+      with open(gene_list_path, "rt") as gene_list_file:
+        gene_list = [gene.strip() for gene in gene_list_file if gene.strip()]
+    elif not gene_list_path:
+      gene_list = None
+
+    plot_species_per_gene_barplot(species_gene_df, f"{metadata_folder_path}/plots")
+    plot_species_per_gene_grid(species_gene_df, f"{metadata_folder_path}/plots", gene_list)
+
+def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_id, header_stats_dic, genes_retrieved_count, gene_search_count, repositories_total_count, species_total_count,
+                      sequence_stats_dic=None):
   """
   This function writes a summary of all the metadata in a text file. It also writes a serie
   of errors in the file if some conditions are fulfilled, like the absence of gene name in a 
@@ -396,10 +949,15 @@ def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_i
   - metadata_folder_path (string); The path to a folder where the results will be stored.
   - gene_list_path (string); The path to the gene list employed to construct the multi-fasta.
   - tax_id (integer); The TaxID number employed to construct the multi-fasta database.
+  - header_stats_dic (dictionary); A dictionary with the number of records, and the number
+    of records with gene name (GN=), taxa name (OS=) and TaxID (OX=) tags in the header.
   - genes_retrieved_count (integer); The number of different genes found.
   - gene_search_count (integer); The number of genes to focus the protein download.
   - repositories_total_count (integer); The number of different repositories found.
   - species_total_count (integer); The number of different species found.
+  - sequence_stats_dic (dictionary); A dictionary with the number of residues, the length and
+    mass ranges, and the number of records with unknown residues. If None, the stats about
+    the sequences are not written.
   #WRITE OUPUT
   - summary.txt; A text file with a summary of all the metadata information retrieved 
     from the multi-fasta database. It also shows the paths to all the other files.
@@ -420,20 +978,20 @@ def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_i
 
     # Warnings
     warnings = 0
-    record_num = os.popen(f"grep -E -c '^>' {database_path}").read()
+    record_num = header_stats_dic["records"]
     metadata.write("# WARNINGS\n")
 
-    record_with_gene = os.popen(f"cat {database_path} | grep -E '^>' | grep -c 'GN='").read()
+    record_with_gene = header_stats_dic["records_with_gene"]
     if record_num != record_with_gene: # Not all the headers have a gene name
         warnings += 1
         metadata.write("Check gene names (GN=)\n")
     
-    record_with_taxname = os.popen(f"cat {database_path} | grep -E '^>' | grep -c 'OS='").read()
+    record_with_taxname = header_stats_dic["records_with_taxname"]
     if record_num != record_with_taxname: # Not all the headers have a species tag
         warnings += 1
         metadata.write("Check taxa names (OS=)\n")
 
-    record_with_taxid = os.popen(f"cat {database_path} | grep -E '^>' | grep -c 'OX='").read()
+    record_with_taxid = header_stats_dic["records_with_taxid"]
     if record_num != record_with_taxid: # Not all the headers have a TaxID
         warnings += 1
         metadata.write("Check taxIDs (OX=)\n")
@@ -452,12 +1010,27 @@ def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_i
 
     # Stats about the protein records
     metadata.write("\n# Stats about the protein records\n" + \
-                    "records: {}".format(record_num) + \
-                    "records_with_gene: {}/{}".format(record_with_gene[:-1],record_num) + \
-                    "records_with_taxname: {}/{}".format(record_with_taxname[:-1],record_num) + \
-                    "records_with_taxid: {}/{}".format(record_with_taxid[:-1],record_num) + 
+                    "records: {}\n".format(record_num) + \
+                    "records_with_gene: {}/{}\n".format(record_with_gene,record_num) + \
+                    "records_with_taxname: {}/{}\n".format(record_with_taxname,record_num) + \
+                    "records_with_taxid: {}/{}\n".format(record_with_taxid,record_num) + \
                     "all_records_path: {}\n".format(metadata_folder_path + "/records_info.csv"))
 
+    # Stats about the protein sequences
+    if sequence_stats_dic is not None:
+        mass_range = "{:.2f}-{:.2f}".format(sequence_stats_dic["min_mass"], sequence_stats_dic["max_mass"]) if sequence_stats_dic["min_mass"] is not None else "NA"
+        median_isoelectric_point = "{:.2f}".format(sequence_stats_dic["median_isoelectric_point"]) if sequence_stats_dic["median_isoelectric_point"] is not None else "NA"
+
+        metadata.write("\n# Stats about the protein sequences\n" + \
+                        "residues: {}\n".format(sequence_stats_dic["residues"]) + \
+                        "length_range: {}-{}\n".format(sequence_stats_dic["min_length"], sequence_stats_dic["max_length"]) + \
+                        "median_length: {:g}\n".format(sequence_stats_dic["median_length"]) + \
+                        "monoisotopic_mass_range (Da): {}\n".format(mass_range) + \
+                        "records_with_mass: {}/{}\n".format(sequence_stats_dic["records_with_mass"], record_num) + \
+                        "records_with_X: {}/{}\n".format(sequence_stats_dic["records_with_x"], record_num) + \
+                        "X_residues: {}/{}\n".format(sequence_stats_dic["x_residues"], sequence_stats_dic["residues"]) + \
+                        "median_isoelectric_point: {}\n".format(median_isoelectric_point))
+
     # Stats about the employed repositories
     metadata.write("\n# Stats about the employed repositories\n" + \
                     "repositories_employed: {}\n".format(repositories_total_count) + \
@@ -481,4 +1054,5 @@ def write_summary_txt(database_path, metadata_folder_path, gene_list_path, tax_i
                     "species_retrieved_path: {}\n".format(metadata_folder_path + "/species_retrieved.csv") + \
                     "species_and_genes_path: {}\n".format(metadata_folder_path + "/species_genes.csv"))
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+  main()
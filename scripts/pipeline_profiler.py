@@ -0,0 +1,219 @@
+# Global imports
+import os
+import json
+import time
+import argparse
+import threading
+import contextlib
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script records the resources employed by each stage (and sub-step) of proteoparc.py
+when it runs with --profile. The other scripts wrap their slow parts with profile_step(),
+which does nothing unless the profiling has been started, so they can still be run alone.
+
+Each step is stored as a "complete" event of the Chrome trace format, which can be opened
+in chrome://tracing or https://ui.perfetto.dev, with the following values in its arguments:
+
+1. wall_time_s; The elapsed time of the step.
+2. cpu_time_s and children_cpu_time_s; The CPU time of ProteoParc and of the external
+   software (mafft, R...) employed during the step. The CPU time is measured for the whole
+   process, so steps running concurrently (e.g. alignment and metadata) share it.
+3. peak_rss_mb and children_peak_rss_mb; The peak memory (resident set size) reached by
+   ProteoParc and by the external software at the end of the step.
+4. requests and bytes_received; The number of HTTP requests done during the step, and the
+   size of their responses.
+
+The script can also be run from the command line to print a summary table of a trace.
+"""
+
+PROFILE_STATE = {"enabled": False, "start": 0.0, "event_list": [], "requests": 0, "bytes_received": 0, "cprofile_folder_path": None, "original_send": None}
+PROFILE_LOCK = threading.Lock()
+
+def main():
+
+    trace_path = parser()
+
+    print(summarize_trace(trace_path).to_string(index=False))
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - trace_path (string); The path to the trace file written by proteoparc.py --profile.
+    """
+    parser = argparse.ArgumentParser(description="A script to summarize the profiling trace of a ProteoParc run")
+    parser.add_argument("trace_path", type=str, help="The path to the profile_trace.json file")
+
+    args = parser.parse_args()
+
+    trace_path = os.path.realpath(args.trace_path)
+
+    return trace_path
+
+def start_profiling(cprofile_folder_path=None):
+    """
+    This function starts recording the profiling events, and counts the HTTP requests
+    done through the requests library (also by requests_futures).
+
+    #INPUT
+    - cprofile_folder_path (string); The path to a folder to store a cProfile dump per each
+      stage, created with the first dump. If None, cProfile is not employed.
+    """
+    import requests
+
+    with PROFILE_LOCK:
+        PROFILE_STATE.update({"enabled": True, "start": time.perf_counter(), "event_list": [], "requests": 0, "bytes_received": 0,
+                              "cprofile_folder_path": cprofile_folder_path, "original_send": requests.Session.send})
+
+    original_send = PROFILE_STATE["original_send"]
+
+    def counted_send(session, request, **kwargs):
+        response = original_send(session, request, **kwargs)
+
+        # The content of the streamed responses is not read, to not consume it
+        bytes_received = 0 if kwargs.get("stream") else len(response.content)
+        with PROFILE_LOCK:
+            PROFILE_STATE["requests"] += 1
+            PROFILE_STATE["bytes_received"] += bytes_received
+
+        return response
+
+    requests.Session.send = counted_send
+
+def stop_profiling(trace_path):
+    """
+    This function stops recording the profiling events, and writes them as a Chrome trace.
+
+    #INPUT
+    - trace_path (string); The path to write the trace file.
+    #WRITE OUTPUT
+    - {trace_path}; A JSON file in Chrome trace format with an event per each profiled step.
+    """
+    import requests
+
+    if not PROFILE_STATE["enabled"]:
+        return
+
+    with PROFILE_LOCK:
+        requests.Session.send = PROFILE_STATE["original_send"]
+        PROFILE_STATE["enabled"] = False
+        event_list = sorted(PROFILE_STATE["event_list"], key=lambda event: event["ts"])
+
+    if not os.path.exists(os.path.dirname(trace_path)):
+        os.makedirs(os.path.dirname(trace_path))
+
+    with open(trace_path, "wt") as trace_file:
+        json.dump({"traceEvents": event_list, "displayTimeUnit": "ms"}, trace_file, indent=1)
+
+def read_resource_usage():
+    """
+    This function reads the CPU time and the peak memory of the process and its children.
+    The peak memory is not available in Windows, where it is assigned as None.
+
+    #OUTPUT
+    - resource_usage_dic (dictionary); A dictionary with the CPU time (s) and peak RSS (MB)
+      of the process and its finished children.
+    """
+    try:
+        import resource
+    except ImportError:
+        return {"cpu_time_s": time.process_time(), "children_cpu_time_s": 0.0, "peak_rss_mb": None, "children_peak_rss_mb": None}
+
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    # ru_maxrss is measured in kilobytes in Linux
+    return {"cpu_time_s": self_usage.ru_utime + self_usage.ru_stime,
+            "children_cpu_time_s": children_usage.ru_utime + children_usage.ru_stime,
+            "peak_rss_mb": self_usage.ru_maxrss / 1024,
+            "children_peak_rss_mb": children_usage.ru_maxrss / 1024}
+
+@contextlib.contextmanager
+def profile_step(step_name, category="step", do_cprofile=False, **extra_args):
+    """
+    This function profiles the code run within a 'with' block, if the profiling has been
+    started. Otherwise, it does nothing.
+
+    #INPUT
+    - step_name (string); The name of the step, shown in the trace.
+    - category (string); The category of the step ("stage" for the pipeline stages, "step"
+      for their sub-steps).
+    - do_cprofile (boolean); A boolean indicator to indicate if the Python functions called
+      in the step are also profiled with cProfile (only if a cProfile folder was set).
+    - extra_args (keywords); Other values to store in the event (e.g. the gene name).
+    """
+    if not PROFILE_STATE["enabled"]:
+        yield
+        return
+
+    python_profiler = None
+    if do_cprofile and PROFILE_STATE["cprofile_folder_path"]:
+        import cProfile
+        python_profiler = cProfile.Profile()
+        python_profiler.enable()
+
+    start_usage_dic = read_resource_usage()
+    start_requests, start_bytes_received = PROFILE_STATE["requests"], PROFILE_STATE["bytes_received"]
+    start_time = time.perf_counter()
+
+    try:
+        yield
+
+    finally:
+        end_time = time.perf_counter()
+        end_usage_dic = read_resource_usage()
+
+        if python_profiler:
+            python_profiler.disable()
+            if not os.path.exists(PROFILE_STATE["cprofile_folder_path"]):
+                os.makedirs(PROFILE_STATE["cprofile_folder_path"])
+            python_profiler.dump_stats(f"{PROFILE_STATE['cprofile_folder_path']}/{step_name}.prof")
+
+        event_args = {"wall_time_s": round(end_time - start_time, 6),
+                      "cpu_time_s": round(end_usage_dic["cpu_time_s"] - start_usage_dic["cpu_time_s"], 6),
+                      "children_cpu_time_s": round(end_usage_dic["children_cpu_time_s"] - start_usage_dic["children_cpu_time_s"], 6),
+                      "peak_rss_mb": end_usage_dic["peak_rss_mb"],
+                      "children_peak_rss_mb": end_usage_dic["children_peak_rss_mb"],
+                      "requests": PROFILE_STATE["requests"] - start_requests,
+                      "bytes_received": PROFILE_STATE["bytes_received"] - start_bytes_received}
+        event_args.update(extra_args)
+
+        with PROFILE_LOCK:
+            PROFILE_STATE["event_list"].append({"name": step_name, "cat": category, "ph": "X",
+                                                "ts": round((start_time - PROFILE_STATE["start"]) * 1e6),
+                                                "dur": round((end_time - start_time) * 1e6),
+                                                "pid": os.getpid(), "tid": threading.get_native_id(),
+                                                "args": event_args})
+
+def summarize_trace(trace_path):
+    """
+    This function summarizes a trace file, adding up the values of the events with the
+    same name (e.g. the alignment of each gene).
+
+    #INPUT
+    - trace_path (string); The path to the trace file.
+    #OUTPUT
+    - trace_summary_df (pd.DataFrame); A dataframe with the number of events, the total wall
+      time, CPU time, requests and bytes received, and the peak memory per each step.
+    """
+    import pandas as pd
+
+    with open(trace_path, "rt") as trace_file:
+        event_list = json.load(trace_file)["traceEvents"]
+
+    event_df = pd.DataFrame([{"Step": event["name"], "Category": event["cat"], **event["args"]} for event in event_list])
+    trace_summary_df = event_df.groupby(["Category", "Step"], sort=False).agg(
+        Count=("wall_time_s", "size"), Wall_time_s=("wall_time_s", "sum"), CPU_time_s=("cpu_time_s", "sum"),
+        Children_CPU_time_s=("children_cpu_time_s", "sum"), Peak_RSS_MB=("peak_rss_mb", "max"),
+        Requests=("requests", "sum"), Bytes_received=("bytes_received", "sum")).reset_index()
+
+    return trace_summary_df.round(3)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 # Global imports
 import os
 import argparse
-from Bio import SeqIO
+import numpy as np
+from pipeline_profiler import profile_step
+from sequence_store import build_sequence_store, store_record_count, store_sequence_bytes, write_store_fasta
 
 # Script information - Written in Python 3.9.12 - May 2023
 __author__ = "Guillermo Carrillo Martin & Ricardo Fong Zazueta"
@@ -33,30 +35,74 @@ protein), and it can occur in two different situations:
 
 def main():
 
-    print("# Removing redundant records")
     input_file_path, output_path, output_folder_name = parser()
 
-    # Create an output folder to store the results
-    if not os.path.exists(f"{output_path}/{output_folder_name}"):
-        os.mkdir(f"{output_path}/{output_folder_name}")
+    # Import the multi-fasta file as a sequence store
+    sequence_store = build_sequence_store(input_file_path)
 
-    # Import the multi-fasta file as a list of records
-    fasta_record_list = list(SeqIO.parse(input_file_path, "fasta"))
+    remove_redundant_records(sequence_store, f"{output_path}/{output_folder_name}")
+
+def remove_redundant_records(sequence_store, output_folder_path):
+    """
+    This function runs the whole redundancy removal step: it removes the duplicate and 
+    substring records from a sequence store, and writes the filtered and the removed 
+    records as multi-fasta files. The indices of the filtered records are also returned,
+    so other steps can use them without reading the multi-fasta file again.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records (see sequence_store.py).
+    - output_folder_path (string); The path to the folder to store the results.
+    #OUTPUT
+    - no_redundant_index_array (np.ndarray); The indices of the records without duplicate or substring records.
+    #WRITE OUTPUT
+    - filtered_database.fasta; A multi-fasta file without redundant records.
+    - redundant_records.fasta; A multi-fasta file containing all the removed records.
+    """
+
+    print("# Removing redundant records")
+
+    # Create an output folder to store the results
+    if not os.path.exists(output_folder_path):
+        os.mkdir(output_folder_path)
 
     # Remove duplicate and substring records
-    no_duplicate_list, duplicate_list, dup_count = remove_duplicate_records(fasta_record_list)
-    no_redundant_list, redundant_list, substring_count = remove_substring_records(no_duplicate_list, duplicate_list)
+    no_redundant_index_array, redundant_index_array, dup_count, substring_count = filter_redundant_records(sequence_store)
 
     # Write the non-redundand database and the (removed) redundant records
-    with open(f"{output_path}/{output_folder_name}/filtered_database.fasta", "w") as output_fasta:
-        SeqIO.write(no_redundant_list, output_fasta, "fasta")
-    with open(f"{output_path}/{output_folder_name}/redundant_records.fasta", "w") as output_fasta:
-        SeqIO.write(redundant_list, output_fasta, "fasta")
+    write_store_fasta(sequence_store, f"{output_folder_path}/filtered_database.fasta", no_redundant_index_array)
+    write_store_fasta(sequence_store, f"{output_folder_path}/redundant_records.fasta", redundant_index_array)
 
     # Print the number of duplicate and substring records removed
     print(f"   {dup_count} records with the same sequence removed")
     print(f"   {substring_count} fragment records removed")
+
+    return no_redundant_index_array
     
+def filter_redundant_records(sequence_store, record_index_array=None):
+    """
+    This function removes the duplicate and substring records from a sequence store, 
+    without writing any file. It allows filtering a subset of the database (e.g. the 
+    records of a single gene) as soon as it is available.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records.
+    - record_index_array (np.ndarray); The indices of the records to filter. If None, all the records.
+    #OUTPUT
+    - no_redundant_index_array (np.ndarray); The indices of the records without duplicate or substring records.
+    - redundant_index_array (np.ndarray); The indices of all the removed records.
+    - dup_count (integer); Number of exact duplicates removed.
+    - substring_count (integer); Number of substring records removed.
+    """
+    if record_index_array is None:
+        record_index_array = np.arange(store_record_count(sequence_store))
+
+    with profile_step("duplicate_removal"):
+        no_duplicate_index_array, duplicate_index_array, dup_count = remove_duplicate_records(sequence_store, record_index_array)
+    with profile_step("substring_removal"):
+        no_redundant_index_array, redundant_index_array, substring_count = remove_substring_records(sequence_store, no_duplicate_index_array, duplicate_index_array)
+
+    return no_redundant_index_array, redundant_index_array, dup_count, substring_count
+
 def parser():
     """
     This function parses the required arguments from the terminal to the python script.
@@ -80,80 +126,79 @@ def parser():
 
     return input_file_path, output_path, output_folder_name
 
-def remove_duplicate_records(fasta_record_list):
+def remove_duplicate_records(sequence_store, record_index_array):
     """ 
-    This function keeps one copy of each duplicated record in a multi-fasta file. Two records are
+    This function keeps one copy of each duplicated record in a sequence store. Two records are
     considered as duplicated if both of them have the exact same sequence.
     
     #INPUT
-    - fasta_record_list (list); A nested list with all the multi-fasta records, parsed 
-      by the SeqIO module.
+    - sequence_store (dictionary); A dictionary with the arrays of the records.
+    - record_index_array (np.ndarray); The indices of the records, in database order.
     #OUTPUT
-    - no_duplicate_list (list); A nested list, in SeqIO format, without exact duplicate records.
-    - duplicate_list (list); A nested list, in SeqIO format, containing the removed records.
+    - no_duplicate_index_array (np.ndarray); The indices of the records without exact duplicates.
+    - duplicate_index_array (np.ndarray); The indices of the removed records.
     - dup_count (integer); Number of exact duplicates removed.
     """
     no_duplicate_dic = {}
     duplicate_list = []
-    dup_count = 0
 
     # Store each sequence into dictionary. Only once per each different sequence
-    for record in fasta_record_list:
+    for record_index in record_index_array:
+        sequence = store_sequence_bytes(sequence_store, record_index)
 
-        if str(record.seq) not in no_duplicate_dic:
-            no_duplicate_dic[str(record.seq)] = record
+        if sequence not in no_duplicate_dic:
+            no_duplicate_dic[sequence] = record_index
         
         else:
-            dup_count += 1
-            duplicate_list.append(record)
+            duplicate_list.append(record_index)
 
-    # Turn the dictionary values into a list
-    no_duplicate_list = list(no_duplicate_dic.values())
+    # Turn the dictionary values into an array
+    no_duplicate_index_array = np.array(list(no_duplicate_dic.values()), dtype=np.int64)
+    duplicate_index_array = np.array(duplicate_list, dtype=np.int64)
 
-    return no_duplicate_list, duplicate_list, dup_count
+    return no_duplicate_index_array, duplicate_index_array, len(duplicate_list)
 
-def remove_substring_records(no_duplicate_list, duplicate_list):
+def remove_substring_records(sequence_store, no_duplicate_index_array, duplicate_index_array):
     """
     This function removes all records whose sequence is a substring of another record's sequence.
     To do so, sequences are sorted by length, and compared to the ones in the list having more
     length. This way, we avoid extra comparisons, as a protein with higher length can not be a 
-    substring of a sorter protein.
+    substring of a sorter protein. The sorted sequences are joined only once, and each sequence
+    is searched from the position where the longer sequences start.
     
     #INPUT
-    - no_duplicate_list (list); A nested list, in SeqIO format, without exact duplicate records.
-    - duplicate_list (list); A nested list, in SeqIO format, containing the removed duplicate 
-      records.
+    - sequence_store (dictionary); A dictionary with the arrays of the records.
+    - no_duplicate_index_array (np.ndarray); The indices of the records without exact duplicates.
+    - duplicate_index_array (np.ndarray); The indices of the removed duplicate records.
     #OUTPUT
-    - no_redundant_list (list); A nested list, in SeqIO format, without exact duplicate or 
-      substring records.
-    - redundant_list (list); A nested list, in SeqIO format, containing the all the 
-      duplicate/substring removed records.
+    - no_redundant_index_array (np.ndarray); The indices of the records without exact duplicate
+      or substring records, in the previous database order.
+    - redundant_index_array (np.ndarray); The indices of all the duplicate/substring removed records.
     - substring_count (integer); Number of substring records removed.
     """
 
-    redundant_list = duplicate_list.copy()
-    no_redundant_list = []
-    substring_count = 0
-
     # Sort the sequences by length
-    no_duplicate_list_sorted = sorted(no_duplicate_list, key=lambda record: len(record.seq))
-    sequences_list_sorted  = [str(record.seq) for record in no_duplicate_list_sorted]
+    sequence_offset_array = np.asarray(sequence_store["sequence_offsets"])
+    length_array = sequence_offset_array[no_duplicate_index_array + 1] - sequence_offset_array[no_duplicate_index_array]
+    length_order_array = np.argsort(length_array, kind="stable")
+    sorted_index_array = no_duplicate_index_array[length_order_array]
+    sequences_list_sorted = [store_sequence_bytes(sequence_store, record_index) for record_index in sorted_index_array]
 
-    # Subset the substring/non-substring sequences in different lists
-    for index, sequence_record in enumerate(sequences_list_sorted):
+    # Concatenate all the sequences once, keeping the position where each one starts
+    joined_sequences = b",".join(sequences_list_sorted)
+    sequence_start_array = np.concatenate([[0], np.cumsum([len(sequence) + 1 for sequence in sequences_list_sorted])])
 
-        # Concatenating all next values and checking for existence
-        if str(sequence_record) not in ', '.join(sequences_list_sorted[index + 1:]):
-            no_redundant_list.append(no_duplicate_list_sorted[index])
-        
-        else:
-            redundant_list.append(no_duplicate_list_sorted[index])
-            substring_count += 1
+    # Subset the substring/non-substring sequences, checking their existence in the next values
+    is_substring_array = np.array([joined_sequences.find(sequence, sequence_start_array[index + 1]) != -1
+                                   for index, sequence in enumerate(sequences_list_sorted)], dtype=bool)
 
     # Reorder the records based on the previous database order
-    original_record_order = {str(record): index for index, record in enumerate(no_duplicate_list)}
-    no_redundant_list = sorted(no_redundant_list, key=lambda x: original_record_order[str(x)])
+    is_substring_original_array = np.empty(len(is_substring_array), dtype=bool)
+    is_substring_original_array[length_order_array] = is_substring_array
+    no_redundant_index_array = no_duplicate_index_array[~is_substring_original_array]
+    redundant_index_array = np.concatenate([duplicate_index_array, sorted_index_array[is_substring_array]]).astype(np.int64)
 
-    return no_redundant_list, redundant_list, substring_count
+    return no_redundant_index_array, redundant_index_array, int(is_substring_array.sum())
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# Global imports
+import numpy as np
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script stores the monoisotopic masses shared by the scripts that compute the mass of
+proteins or peptides (digest_database.py, zooms_markers.py and metadata_proteoparc.py), and
+a lookup array to compute the masses of many sequences at the same time with NumPy.
+"""
+
+# Monoisotopic residue masses (Da)
+RESIDUE_MASS_DIC = {"G": 57.02146372, "A": 71.03711379, "S": 87.03202841, "P": 97.05276385, "V": 99.06841391,
+                    "T": 101.04767847, "C": 103.00918478, "L": 113.08406398, "I": 113.08406398, "N": 114.04292744,
+                    "D": 115.02694303, "Q": 128.05857751, "K": 128.09496302, "E": 129.04259309, "M": 131.04048463,
+                    "H": 137.05891186, "F": 147.06841391, "U": 150.95363559, "R": 156.10111103, "Y": 163.06332853,
+                    "W": 186.07931295, "O": 237.14772677}
+WATER_MASS = 18.0105646863
+PROTON_MASS = 1.00727646688
+CARBAMIDOMETHYL_MASS = 57.02146372 # Fixed modification of the cysteines alkylated with iodoacetamide
+
+def residue_mass_array(do_carbamidomethyl=False):
+    """
+    This function builds a lookup array with the mass of each residue, indexed by its ASCII
+    code, so the masses of many sequences can be computed at the same time with NumPy.
+
+    #INPUT
+    - do_carbamidomethyl (boolean); A boolean indicator to indicate if the cysteines are
+      carbamidomethylated (fixed modification).
+    #OUTPUT
+    - mass_array (np.ndarray); An array of 256 masses. The empty byte (padding) has a mass
+      of 0, and the residues without a defined mass (X, B, Z, J...) are NaN.
+    """
+    mass_array = np.full(256, np.nan)
+    mass_array[0] = 0.0
+
+    for residue, residue_mass in RESIDUE_MASS_DIC.items():
+        mass_array[ord(residue)] = residue_mass
+
+    if do_carbamidomethyl:
+        mass_array[ord("C")] += CARBAMIDOMETHYL_MASS
+
+    return mass_array
@@ -0,0 +1,370 @@
+# Global imports
+import os
+import json
+import mmap
+import argparse
+import numpy as np
+import pandas as pd
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script stores the records of a multi-fasta database in a compact form, shared by the
+processing steps instead of a list of Biopython SeqRecord objects (whose per-object memory
+is larger than the protein sequences themselves). The store is a dictionary of NumPy arrays:
+
+1. sequences and sequence_offsets; All the sequences concatenated in a single byte array
+   (without line breaks), and the position where each sequence starts (plus the total size).
+2. headers and header_offsets; All the headers (without ">") concatenated in a byte array,
+   and the position where each header starts.
+3. gene_codes and species_codes; The gene name (GN=) and species (OS=) of each record, as
+   the index of a list with each different name (gene_names and species_names), or -1 if
+   the record has no gene name or species.
+
+The steps work with arrays of record indices (e.g. the records of a gene, or the records
+kept after removing the redundancy), and only build the strings they need. The store of the
+final database is saved next to it (.sequence_store folder) as .npy files, which are read
+as memory maps in the next runs while the database does not change.
+
+The script can also be run from the command line to build the store of a multi-fasta file.
+"""
+
+GENE_REGULAR_EXPRESSION = r"GN=\s*(\S+)" # The first word after "GN=", as retrieve_gene_name() in align_database_per_gene.py
+SPECIES_REGULAR_EXPRESSION = r"OS=(.*?)\sOX=" # As the "Species" column of metadata_proteoparc.py
+STORE_ARRAY_LIST = ["sequences", "sequence_offsets", "headers", "header_offsets", "gene_codes", "species_codes"]
+FASTA_LINE_LENGTH = 60 # The sequence line length of the multi-fasta files, as written by Biopython
+
+def main():
+
+    fasta_path, store_folder_path = parser()
+
+    sequence_store = build_sequence_store(fasta_path)
+    save_sequence_store(sequence_store, store_folder_path, fasta_path)
+
+    print(f"# {len(sequence_store['sequence_offsets']) - 1} records, {len(sequence_store['gene_names'])} genes and {len(sequence_store['species_names'])} species stored in '{store_folder_path}'")
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - fasta_path (string); The path to the multi-fasta file.
+    - store_folder_path (string); The folder to write the sequence store.
+    """
+    parser = argparse.ArgumentParser(description="A script to store the records of a multi-fasta file as NumPy arrays")
+    parser.add_argument("fasta_path", type=str, help="The path to the multi-fasta file")
+    parser.add_argument("--output", "-o", dest="output", type=str, help="The folder to write the sequence store (default: .sequence_store next to the multi-fasta)", required=False, nargs=1)
+
+    args = parser.parse_args()
+
+    fasta_path = os.path.realpath(args.fasta_path)
+    if args.output:
+        store_folder_path = os.path.realpath(args.output[0])
+    elif not args.output:
+        store_folder_path = f"{os.path.dirname(fasta_path)}/.sequence_store"
+
+    return fasta_path, store_folder_path
+
+def create_sequence_store(header_list, sequence_buffer, sequence_offset_list):
+    """
+    This function creates a sequence store from the headers and the concatenated sequences
+    of the records, interning the gene name and species of each header.
+
+    #INPUT
+    - header_list (list); A list with the header of each record, without the ">".
+    - sequence_buffer (bytearray); All the sequences concatenated.
+    - sequence_offset_list (list); The position where each sequence starts, plus the total size.
+    #OUTPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    """
+    encoded_header_list = [header.encode() for header in header_list]
+    header_sr = pd.Series(header_list, dtype=object)
+
+    sequence_store = {"sequences": np.frombuffer(bytes(sequence_buffer), dtype=np.uint8),
+                      "sequence_offsets": np.array(sequence_offset_list, dtype=np.int64),
+                      "headers": np.frombuffer(b"".join(encoded_header_list), dtype=np.uint8),
+                      "header_offsets": np.concatenate([[0], np.cumsum([len(header) for header in encoded_header_list], dtype=np.int64)]).astype(np.int64)}
+
+    # Intern the gene names and species as codes of a list of names
+    for field_name, regular_expression in [("gene", GENE_REGULAR_EXPRESSION), ("species", SPECIES_REGULAR_EXPRESSION)]:
+        field_code_array, field_name_index = pd.factorize(header_sr.str.extract(regular_expression, expand=False), use_na_sentinel=True)
+        sequence_store[f"{field_name}_codes"] = field_code_array.astype(np.int32)
+        sequence_store[f"{field_name}_names"] = [str(name) for name in field_name_index]
+
+    return sequence_store
+
+def build_sequence_store(fasta_path):
+    """
+    This function builds the sequence store of a multi-fasta file, reading it through a
+    memory map without creating an object per record.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta file.
+    #OUTPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    """
+    header_list = []
+    sequence_buffer = bytearray()
+    sequence_offset_list = [0]
+
+    if os.path.getsize(fasta_path) > 0:
+        with open(fasta_path, "rb") as fasta_file, mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ) as fasta_map:
+            header_start = fasta_map.find(b">") if fasta_map[:1] != b">" else 0
+
+            while header_start != -1:
+                header_end = fasta_map.find(b"\n", header_start)
+                if header_end == -1:
+                    header_end = len(fasta_map)
+                record_end = fasta_map.find(b"\n>", header_end)
+                sequence_end = record_end if record_end != -1 else len(fasta_map)
+
+                # Remove the line breaks and spaces of the sequence, as Biopython does
+                header_list.append(fasta_map[header_start + 1:header_end].decode().rstrip())
+                sequence_buffer += fasta_map[header_end:sequence_end].translate(None, b"\n\r \t")
+                sequence_offset_list.append(len(sequence_buffer))
+
+                header_start = record_end + 1 if record_end != -1 else -1
+
+    return create_sequence_store(header_list, sequence_buffer, sequence_offset_list)
+
+def build_sequence_store_from_records(fasta_record_list):
+    """
+    This function builds the sequence store of a list of records in SeqIO format.
+
+    #INPUT
+    - fasta_record_list (list); A list with the records, in SeqIO format.
+    #OUTPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    """
+    sequence_buffer = bytearray()
+    sequence_offset_list = [0]
+
+    for record in fasta_record_list:
+        sequence_buffer += str(record.seq).encode()
+        sequence_offset_list.append(len(sequence_buffer))
+
+    return create_sequence_store([record.description or record.id for record in fasta_record_list], sequence_buffer, sequence_offset_list)
+
+def subset_sequence_store(sequence_store, record_index_array):
+    """
+    This function builds a new compact store with some records of a store.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index_array (np.ndarray); The indices of the records to keep, in order.
+    #OUTPUT
+    - subset_store (dictionary); A dictionary with the arrays of the new store.
+    """
+    subset_store = {}
+
+    for buffer_name, offset_name in [("sequences", "sequence_offsets"), ("headers", "header_offsets")]:
+        start_array = sequence_store[offset_name][record_index_array]
+        end_array = sequence_store[offset_name][np.asarray(record_index_array) + 1]
+        subset_store[buffer_name] = np.concatenate([sequence_store[buffer_name][start:end] for start, end in zip(start_array, end_array)] + [np.empty(0, dtype=np.uint8)])
+        subset_store[offset_name] = np.concatenate([[0], np.cumsum(end_array - start_array)]).astype(np.int64)
+
+    for field_name in ["gene", "species"]:
+        subset_store[f"{field_name}_codes"] = np.asarray(sequence_store[f"{field_name}_codes"][record_index_array], dtype=np.int32)
+        subset_store[f"{field_name}_names"] = sequence_store[f"{field_name}_names"]
+
+    return subset_store
+
+def save_sequence_store(sequence_store, store_folder_path, fasta_path):
+    """
+    This function writes a sequence store as .npy files, with the signature of the
+    multi-fasta file it was built from.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - store_folder_path (string); The folder to write the store.
+    - fasta_path (string); The path to the multi-fasta file of the store.
+    #WRITE OUTPUT
+    - {array}.npy; A NumPy file per array of the store.
+    - store_fields.json; The gene names, species and the signature of the multi-fasta file.
+    """
+    os.makedirs(store_folder_path, exist_ok=True)
+
+    for array_name in STORE_ARRAY_LIST:
+        np.save(f"{store_folder_path}/{array_name}.npy", sequence_store[array_name])
+
+    with open(f"{store_folder_path}/store_fields.json", "w") as field_file:
+        json.dump({"signature": file_signature(fasta_path), "gene_names": sequence_store["gene_names"],
+                   "species_names": sequence_store["species_names"]}, field_file)
+
+def open_sequence_store(fasta_path, store_folder_path):
+    """
+    This function opens the sequence store of a multi-fasta file as memory maps, building
+    it first if it does not exist or if the multi-fasta file has changed.
+
+    #INPUT
+    - fasta_path (string); The path to the multi-fasta file.
+    - store_folder_path (string); The folder of the store.
+    #OUTPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    """
+    if os.path.exists(f"{store_folder_path}/store_fields.json"):
+        with open(f"{store_folder_path}/store_fields.json", "r") as field_file:
+            field_dic = json.load(field_file)
+
+        if field_dic["signature"] == file_signature(fasta_path) and all(os.path.exists(f"{store_folder_path}/{array_name}.npy") for array_name in STORE_ARRAY_LIST):
+            sequence_store = {array_name: np.load(f"{store_folder_path}/{array_name}.npy", mmap_mode="r") for array_name in STORE_ARRAY_LIST}
+            sequence_store["gene_names"] = field_dic["gene_names"]
+            sequence_store["species_names"] = field_dic["species_names"]
+            return sequence_store
+
+    sequence_store = build_sequence_store(fasta_path)
+    save_sequence_store(sequence_store, store_folder_path, fasta_path)
+
+    return sequence_store
+
+def file_signature(path):
+    """
+    This function computes a cheap signature of a file, based on its size and last
+    modification time.
+
+    #INPUT
+    - path (string); The path to the file.
+    #OUTPUT
+    - signature (list); A list with the size and the modification time (ns) of the file.
+    """
+    file_stat = os.stat(path)
+
+    return [file_stat.st_size, file_stat.st_mtime_ns]
+
+def store_record_count(sequence_store):
+    """
+    This function returns the number of records in a sequence store.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    #OUTPUT
+    - record_count (integer); The number of records.
+    """
+    return len(sequence_store["sequence_offsets"]) - 1
+
+def store_sequence_bytes(sequence_store, record_index):
+    """
+    This function returns the sequence of a record as bytes.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index (integer); The index of the record.
+    #OUTPUT
+    - sequence (bytes); The sequence of the record.
+    """
+    sequence_offset_array = sequence_store["sequence_offsets"]
+
+    return sequence_store["sequences"][sequence_offset_array[record_index]:sequence_offset_array[record_index + 1]].tobytes()
+
+def store_header(sequence_store, record_index):
+    """
+    This function returns the header of a record.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index (integer); The index of the record.
+    #OUTPUT
+    - header (string); The header of the record, without the ">".
+    """
+    header_offset_array = sequence_store["header_offsets"]
+
+    return sequence_store["headers"][header_offset_array[record_index]:header_offset_array[record_index + 1]].tobytes().decode()
+
+def store_header_list(sequence_store, record_index_array=None):
+    """
+    This function returns the headers of some records (or of all of them).
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index_array (np.ndarray); The indices of the records. If None, all the records.
+    #OUTPUT
+    - header_list (list); A list with the header of each record, without the ">".
+    """
+    # All the headers are sliced from a single copy of the bytes, instead of one array slice per record
+    if record_index_array is None:
+        header_bytes = sequence_store["headers"].tobytes()
+        header_offset_list = sequence_store["header_offsets"].tolist()
+        return [header_bytes[header_start:header_end].decode() for header_start, header_end in zip(header_offset_list[:-1], header_offset_list[1:])]
+
+    return [store_header(sequence_store, record_index) for record_index in record_index_array]
+
+def group_records_per_gene(sequence_store, record_index_array=None):
+    """
+    This function groups the records of a store per gene name. Records without a gene name
+    are skipped.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index_array (np.ndarray); The indices of the records to group. If None, all the records.
+    #OUTPUT
+    - gene_index_dic (dictionary); A dictionary with the gene names as keys, in order of
+      appearance, and the array of indices of their records as values.
+    """
+    if record_index_array is None:
+        record_index_array = np.arange(store_record_count(sequence_store))
+    record_index_array = np.asarray(record_index_array)
+
+    gene_code_array = np.asarray(sequence_store["gene_codes"])[record_index_array]
+    record_index_array, gene_code_array = record_index_array[gene_code_array >= 0], gene_code_array[gene_code_array >= 0]
+
+    # Sort the records by gene keeping their order, and split them where the gene changes
+    order_array = np.argsort(gene_code_array, kind="stable")
+    gene_code_sorted_array = gene_code_array[order_array]
+    split_array = np.flatnonzero(np.diff(gene_code_sorted_array)) + 1
+    gene_group_list = np.split(record_index_array[order_array], split_array)
+    gene_code_list = gene_code_sorted_array[np.concatenate([[0], split_array])] if len(gene_code_sorted_array) else []
+
+    # Return the genes in the order they appear in the records
+    gene_group_list = sorted(zip(gene_code_list, gene_group_list), key=lambda gene_group: gene_group[1][0])
+
+    return {sequence_store["gene_names"][gene_code]: gene_index_array for gene_code, gene_index_array in gene_group_list}
+
+def format_store_fasta(sequence_store, record_index_array=None):
+    """
+    This function writes some records of a store (or all of them) as a multi-fasta, with
+    the sequences in lines of 60 residues.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - record_index_array (np.ndarray); The indices of the records. If None, all the records.
+    #OUTPUT
+    - fasta_bytes (bytes); The multi-fasta of the records.
+    """
+    if record_index_array is None:
+        record_index_array = range(store_record_count(sequence_store))
+
+    fasta_line_list = []
+    for record_index in record_index_array:
+        sequence = store_sequence_bytes(sequence_store, record_index)
+        fasta_line_list.append(b">" + store_header(sequence_store, record_index).encode() + b"\n")
+        fasta_line_list.extend(sequence[line_start:line_start + FASTA_LINE_LENGTH] + b"\n" for line_start in range(0, len(sequence), FASTA_LINE_LENGTH))
+
+    return b"".join(fasta_line_list)
+
+def write_store_fasta(sequence_store, fasta_path, record_index_array=None, batch_size=10000):
+    """
+    This function writes some records of a store (or all of them) as a multi-fasta file,
+    in batches of records.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the store.
+    - fasta_path (string); The path to write the multi-fasta file.
+    - record_index_array (np.ndarray); The indices of the records. If None, all the records.
+    - batch_size (integer); The number of records formatted at the same time.
+    #WRITE OUTPUT
+    - {fasta_path}; A multi-fasta file with the records.
+    """
+    if record_index_array is None:
+        record_index_array = np.arange(store_record_count(sequence_store))
+
+    # Replace the file instead of writing over it, so an interrupted write does not leave a truncated database
+    with open(f"{fasta_path}.tmp", "wb") as fasta_file:
+        for batch_start in range(0, len(record_index_array), batch_size):
+            fasta_file.write(format_store_fasta(sequence_store, record_index_array[batch_start:batch_start + batch_size]))
+    os.replace(f"{fasta_path}.tmp", fasta_path)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,20 @@
 # Global imports
-import re
 import os
 import argparse
 import requests
 import json
+import heapq
+import sqlite3
+import tempfile
 from requests.adapters import HTTPAdapter, Retry
 from concurrent.futures import as_completed
 from requests_futures.sessions import FuturesSession
 from Bio import SeqIO
 from Bio.Seq import Seq
 from Bio.SeqRecord import SeqRecord
+from pipeline_profiler import profile_step
+from listing_cache import configure_listing_cache, default_listing_cache_path, fetch_listing
+from download_metrics import start_download_metrics, stop_download_metrics, expect_records, count_records
 
 # Script information - Written in Python 3.9.12 - May 2023
 __author__ = "Guillermo Carrillo Martin"
@@ -22,65 +27,140 @@ non-redundant archive containing all the proteins sequenced or predicted in
 UniProt, NCBI, and other repositories. The search is focused on a specific taxonomic 
 group by a TaxID and can be restricted to a certain group of genes, indicated by
 a text file. Proteins from the FusionGDB repository are not being downloaded, as those 
-peptides have a synthetic origin. Additionally, 3 JSON files are ouput to store the extra 
-metadata of the repositories, species, and TaxID of each record in the database. The 
-objective of these files is to store the cases of records associated with more than one
-repository, species, or TaxID.
+peptides have a synthetic origin. Additionally, a SQLite file is output to store the extra 
+metadata of the repositories, species, and TaxID of each record in the database, keyed by
+the UPI identifier. The objective of this file is to store the cases of records associated 
+with more than one repository, species, or TaxID. The same metadata can be exported as 3 
+JSON files (--export-json) for compatibility with previous versions. The lists of UniParc IDs 
+and descendent TaxIDs are cached locally and revalidated with conditional requests, so an 
+unchanged list is not paged again (see listing_cache.py). The records are written in the
+order of the UniParc ID lists (gene by gene if a gene list is given), so downloading the
+same records twice writes the same database. The progress of the download (requests,
+latency, records per second, ETA...) can be exported periodically to a Prometheus textfile
+or JSON status file (--metrics-file, see download_metrics.py).
 
 Other specificities, such as the description of the protein header, can 
 be seen in the README.md file.
 """
 
+REORDER_BUFFER_SIZE = 5000 # Maximum number of records downloaded out of order kept in memory before spilling them to disk
+
 def main():
 	
-	output_path, output_name, tax_id, gene_list_path, gene_list = parser()
-
-	# Download the protein records IDs (UPI) and store them in a list
-	upi_id_list = []
-
-	if gene_list:
-		upi_gene_dic = {} # Create a dictionary to store the gene name for each UPI ID
-
-		print(f"# Downloading the proteins indicated in '{gene_list_path}'")
-		for gene_name in gene_list:
-			# Download the UPI IDs for each gene name and assign the gene name in a dictionary
-			upi_id_batch_list = api_get_uniparc_record_id_list(tax_id, gene_name)
-			upi_gene_batch_dic = {key: gene_name for key in upi_id_batch_list}
+	output_path, output_name, tax_id, gene_list_path, gene_list, do_export_json, listing_cache_path, listing_max_age, metrics_path, metrics_interval = parser()
 
-			upi_id_list.extend(upi_id_batch_list)
-			upi_gene_dic.update(upi_gene_batch_dic)
+	configure_listing_cache(listing_cache_path, listing_max_age)
 
-	elif not gene_list:
-		print("# Downloading the whole proteome")
-		upi_id_list = api_get_uniparc_record_id_list(tax_id)
-		upi_gene_dic = None
+	start_download_metrics(metrics_path, metrics_interval)
+	try:
+		records_fasta_list = download_uniparc_database(output_path, output_name, tax_id, gene_list, gene_list_path, do_export_json)
+	finally:
+		stop_download_metrics()
 
-	# Download each JSON record based on the UPI ID list
-	json_record_list, records_total_count = api_get_json_record_list(upi_id_list)
-
-	if records_total_count == 0:
-		print("EXIT: No proteins found with the set conditions")
+	if not records_fasta_list:
 		exit(0)
 
-	# Generate a list with all the descendents taxid clades of the input taxid to filter the json records
-	tax_id_descendent_list = api_get_taxid_descendent_list(tax_id)
+def download_uniparc_database(output_path, output_name, tax_id, gene_list=None, gene_list_path=None, do_export_json=False, gene_callback=None):
+	"""
+	This function runs the whole download step: it retrieves the UniParc records of the 
+	input TaxID (and gene names), writes them as a multi-fasta file, and stores the extra
+	metadata of each record. The records are also returned, so other steps can use them
+	without reading the multi-fasta file again.
+	#INPUT
+	- output_path (string); The absolute folder path to write the multi-fasta database.
+	- output_name (string); The name of the multi-fasta database.
+	- tax_id (integer); The TaxID number employed to construct the multi-fasta database.
+	- gene_list (list); A list with all the gene names employed to filter the records.
+		If no gene list is specified, the variable is assigned as None.
+	- gene_list_path (string); The path to the gene list file, only used in the printed output.
+	- do_export_json (boolean); A boolean indicator to indicate if the extra metadata is also
+		exported as JSON files.
+	- gene_callback (function); A function called with the gene name and its list of SeqRecord
+		objects as soon as all the records of a gene are downloaded, while the other genes
+		are still downloading. Only used with a gene list. If None, the records are only
+		returned at the end.
+	#OUTPUT
+	- records_fasta_list (list); A list with all the SeqRecord objects written in the database.
+		If no proteins are found, the list is empty and no file is written.
+	#WRITE OUTPUT
+	- {output_name}; A multi-fasta protein database.
+	- .records_metadata.sqlite; A SQLite file with the extra metadata of each record.
+	"""
 
-	# Turn the JSON records into a multi-fasta file
-	records_fasta_list, extra_metadata_repos_dic, extra_metadata_species_dic, extra_metadata_taxid_dic = json_to_fasta(json_record_list, tax_id_descendent_list, upi_gene_dic)
+	# Download the records gene by gene, handing each gene to the callback once it is complete
+	if gene_list and gene_callback:
+		print(f"# Downloading the proteins indicated in '{gene_list_path}' (processing each gene once downloaded)")
+
+		with profile_step("taxonomy_descendents"):
+			tax_id_descendent_list = api_get_taxid_descendent_list(tax_id)
+		metadata_connection = create_metadata_database(f"{output_path}/.records_metadata.sqlite")
+		gene_records_fasta_dic = {}
+
+		for gene_name, gene_json_record_list in api_get_json_record_list_per_gene(tax_id, gene_list):
+			upi_gene_dic = {json_record["uniParcId"]: gene_name for json_record in gene_json_record_list}
+			with profile_step("json_to_fasta", gene=gene_name):
+				gene_records_fasta_list = json_to_fasta(gene_json_record_list, tax_id_descendent_list, metadata_connection, upi_gene_dic)
+
+			gene_records_fasta_dic[gene_name] = gene_records_fasta_list
+			gene_callback(gene_name, gene_records_fasta_list)
+
+		# Write the genes in the order of the gene list, whatever the order they were downloaded
+		records_fasta_list = [record for gene_name in gene_list if gene_name in gene_records_fasta_dic for record in gene_records_fasta_dic.pop(gene_name)]
+
+		if not records_fasta_list:
+			metadata_connection.close()
+			os.remove(f"{output_path}/.records_metadata.sqlite")
+			print("EXIT: No proteins found with the set conditions")
+			return []
+
+	# Download all the records before turning them into a multi-fasta
+	else:
+		upi_id_list = []
+
+		if gene_list:
+			upi_gene_dic = {} # Create a dictionary to store the gene name for each UPI ID
+
+			print(f"# Downloading the proteins indicated in '{gene_list_path}'")
+			for gene_name in gene_list:
+				# Download the UPI IDs for each gene name and assign the gene name in a dictionary
+				with profile_step("uniparc_id_paging", gene=gene_name):
+					upi_id_batch_list = api_get_uniparc_record_id_list(tax_id, gene_name)
+				upi_gene_batch_dic = {key: gene_name for key in upi_id_batch_list}
+
+				upi_id_list.extend(upi_id_batch_list)
+				upi_gene_dic.update(upi_gene_batch_dic)
+
+		elif not gene_list:
+			print("# Downloading the whole proteome")
+			with profile_step("uniparc_id_paging"):
+				upi_id_list = api_get_uniparc_record_id_list(tax_id)
+			upi_gene_dic = None
+
+		if not upi_id_list:
+			print("EXIT: No proteins found with the set conditions")
+			return []
+
+		# Generate a list with all the descendents taxid clades of the input taxid to filter the json records
+		with profile_step("taxonomy_descendents"):
+			tax_id_descendent_list = api_get_taxid_descendent_list(tax_id)
+
+		# Download each JSON record based on the UPI ID list and turn them into a multi-fasta file as they arrive,
+		# in the order of the list, storing the extra metadata in a SQLite file
+		metadata_connection = create_metadata_database(f"{output_path}/.records_metadata.sqlite")
+		with profile_step("json_fetch"):
+			records_fasta_list = json_to_fasta(api_get_json_record_list(upi_id_list, output_path), tax_id_descendent_list, metadata_connection, upi_gene_dic)
 
 	# Write the multi-fasta file and print the number of proteins downloaded
-	with open(f"{output_path}/{output_name}", "w") as output_fasta_file:
+	with profile_step("write_fasta"), open(f"{output_path}/{output_name}", "w") as output_fasta_file:
 		SeqIO.write(records_fasta_list, output_fasta_file, "fasta")
 
-	# Write the extra metadata files
-	with open(f"{output_path}/.repos_metadata.json", "w") as output_repos_metadata_file:
-		json.dump(extra_metadata_repos_dic, output_repos_metadata_file, indent=4)
+	# Export the extra metadata as JSON files
+	if do_export_json:
+		export_json_metadata(metadata_connection, output_path)
 
-	with open(f"{output_path}/.species_metadata.json", "w") as output_species_metadata_file:
-		json.dump(extra_metadata_species_dic, output_species_metadata_file, indent=4)
+	metadata_connection.close()
 
-	with open(f"{output_path}/.taxid_metadata.json", "w") as output_taxid_metadata_file:
-		json.dump(extra_metadata_taxid_dic, output_taxid_metadata_file, indent=4)
+	return records_fasta_list
 
 def parser():
 	"""
@@ -94,12 +174,26 @@ def parser():
 		database. If no gene list is specified, the variable is assigned as None.
 	- gene_list (list); A list with all the gene names present in the input gene list file.
 		If no gene list is specified, the variable is assigned as None.
+	- do_export_json (boolean); A boolean indicator to indicate if the extra metadata is also
+		exported as JSON files.
+	- listing_cache_path (string); The path to the cache of the UniProt listings. If the cache
+		is disabled, the variable is assigned as None.
+	- listing_max_age (float); The number of seconds a cached listing is reused without 
+		revalidating it.
+	- metrics_path (string); The path to the status file with the download metrics. If no
+		file is specified, the variable is assigned as None.
+	- metrics_interval (float); The number of seconds between two exports of the metrics.
 	"""
 	parser = argparse.ArgumentParser(description="This script generates a multi-fasta database from the UniParc archive. The search is focused on a specific taxonomic group by a TaxID and can be restricted to a certain group of genes, indicated by a text file")
 	parser.add_argument("--output-path", dest="output_path", type=str, help="The folder path to write the multi-fasta database (default: working directory)", required=False, default=["."], nargs=1)
 	parser.add_argument("--output-name", dest="output_name", type=str, help="The name of the multi-fasta database (default: database.fasta)", required=False, default=["database.fasta"], nargs=1)
 	parser.add_argument("--tax-id", dest="TaxID", type=int, help="The TaxID number employed to construct the multi-fasta database", required=True, nargs=1)
 	parser.add_argument("--genes", dest="gene_list", type=str, help="The path to the list of genes (not mandatory)", required=False, default=[None], nargs=1)
+	parser.add_argument("--export-json", dest="export_json", action=argparse.BooleanOptionalAction, help="Export the extra metadata as JSON files (default: False; --no-export-json)", default=False, required=False)
+	parser.add_argument("--listing-cache", dest="listing_cache", action=argparse.BooleanOptionalAction, help="Cache the UniProt listings and revalidate them in the next runs (default: True; --listing-cache)", default=True, required=False)
+	parser.add_argument("--listing-max-age", dest="listing_max_age", type=float, help="The number of seconds a cached listing is reused without revalidating it (default: 0)", required=False, default=[0.0], nargs=1)
+	parser.add_argument("--metrics-file", dest="metrics_file", type=str, help="The path to export the download metrics periodically, as a Prometheus textfile if it ends with .prom or as JSON otherwise (not mandatory)", required=False, default=[None], nargs=1)
+	parser.add_argument("--metrics-interval", dest="metrics_interval", type=float, help="The number of seconds between two exports of the download metrics (default: 15)", required=False, default=[15.0], nargs=1)
 
 	args = parser.parse_args()
 
@@ -120,7 +214,21 @@ def parser():
 	elif not gene_list_path:
 		gene_list = None
 
-	return output_path, output_name, tax_id, gene_list_path, gene_list
+	do_export_json = args.export_json
+
+	if args.listing_cache:
+		listing_cache_path = default_listing_cache_path()
+	elif not args.listing_cache:
+		listing_cache_path = None
+	listing_max_age = args.listing_max_age[0]
+
+	if args.metrics_file[0]:
+		metrics_path = os.path.realpath(args.metrics_file[0])
+	elif not args.metrics_file[0]:
+		metrics_path = None
+	metrics_interval = args.metrics_interval[0]
+
+	return output_path, output_name, tax_id, gene_list_path, gene_list, do_export_json, listing_cache_path, listing_max_age, metrics_path, metrics_interval
 
 def api_get_uniparc_record_id_list(tax_id, gene_name=None):
 	"""
@@ -136,8 +244,6 @@ def api_get_uniparc_record_id_list(tax_id, gene_name=None):
 	- upi_id_batch_list (list); A list with all the UniParc IDs (UPI) of the proteins
 		associated with the input TaxID and gene name.
 	"""
-	
-	upi_id_batch_list = []
 
 	# Set the URL for the UniParc API request
 	if gene_name:
@@ -146,66 +252,181 @@ def api_get_uniparc_record_id_list(tax_id, gene_name=None):
 		url_record_upi_id = f"https://rest.uniprot.org/uniparc/search?format=list&query=%28taxonomy_id%3A{str(tax_id)}%29&size=500"
 
 	# Set up the batch API downloader
-	re_next_link = re.compile(r'<(.+)>; rel="next"')
 	retries = Retry(total=5, backoff_factor=0.25, status_forcelist=[500, 502, 503, 504])
 	session = requests.Session()
 	session.mount("https://", HTTPAdapter(max_retries=retries))
 
-	# Download in batches the UniParc IDs that fulfill the query conditions
-	while url_record_upi_id:
-		id_batch_500 = session.get(url_record_upi_id)
-		id_batch_500.raise_for_status()
-
-		upi_id_batch_500_list = [upi_id for upi_id in id_batch_500.text.split("\n") if upi_id]
-		upi_id_batch_list.extend(upi_id_batch_500_list)
-
-		# If there are more than 500 records, retrieve the link for the next batch of records 
-		if "Link" in id_batch_500.headers:
-			match = re_next_link.match(id_batch_500.headers["Link"])
-			url_record_upi_id = match.group(1)
-		elif not "Link" in id_batch_500.headers:
-			url_record_upi_id = None
+	# Download in batches of 500 the UniParc IDs that fulfill the query conditions (or reuse the cached list if unchanged)
+	upi_id_batch_list = fetch_listing(session, url_record_upi_id)
 
 	return upi_id_batch_list
 
-def api_get_json_record_list(upi_id_list):
+def api_get_json_record_list(upi_id_list, spill_folder_path=None):
 	"""
 	This function employs the UniProt API to download the JSON records of the
 	UniParc IDs (UPI) provided in the input list. The function uses parallel requests
-	to speed up the download process, and it returns a list of JSON records along with
-	the total number of records downloaded.
+	to speed up the download process, and yields the JSON records in the order of the
+	input list as soon as they can be written (see yield_in_query_order()).
 	#INPUT
 	- upi_id_list (list); A list with all the UniParc IDs (UPI) of the proteins.
-	#OUTPUT
-	- json_records_list (list); A list with all the JSON records of the UniParc IDs.
-	- records_total_count (integer); The total number of records downloaded.
+	- spill_folder_path (string); The folder to write temporary files if too many records
+		arrive out of order. If None, the system temporary folder is employed.
+	#OUTPUT (yield)
+	- json_record (dictionary); The JSON record of each UniParc ID, in the order of the list.
 	"""
 
-	json_records_list = []
 	total_records = len(upi_id_list)
 	counter = 0
 
 	print(f"   {total_records} records will be downloaded")
+	expect_records(total_records)
 
 	# Paralelize JSON download
 	with FuturesSession() as session:
 
-		# Create the download futures
-		download_list = [session.get(f"https://rest.uniprot.org/uniparc/{upi_id}.json") for upi_id in upi_id_list]
-		
+		# Create the download futures, indexed by their position in the list
+		download_index_dic = {session.get(f"https://rest.uniprot.org/uniparc/{upi_id}.json"): index for index, upi_id in enumerate(upi_id_list)}
+
 		# Process the results as they complete
-		for download_json in as_completed(download_list):
-			json_record = download_json.result().json()
-			json_records_list.append(json_record)
+		def completed_record_iterator():
+			for download_json in as_completed(download_index_dic):
+				json_record = download_json.result().json()
+				count_records()
+				yield download_index_dic.pop(download_json), json_record
+
+		for json_record in yield_in_query_order(completed_record_iterator(), spill_folder_path):
+			yield json_record
 			counter += 1
 
 			# Print the download progress
 			if counter % 500 == 0:
 				print(f"{counter}/{total_records} proteins downloaded", end="\r")
 
-	records_total_count = len(json_records_list)
+def yield_in_query_order(indexed_record_iterator, spill_folder_path=None, buffer_size=REORDER_BUFFER_SIZE):
+	"""
+	This function reorders the records downloaded in parallel, yielding them in the order of
+	the query as soon as all the previous ones have arrived. The records arriving before
+	their turn wait in a buffer; if the buffer reaches buffer_size records, they are written
+	to a temporary file sorted by position (a sorted run), and the runs are merged back as
+	their turn comes, so memory stays bounded even if an early record is delayed.
+	#INPUT
+	- indexed_record_iterator (iterator); The (position, record) pairs, in any order. The
+		positions must be consecutive integers starting at 0.
+	- spill_folder_path (string); The folder to write the sorted runs. If None, the system
+		temporary folder is employed.
+	- buffer_size (integer); The maximum number of records kept in memory.
+	#OUTPUT (yield)
+	- record (dictionary); The JSON records, in the order of their positions.
+	"""
+
+	next_index = 0
+	buffer_dic = {}
+	run_heap = [] # The first record of each sorted run, as (position, run number, record)
+	run_iterator_list = []
+
+	with tempfile.TemporaryDirectory(dir=spill_folder_path) as temporary_folder_path:
+		for index, record in indexed_record_iterator:
+			buffer_dic[index] = record
+
+			# Yield the records whose turn has come, from the buffer or from the sorted runs
+			while True:
+				if next_index in buffer_dic:
+					yield buffer_dic.pop(next_index)
+				elif run_heap and run_heap[0][0] == next_index:
+					_, run_number, run_record = heapq.heappop(run_heap)
+					yield run_record
+					next_run_record = next(run_iterator_list[run_number], None)
+					if next_run_record is not None:
+						heapq.heappush(run_heap, (next_run_record[0], run_number, next_run_record[1]))
+				else:
+					break
+				next_index += 1
+
+			# Spill the buffer to a sorted run when it is full
+			if len(buffer_dic) >= buffer_size:
+				run_path = f"{temporary_folder_path}/run_{len(run_iterator_list)}.jsonl"
+				with open(run_path, "w") as run_file:
+					for buffer_index in sorted(buffer_dic):
+						run_file.write(f"{buffer_index}\t{json.dumps(buffer_dic[buffer_index])}\n")
+				buffer_dic = {}
+
+				run_iterator_list.append(read_sorted_run(run_path))
+				first_run_record = next(run_iterator_list[-1])
+				heapq.heappush(run_heap, (first_run_record[0], len(run_iterator_list) - 1, first_run_record[1]))
+
+def read_sorted_run(run_path):
+	"""
+	This function reads a sorted run written by yield_in_query_order().
+	#INPUT
+	- run_path (string); The path to the sorted run.
+	#OUTPUT (yield)
+	- index (integer); The position of the record in the query.
+	- record (dictionary); The JSON record.
+	"""
+
+	with open(run_path, "r") as run_file:
+		for line in run_file:
+			index, record_json = line.split("\t", 1)
+			yield int(index), json.loads(record_json)
+
+def api_get_json_record_list_per_gene(tax_id, gene_list):
+	"""
+	This function employs the UniProt API to download the JSON records of each gene name
+	in a list, yielding the records of a gene as soon as all of them are downloaded. The
+	JSON downloads of a gene start while the UniParc IDs (UPI) of the next genes are still
+	being listed. If a UPI is found for more than one gene, it is assigned to the last one,
+	as in the sequential download.
+	#INPUT
+	- tax_id (integer); The TaxID number employed to construct the multi-fasta database.
+	- gene_list (list); A list with all the gene names employed to filter the records.
+	#OUTPUT (yield)
+	- gene_name (string); The gene name whose records have been downloaded.
+	- gene_json_record_list (list); A list with all the JSON records of the gene.
+	"""
 
-	return json_records_list, records_total_count
+	upi_gene_dic = {}
+	download_upi_dic = {}
+	download_index_dic = {}
+
+	with FuturesSession() as session:
+
+		# List the UPI IDs of each gene and start downloading their JSON records straight away
+		for gene_name in gene_list:
+			with profile_step("uniparc_id_paging", gene=gene_name):
+				upi_id_batch_list = api_get_uniparc_record_id_list(tax_id, gene_name)
+
+			for upi_id in upi_id_batch_list:
+				upi_gene_dic[upi_id] = gene_name
+				download_json = session.get(f"https://rest.uniprot.org/uniparc/{upi_id}.json")
+				download_upi_dic[download_json] = upi_id
+				download_index_dic[download_json] = len(download_index_dic)
+
+		total_records = len(download_upi_dic)
+		print(f"   {total_records} records will be downloaded")
+		expect_records(total_records)
+
+		# Count the records pending to download per gene
+		gene_pending_dic = {}
+		for upi_id in download_upi_dic.values():
+			gene_pending_dic[upi_gene_dic[upi_id]] = gene_pending_dic.get(upi_gene_dic[upi_id], 0) + 1
+		gene_json_dic = {gene_name: [] for gene_name in gene_pending_dic}
+		counter = 0
+
+		# Process the results as they complete, yielding each gene once all its records are downloaded
+		for download_json in as_completed(download_upi_dic):
+			gene_name = upi_gene_dic[download_upi_dic[download_json]]
+			gene_json_dic[gene_name].append((download_index_dic.pop(download_json), download_json.result().json()))
+			gene_pending_dic[gene_name] -= 1
+			counter += 1
+			count_records()
+
+			# Print the download progress
+			if counter % 500 == 0:
+				print(f"{counter}/{total_records} proteins downloaded", end="\r")
+
+			# Sort the records of the gene in the order they were listed
+			if gene_pending_dic[gene_name] == 0:
+				yield gene_name, [json_record for _, json_record in sorted(gene_json_dic.pop(gene_name), key=lambda indexed_record: indexed_record[0])]
 
 def api_get_taxid_descendent_list(tax_id):
 	"""
@@ -228,12 +449,9 @@ def api_get_taxid_descendent_list(tax_id):
 	"""
 	url_tax_id_descendent = f"https://rest.uniprot.org/taxonomy/stream?format=list&query=%28%28ancestor%3A{str(tax_id)}%29%29"
 
-	# Download a string with all the TaxID separated by "\n"
-	tax_id_download = str(requests.get(url_tax_id_descendent).text)
-	tax_id_descendent_list = tax_id_download.split("\n") 
-
-	# Remove the last element of the list (empty value)
-	tax_id_descendent_list.pop()
+	# Download the list of TaxIDs (or reuse the cached list if unchanged)
+	with requests.Session() as session:
+		tax_id_descendent_list = fetch_listing(session, url_tax_id_descendent)
 
 	# Convert the list values from strings to integers
 	tax_id_descendent_list = [int(taxid) for taxid in tax_id_descendent_list]
@@ -241,29 +459,75 @@ def api_get_taxid_descendent_list(tax_id):
 
 	return tax_id_descendent_list
 
-def json_to_fasta(json_record_list, tax_id_descendent_list, upi_gene_dic=None):
+def create_metadata_database(metadata_database_path):
+	"""
+	This function creates an empty SQLite file to store the extra metadata of each record.
+	The metadata is stored in a single table keyed by the UPI identifier, with the list of 
+	repositories, species, and TaxIDs of each record as semicolon-separated values.
+	#INPUT
+	- metadata_database_path (string); The path to the SQLite file.
+	#OUTPUT
+	- metadata_connection (sqlite3.Connection); An open connection to the SQLite file.
+	"""
+
+	if os.path.exists(metadata_database_path):
+		os.remove(metadata_database_path)
+
+	metadata_connection = sqlite3.connect(metadata_database_path)
+	metadata_connection.execute("CREATE TABLE records_metadata (upi TEXT PRIMARY KEY, repositories TEXT, species TEXT, taxids TEXT) WITHOUT ROWID")
+	metadata_connection.commit()
+
+	return metadata_connection
+
+def export_json_metadata(metadata_connection, output_path):
+	"""
+	This function exports the extra metadata stored in the SQLite file as 3 JSON files,
+	the format used by previous versions of the software.
+	#INPUT
+	- metadata_connection (sqlite3.Connection); An open connection to the SQLite file.
+	- output_path (string); The absolute folder path to write the JSON files.
+	#WRITE OUTPUT
+	- .repos_metadata.json; A JSON file containing the metadata of the repositories used
+	- .species_metadata.json; A JSON file containing the metadata of the species used
+	- .taxid_metadata.json; A JSON file containing the metadata of the TaxID used
+	"""
+
+	extra_metadata_repos_dic = {}
+	extra_metadata_species_dic = {}
+	extra_metadata_taxid_dic = {}
+
+	for upi_tag, repositories, species, taxids in metadata_connection.execute("SELECT upi, repositories, species, taxids FROM records_metadata"):
+		extra_metadata_repos_dic[upi_tag] = repositories.split(";") if repositories else []
+		extra_metadata_species_dic[upi_tag] = species.split(";") if species else []
+		extra_metadata_taxid_dic[upi_tag] = [int(taxid) for taxid in taxids.split(";")] if taxids else []
+
+	with open(f"{output_path}/.repos_metadata.json", "w") as output_repos_metadata_file:
+		json.dump(extra_metadata_repos_dic, output_repos_metadata_file)
+
+	with open(f"{output_path}/.species_metadata.json", "w") as output_species_metadata_file:
+		json.dump(extra_metadata_species_dic, output_species_metadata_file)
+
+	with open(f"{output_path}/.taxid_metadata.json", "w") as output_taxid_metadata_file:
+		json.dump(extra_metadata_taxid_dic, output_taxid_metadata_file)
+
+def json_to_fasta(json_record_list, tax_id_descendent_list, metadata_connection, upi_gene_dic=None):
 	"""
 	This function parses a list of JSON records from UniParc into a list of
 	SeqRecord objects, which can be written to a multi-fasta file. It also collects
 	extra metadata about the repositories, species, and TaxID associated with each 
-	UniParc ID.
+	UniParc ID, and writes it incrementally in the SQLite metadata file.
 	#INPUT
 	- json_record_list (list); A list with all the JSON records of the UniParc IDs.
 	- tax_id_descendent_list (list); A list with all the descendent TaxID clades of the
 		input TaxID.
+	- metadata_connection (sqlite3.Connection); An open connection to the SQLite metadata file.
 	- upi_gene_dic (dictionary); A dictionary with the gene name for each UPI ID. If no gene
 		is specified, the variable is assigned as None.
 	#OUTPUT
 	- records_fasta_list (list); A list with all the SeqRecord objects created from the JSON records.
-	- extra_metadata_repos_dic (dictionary); A dictionary with the repositories associated with each UPI ID.
-	- extra_metadata_species_dic (dictionary); A dictionary with the species associated with each UPI ID.
-	- extra_metadata_taxid_dic (dictionary); A dictionary with the TaxID associated with each UPI ID.
 	"""
 
-	extra_metadata_repos_dic = {}
-	extra_metadata_species_dic = {}
-	extra_metadata_taxid_dic = {}
-
+	metadata_row_list = []
 	records_fasta_list = []
 	
 	# Iterate for each UniParc record in the JSON file
@@ -296,9 +560,13 @@ def json_to_fasta(json_record_list, tax_id_descendent_list, upi_gene_dic=None):
 				upi_species.append(repository_metadata["organism"]["scientificName"])
 				upi_taxid.append(repository_metadata["organism"]["taxonId"])
 		
-		extra_metadata_repos_dic[upi_tag] = upi_repos
-		extra_metadata_species_dic[upi_tag] = upi_species
-		extra_metadata_taxid_dic[upi_tag] = upi_taxid
+		metadata_row_list.append((upi_tag, ";".join(upi_repos), ";".join(upi_species), ";".join(str(taxid) for taxid in upi_taxid)))
+
+		# Write the metadata in batches of 500 records
+		if len(metadata_row_list) == 500:
+			metadata_connection.executemany("INSERT OR REPLACE INTO records_metadata VALUES (?, ?, ?, ?)", metadata_row_list)
+			metadata_connection.commit()
+			metadata_row_list = []
 
 		# Iterate for each repository metadata in the record to find the correct metadata
 		for repository_metadata in json_protein_record["uniParcCrossReferences"]:
@@ -344,6 +612,10 @@ def json_to_fasta(json_record_list, tax_id_descendent_list, upi_gene_dic=None):
 		protein_record_fasta = SeqRecord(Seq(sequence), id=header, description="")
 		records_fasta_list.append(protein_record_fasta)
 
-	return records_fasta_list, extra_metadata_repos_dic, extra_metadata_species_dic, extra_metadata_taxid_dic
+	metadata_connection.executemany("INSERT OR REPLACE INTO records_metadata VALUES (?, ?, ?, ?)", metadata_row_list)
+	metadata_connection.commit()
+
+	return records_fasta_list
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,235 @@
+# Global imports
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# Local imports
+from residue_masses import residue_mass_array, WATER_MASS, PROTON_MASS
+from metadata_proteoparc import parse_header_table
+from pipeline_profiler import profile_step
+from sequence_store import build_sequence_store, store_header_list, store_sequence_bytes
+
+# Script information - Written in Python 3.12.3 - October 2026
+__author__ = "Guillermo Carrillo Martin"
+__maintainer__ = "Guillermo Carrillo Martin"
+__email__ = "guillermo.carrillo@upf.edu"
+
+"""
+This script computes the theoretical masses of ZooMS (Zooarchaeology by Mass Spectrometry)
+marker peptides for each species in a multi-fasta database. The markers are defined in a CSV
+file, with a reference peptide per marker and gene:
+
+    Marker,Gene,Peptide,Oxidations
+    P1,COL1A2,GVVGLOGQR,1
+
+The "Oxidations" column (optional) indicates the number of oxidations (hydroxyprolines) of
+the main variant of the marker, 0 if not specified. Hydroxyprolines can be written as "O"
+in the reference peptide, they are compared as prolines.
+
+For each record of the marker gene (GN=), the homologous peptide is the window of the
+sequence with the same length as the reference peptide and the fewest mismatches (up to a
+maximum). The mass of each peptide is computed with NumPy residue-mass arrays, together
+with all its variants of oxidation (prolines and methionines, +15.9949 Da) and deamidation
+(asparagines and glutamines, +0.9840 Da). The results are written in two tables:
+
+1. marker_peptides.csv; A table with each species, marker, peptide and variant, its
+   neutral mass and [M+H]+ m/z, and the number of records supporting the peptide.
+
+2. species_marker_mz.csv; A species x marker table with the [M+H]+ m/z of the main variant
+   of the peptide found in most records, ready to match the peaks of a spectrum.
+"""
+
+OXIDATION_MASS = 15.9949146221 # Hydroxylation of prolines and oxidation of methionines
+DEAMIDATION_MASS = 0.9840155848 # Deamidation of asparagines and glutamines
+
+def main():
+
+    database_path, marker_path, output_folder_path, max_mismatches = parser()
+
+    sequence_store = build_sequence_store(database_path)
+    compute_zooms_markers(sequence_store, marker_path, output_folder_path, max_mismatches)
+
+def parser():
+    """
+    This function parses the required arguments from the terminal to the python script.
+
+    #OUTPUT
+    - database_path (string); The path to the multi-fasta database.
+    - marker_path (string); The path to the CSV file with the marker definitions.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    - max_mismatches (integer); The maximum number of mismatches between a reference
+      peptide and its homologous peptide.
+    """
+    parser = argparse.ArgumentParser(description="A script to compute the ZooMS marker peptide masses per species of a multi-fasta database")
+    parser.add_argument("database_path", type=str, help="The path to the multi-fasta database")
+    parser.add_argument("marker_path", type=str, help="The path to the CSV file with the marker definitions (Marker, Gene, Peptide and Oxidations columns)")
+    parser.add_argument("output_folder_path", type=str, help="The path to the output folder")
+    parser.add_argument("--max-mismatches", dest="max_mismatches", type=int, help="The maximum number of mismatches with the reference peptide (default: 3)", required=False, default=[3], nargs=1)
+
+    args = parser.parse_args()
+
+    database_path = os.path.realpath(args.database_path)
+    marker_path = os.path.realpath(args.marker_path)
+    output_folder_path = os.path.realpath(args.output_folder_path)
+    max_mismatches = args.max_mismatches[0]
+
+    return database_path, marker_path, output_folder_path, max_mismatches
+
+def read_marker_definitions(marker_path):
+    """
+    This function reads the marker definition file.
+
+    #INPUT
+    - marker_path (string); The path to the CSV file with the marker definitions.
+    #OUTPUT
+    - marker_df (pd.DataFrame); A dataframe with the 'Marker', 'Gene', 'Peptide' and
+      'Oxidations' of each marker. The gene names and peptides are written in capital letters.
+    """
+    marker_df = pd.read_csv(marker_path, dtype=str, keep_default_na=False, skipinitialspace=True)
+
+    missing_column_list = [column_name for column_name in ["Marker", "Gene", "Peptide"] if column_name not in marker_df.columns]
+    if missing_column_list:
+        print(f"ERROR: The marker file '{marker_path}' has no {', '.join(missing_column_list)} column")
+        exit(0)
+
+    if "Oxidations" not in marker_df.columns:
+        marker_df["Oxidations"] = "0"
+
+    marker_df["Gene"] = marker_df["Gene"].str.strip().str.upper()
+    marker_df["Peptide"] = marker_df["Peptide"].str.strip().str.upper()
+    marker_df["Oxidations"] = pd.to_numeric(marker_df["Oxidations"].replace("", "0")).astype(int)
+
+    return marker_df.loc[marker_df["Peptide"] != "", ["Marker", "Gene", "Peptide", "Oxidations"]].reset_index(drop=True)
+
+def find_marker_peptides(sequence_store, marker_df, max_mismatches=3):
+    """
+    This function finds the homologous peptide of each marker in each record of its gene:
+    the window of the record sequence with the same length as the reference peptide and
+    the fewest mismatches. The windows are compared with the reference peptide at the same
+    time, as a NumPy byte matrix.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records (see sequence_store.py).
+    - marker_df (pd.DataFrame); A dataframe with the marker definitions.
+    - max_mismatches (integer); The maximum number of mismatches with the reference peptide.
+    #OUTPUT
+    - marker_peptide_df (pd.DataFrame); A dataframe with the species, marker, homologous
+      peptide, number of mismatches and UPI of each record where a marker was found.
+    """
+    header_table_df, _ = parse_header_table(pd.Series(store_header_list(sequence_store), dtype=object))
+
+    marker_peptide_list = []
+    for marker in marker_df.itertuples(index=False):
+        reference_array = np.frombuffer(marker.Peptide.replace("O", "P").encode(), dtype=np.uint8)
+
+        for record_index in np.flatnonzero(header_table_df["Gene"].str.upper().to_numpy() == marker.Gene):
+            sequence = store_sequence_bytes(sequence_store, record_index).upper()
+            if len(sequence) < len(reference_array):
+                continue
+
+            # Count the mismatches of each window of the sequence with the reference peptide
+            window_matrix = np.lib.stride_tricks.sliding_window_view(np.frombuffer(sequence, dtype=np.uint8), len(reference_array))
+            mismatch_array = (window_matrix != reference_array).sum(axis=1)
+            best_window = int(mismatch_array.argmin())
+
+            if mismatch_array[best_window] <= max_mismatches:
+                marker_peptide_list.append({"Species": header_table_df.at[record_index, "Species"], "Marker": marker.Marker,
+                                            "Peptide": sequence[best_window:best_window + len(reference_array)].decode(),
+                                            "Mismatches": int(mismatch_array[best_window]), "Record": header_table_df.at[record_index, "Unic Identifier"]})
+
+    return pd.DataFrame(marker_peptide_list, columns=["Species", "Marker", "Peptide", "Mismatches", "Record"])
+
+def compute_variant_masses(peptide_array):
+    """
+    This function computes the neutral mass of each peptide and all its variants of
+    oxidation and deamidation, in vectorized form.
+
+    #INPUT
+    - peptide_array (np.ndarray); A fixed-width bytes array with the peptides.
+    #OUTPUT
+    - variant_df (pd.DataFrame); A dataframe with the peptide index, number of oxidations,
+      number of deamidations and neutral mass of each variant. The peptides with residues
+      without a defined mass (X, B, Z...) are discarded.
+    """
+    residue_matrix = peptide_array.view(np.uint8).reshape(len(peptide_array), peptide_array.dtype.itemsize)
+    base_mass_array = residue_mass_array()[residue_matrix].sum(axis=1) + WATER_MASS
+
+    # Count the residues that can be oxidized or deamidated in each peptide
+    oxidation_site_array = np.isin(residue_matrix, [ord("P"), ord("M")]).sum(axis=1)
+    deamidation_site_array = np.isin(residue_matrix, [ord("N"), ord("Q")]).sum(axis=1)
+
+    # Combine every number of oxidations and deamidations, keeping the possible ones
+    oxidation_grid, deamidation_grid = np.meshgrid(np.arange(oxidation_site_array.max(initial=0) + 1), np.arange(deamidation_site_array.max(initial=0) + 1), indexing="ij")
+    oxidation_grid, deamidation_grid = oxidation_grid.ravel(), deamidation_grid.ravel()
+    is_possible_matrix = (oxidation_grid[None, :] <= oxidation_site_array[:, None]) & (deamidation_grid[None, :] <= deamidation_site_array[:, None]) & \
+                         ~np.isnan(base_mass_array)[:, None]
+    peptide_index_array, variant_index_array = np.nonzero(is_possible_matrix)
+
+    variant_df = pd.DataFrame({"Peptide_index": peptide_index_array,
+                               "Oxidations": oxidation_grid[variant_index_array],
+                               "Deamidations": deamidation_grid[variant_index_array]})
+    variant_df["Mass"] = base_mass_array[peptide_index_array] + variant_df["Oxidations"] * OXIDATION_MASS + variant_df["Deamidations"] * DEAMIDATION_MASS
+
+    return variant_df
+
+def compute_zooms_markers(sequence_store, marker_path, output_folder_path, max_mismatches=3):
+    """
+    This function computes the theoretical masses of the ZooMS marker peptides of each
+    species, and writes them as a long table and a species x marker table.
+
+    #INPUT
+    - sequence_store (dictionary); A dictionary with the arrays of the records (see sequence_store.py).
+    - marker_path (string); The path to the CSV file with the marker definitions.
+    - output_folder_path (string); The path to a folder where the results will be stored.
+    - max_mismatches (integer); The maximum number of mismatches with the reference peptide.
+    #OUTPUT
+    - species_marker_df (pd.DataFrame); A dataframe with the [M+H]+ m/z of the main variant
+      of each marker (columns) per species (rows).
+    #WRITE OUTPUT
+    - marker_peptides.csv; A CSV file with the mass and m/z of each species, marker, peptide
+      and variant, and the number of records supporting the peptide.
+    - species_marker_mz.csv; A CSV file with the [M+H]+ m/z of the main variant of each
+      marker per species.
+    """
+    print("# Computing the ZooMS marker masses")
+
+    marker_df = read_marker_definitions(marker_path)
+
+    with profile_step("find_marker_peptides"):
+        marker_peptide_df = find_marker_peptides(sequence_store, marker_df, max_mismatches)
+
+    # Group the records with the same peptide per species and marker
+    peptide_df = marker_peptide_df.groupby(["Species", "Marker", "Peptide"], sort=False).agg(
+        Mismatches=("Mismatches", "first"), Records=("Record", "nunique"), UPI=("Record", lambda record_sr: ";".join(dict.fromkeys(record_sr)))).reset_index()
+
+    with profile_step("compute_marker_masses"):
+        max_length = int(peptide_df["Peptide"].str.len().max()) if len(peptide_df) else 1
+        variant_df = compute_variant_masses(np.array([peptide.encode() for peptide in peptide_df["Peptide"]], dtype=f"S{max_length}"))
+
+    marker_variant_df = peptide_df.iloc[variant_df["Peptide_index"]].reset_index(drop=True)
+    marker_variant_df.insert(3, "Oxidations", variant_df["Oxidations"].to_numpy())
+    marker_variant_df.insert(4, "Deamidations", variant_df["Deamidations"].to_numpy())
+    marker_variant_df.insert(5, "Mass", variant_df["Mass"].round(5).to_numpy())
+    marker_variant_df.insert(6, "MH+", (variant_df["Mass"] + PROTON_MASS).round(5).to_numpy())
+
+    # Select the main variant of the peptide supported by more records, per species and marker
+    main_oxidation_sr = marker_variant_df["Marker"].map(marker_df.drop_duplicates("Marker").set_index("Marker")["Oxidations"])
+    main_variant_df = marker_variant_df.loc[(marker_variant_df["Oxidations"] == main_oxidation_sr) & (marker_variant_df["Deamidations"] == 0)]
+    main_variant_df = main_variant_df.sort_values(["Records", "Mismatches"], ascending=[False, True], kind="stable").drop_duplicates(["Species", "Marker"])
+
+    species_marker_df = main_variant_df.pivot(index="Species", columns="Marker", values="MH+")
+    species_marker_df = species_marker_df.reindex(columns=[marker for marker in dict.fromkeys(marker_df["Marker"]) if marker in species_marker_df.columns]).sort_index()
+
+    if not os.path.exists(output_folder_path):
+        os.makedirs(output_folder_path)
+
+    marker_variant_df.sort_values(["Species", "Marker", "Peptide", "Oxidations", "Deamidations"], kind="stable").to_csv(f"{output_folder_path}/marker_peptides.csv", index=False)
+    species_marker_df.to_csv(f"{output_folder_path}/species_marker_mz.csv")
+
+    print(f"   {marker_peptide_df['Marker'].nunique()} of {marker_df['Marker'].nunique()} markers found in {len(species_marker_df)} species")
+
+    return species_marker_df
+
+if __name__ == "__main__":
+    main()